@@ -0,0 +1,81 @@
+"""
+Benchmark the feature overlap engines used in tracksingle (Step 2).
+
+Compares the original per-feature loop with the contingency table method
+for an increasing number of features on synthetic label image pairs,
+and checks that both methods produce identical links.
+
+Usage:
+    python benchmark_overlap_engine.py [ny] [nx]
+"""
+import sys
+import time
+import numpy as np
+from scipy.ndimage import label, binary_dilation
+from pyflextrkr.tracksingle_func import link_features_overlap
+
+def make_label_pair(nfeatures, ny, nx, seed=0):
+    """
+    Make a pair of synthetic labeled images with randomly placed features.
+
+    Args:
+        nfeatures: int
+            Approximate number of features.
+        ny: int
+            Number of pixels in y-direction.
+        nx: int
+            Number of pixels in x-direction.
+        seed: int, optional, default=0
+            Random seed.
+
+    Returns:
+        reference_number: np.ndarray(int)
+            Labeled feature number at reference time, shape (1, ny, nx).
+        nreference: int
+            Number of features at reference time.
+        new_number: np.ndarray(int)
+            Labeled feature number at new time, shape (1, ny, nx).
+        nnew: int
+            Number of features at new time.
+    """
+    rng = np.random.default_rng(seed)
+    seeds = np.zeros((ny, nx), dtype=bool)
+    seeds[rng.integers(0, ny, nfeatures), rng.integers(0, nx, nfeatures)] = True
+    mask = binary_dilation(seeds, iterations=3)
+    # Shift and grow/shrink the features for the new time
+    new_mask = np.roll(mask, (1, 2), axis=(0, 1))
+    new_mask = new_mask | (binary_dilation(new_mask) & (rng.random((ny, nx)) > 0.5))
+    reference_number, nreference = label(mask)
+    new_number, nnew = label(new_mask)
+    return reference_number[None, :, :], nreference, new_number[None, :, :], nnew
+
+
+def main():
+    ny = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    nx = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    nmaxlinks = 50
+    othresh = 0.5
+    fillval = -9999
+
+    print(f"Image size: {ny} x {nx}")
+    print(f"{'nfeatures':>10s} {'loop [s]':>10s} {'contingency [s]':>16s} {'speedup':>8s}")
+    for nfeatures in [10, 50, 100, 500, 1000, 2000]:
+        ref, nref, new, nnew = make_label_pair(nfeatures, ny, nx)
+        results = {}
+        timing = {}
+        for method in ["loop", "contingency"]:
+            t0 = time.perf_counter()
+            results[method] = link_features_overlap(
+                ref, new, nref + 1, nnew + 1, nmaxlinks, othresh, fillval,
+                overlap_method=method,
+            )
+            timing[method] = time.perf_counter() - t0
+        # Check the two methods give identical results
+        for out_loop, out_cont in zip(results["loop"], results["contingency"]):
+            np.testing.assert_array_equal(out_loop, out_cont)
+        print(f"{nref:10d} {timing['loop']:10.3f} {timing['contingency']:16.4f} "
+              f"{timing['loop'] / timing['contingency']:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
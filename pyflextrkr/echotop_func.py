@@ -44,6 +44,64 @@ def calc_cloud_boundary(height, idxcld, gap, min_thick):
 
     return cloud_base, cloud_top
 
+def echotop_heights(dbz3d, height, z_dimname, shape_2d, dbz_threshs, gap, min_thick):
+    """
+    Calculates first layer echo-top heights from bottom up for multiple reflectivity thresholds.
+
+    All columns are processed at once: an echo layer ends at an echo level
+    with no echo within gap levels above it, found from the cumulative number of echo levels along z.
+    ----------
+    dbz3d: np.DataArray(float)
+        3D reflectivity array (Xarray DataArray), assumes in [z, y, x] order.
+    height: np.array(float)
+        height array, either 1D or 3D in the same [z, y, x] order as dbz3d (e.g., WRF).
+    shape_2d: tuple
+        (Number of points on x-direction, Number of points on y-direction)
+    dbz_threshs: list
+        Reflectivity thresholds to calculate echo-top heights.
+    gap: int
+        If a gap larger than this exists, echoes are separated into different layers
+    min_thick: float
+        Minimum thickness of an echo layer.
+
+    Returns
+    ----------
+    echotops: list
+        Echo-top height 2D array (np.ndarray(float)) for each reflectivity threshold.
+    """
+
+    # Get numpy arrays for speed
+    dbz = dbz3d.squeeze().values
+    height = np.asarray(height)
+    nz = dbz.shape[0]
+    # Highest level within the gap above each level
+    zgap = np.minimum(np.arange(nz) + max(int(np.floor(gap)), 0), nz - 1)
+
+    echotops = []
+    for dbz_thresh in dbz_threshs:
+        # Create echo-top height array
+        echotop = np.full(shape_2d, np.nan, dtype=np.float32)
+
+        # Define binary echo mask using reflectivity threshold
+        echomask = dbz > dbz_thresh
+        # Cumulative number of echo levels from bottom up
+        necho = np.cumsum(echomask, axis=0, dtype=np.int16)
+        # An echo layer top has no echo within the gap above it
+        layertop = echomask & (necho[zgap] == necho)
+        # The first layer top (from bottom up) is the lowest layer echo-top height
+        itop = np.argmax(layertop, axis=0)
+        if height.ndim == 1:
+            top_height = height[itop]
+        else:
+            top_height = np.take_along_axis(height, itop[None, :, :], axis=0)[0]
+        # Only columns with echoes get an echo-top height
+        mask_echo = necho[-1] > 0
+        echotop[mask_echo] = top_height[mask_echo]
+        echotops.append(echotop)
+
+    return echotops
+
+
 def echotop_height(dbz3d, height, z_dimname, shape_2d, dbz_thresh, gap, min_thick):
     """
     Calculates first layer echo-top height from bottom up.
@@ -68,32 +126,7 @@ def echotop_height(dbz3d, height, z_dimname, shape_2d, dbz_thresh, gap, min_thic
     echotop: np.ndarray(float)
         Echo-top height 2D array.
     """
-
-    # Create echo-top height array
-    echotop = np.full(shape_2d, np.nan, dtype=np.float32)
-
-    # Define binary cloud mask using reflectivity threshold
-    cloudmask = dbz3d > dbz_thresh
-    # Get numpy array for speed
-    cmask = cloudmask.squeeze().values
-
-    # Find 2D locations with clouds anywhere in the column
-    # Then get y, x indices of those cloudy points
-    yidx, xidx = np.where(cloudmask.max(dim=z_dimname).squeeze().values == 1)
-    # Total number of points with clouds
-    npix_cloud = len(xidx)
-
-    # Loop over each point with clouds
-    for il in range(0, npix_cloud):
-        # Get the profile at location y, x
-        idxcld = np.array(np.where(np.squeeze(cmask[:, yidx[il], xidx[il]]) == 1)[0])
-        # Check if there is any clouds defined
-        if len(idxcld) > 0:
-            # Call calc_cloud_boundary to get cloud_base, cloud_top height
-            cb, ct = calc_cloud_boundary(height, idxcld, gap, min_thick)
-            # The first layer top (from bottom up) is the lowest layer echo-top height
-            echotop[yidx[il], xidx[il]] = ct[0]
-
+    echotop = echotop_heights(dbz3d, height, z_dimname, shape_2d, [dbz_thresh], gap, min_thick)[0]
     return echotop
 
 
@@ -121,31 +154,5 @@ def echotop_height_wrf(dbz3d, height, z_dimname, shape_2d, dbz_thresh, gap, min_
     echotop: np.ndarray(float)
         Echo-top height 2D array.
     """
-
-    # Create echo-top height array
-    echotop = np.full(shape_2d, np.nan, dtype=np.float32)
-
-    # Define binary cloud mask using reflectivity threshold
-    cloudmask = dbz3d > dbz_thresh
-    # Get numpy array for speed
-    cmask = cloudmask.squeeze().values
-
-    # Find 2D locations with clouds anywhere in the column
-    # Then get y, x indices of those cloudy points
-    yidx, xidx = np.where(cloudmask.max(dim=z_dimname).squeeze().values == 1)
-    # Total number of points with clouds
-    npix_cloud = len(xidx)
-
-    # Loop over each point with clouds
-    for il in range(0, npix_cloud):
-        # Get the profile at location y, x
-        idxcld = np.array(np.where(np.squeeze(cmask[:, yidx[il], xidx[il]]) == 1)[0])
-        iheight = height[:, yidx[il], xidx[il]]
-        # Check if there is any clouds defined
-        if len(idxcld) > 0:
-            # Call calc_cloud_boundary to get cloud_base, cloud_top height
-            cb, ct = calc_cloud_boundary(iheight, idxcld, gap, min_thick)
-            # The first layer top (from bottom up) is the lowest layer echo-top height
-            echotop[yidx[il], xidx[il]] = ct[0]
-
-    return echotop
\ No newline at end of file
+    echotop = echotop_heights(dbz3d, height, z_dimname, shape_2d, [dbz_thresh], gap, min_thick)[0]
+    return echotop
@@ -1,12 +1,23 @@
 import numpy as np
-import os, fnmatch, sys, glob
+import os, fnmatch, sys, glob, shutil
+import threading
+import hashlib
+import importlib.util
+from collections import OrderedDict
 import datetime, calendar, time
 from pytz import utc
 import yaml
 import xarray as xr
+import pandas as pd
 import logging
 from scipy.sparse import csr_matrix
 
+# Cache of static fields (e.g., landmask, terrain, grid geometry) in each process.
+# Each Dask worker process keeps its own cache, so a static field is loaded once per worker
+# and reused by all tasks on that worker. The least recently used entries are evicted.
+_static_cache = OrderedDict()
+_static_cache_lock = threading.Lock()
+
 def setup_logging():
     """
     Set the logging message level
@@ -464,4 +475,465 @@ def convert_trackstats_sparse2dense(
         unlimited_dims=tracks_dimname,
         encoding=encoding
     )
-    return True
\ No newline at end of file
+    return True
+
+
+def pfstats_to_dense(
+        pfvar,
+        ds_pf,
+        tracks_dimname,
+        times_dimname,
+        fillval=np.nan,
+):
+    """
+    Get a PF statistics variable as a dense (tracks, times, ...) array.
+
+    PF statistics are either dense (tracks, times, ...) or sparse (sparse_index, ...),
+    the sparse format has tracks/times indices variables (same as the sparse trackstats).
+
+    Args:
+        pfvar: Xarray DataArray
+            PF statistics variable (or a reduction of it over the PF dimension).
+        ds_pf: Xarray Dataset
+            PF statistics dataset containing the tracks/times indices.
+        tracks_dimname: string
+            Tracks dimension name.
+        times_dimname: string
+            Times dimension name.
+        fillval: float, default=np.nan
+            Value for (track, time) without PF statistics.
+
+    Returns:
+        values: numpy array
+            Dense array with dimensions (tracks, times, ...).
+    """
+    sparse_dimname = "sparse_index"
+    if pfvar.dims[0:1] != (sparse_dimname,):
+        return pfvar.data
+    tracks_idx = ds_pf[f"{tracks_dimname}_indices"].values
+    times_idx = ds_pf[f"{times_dimname}_indices"].values
+    shape = (ds_pf.sizes[tracks_dimname], ds_pf.sizes[times_dimname]) + pfvar.shape[1:]
+    values = np.full(shape, fillval, dtype=pfvar.dtype)
+    values[tracks_idx, times_idx] = pfvar.values
+    return values
+
+
+def subset_pfstats_tracks(
+        ds_pf,
+        trackid,
+        tracks_dimname,
+        times_dimname,
+):
+    """
+    Subset tracks from a dense or sparse PF statistics dataset and renumber the tracks.
+
+    Args:
+        ds_pf: Xarray Dataset
+            PF statistics dataset.
+        trackid: numpy array
+            Sorted track indices to keep.
+        tracks_dimname: string
+            Tracks dimension name.
+        times_dimname: string
+            Times dimension name.
+
+    Returns:
+        dsout: Xarray Dataset
+            PF statistics dataset with the subset tracks.
+    """
+    sparse_dimname = "sparse_index"
+    tracks_idx_varname = f"{tracks_dimname}_indices"
+    dsout = ds_pf.isel({tracks_dimname: trackid})
+    if sparse_dimname in ds_pf.dims:
+        # Keep the sparse entries of the subset tracks and renumber their track indices
+        tracks_idx = ds_pf[tracks_idx_varname].values
+        ientry = np.where(np.isin(tracks_idx, trackid))[0]
+        dsout = dsout.isel({sparse_dimname: ientry})
+        dsout[tracks_idx_varname] = (
+            [sparse_dimname],
+            np.searchsorted(trackid, tracks_idx[ientry]),
+            ds_pf[tracks_idx_varname].attrs,
+        )
+        dsout[sparse_dimname] = np.arange(0, len(ientry))
+    # Replace tracks index
+    dsout[tracks_dimname] = np.arange(0, len(trackid))
+    return dsout
+
+
+def convert_pfstats_sparse2dense(
+        ds_pf,
+        tracks_dimname,
+        times_dimname,
+        fillval_f=np.nan,
+):
+    """
+    Convert sparse PF statistics variables in a dataset to dense (tracks, times, ...) variables.
+
+    Args:
+        ds_pf: Xarray Dataset
+            PF statistics dataset.
+        tracks_dimname: string
+            Tracks dimension name.
+        times_dimname: string
+            Times dimension name.
+        fillval_f: float, default=np.nan
+            Missing value for (track, time) without PF statistics.
+
+    Returns:
+        dsout: Xarray Dataset
+            PF statistics dataset with dense variables.
+    """
+    sparse_dimname = "sparse_index"
+    tracks_idx_varname = f"{tracks_dimname}_indices"
+    times_idx_varname = f"{times_dimname}_indices"
+    if sparse_dimname not in ds_pf.dims:
+        return ds_pf
+    var_dict = {}
+    for key, value in ds_pf.data_vars.items():
+        if key in [tracks_idx_varname, times_idx_varname]:
+            continue
+        if value.dims[0:1] == (sparse_dimname,):
+            var_dict[key] = (
+                (tracks_dimname, times_dimname) + value.dims[1:],
+                pfstats_to_dense(value, ds_pf, tracks_dimname, times_dimname, fillval=fillval_f),
+                value.attrs,
+            )
+    dsout = ds_pf.drop_dims(sparse_dimname).assign(var_dict)
+    return dsout
+
+
+def write_stats_parquet(
+        dsout,
+        statistics_outfile,
+        tracks_dimname,
+        times_dimname,
+        config,
+):
+    """
+    Write track statistics to columnar Parquet tables.
+
+    Two tables are written next to the netCDF file:
+    - {statistics_outfile}_tracks.parquet: one row per track, with the variables of the tracks dimension.
+    - {statistics_outfile}_times.parquet: one row per (track, time), partitioned by time.
+    Variables with extra dimensions (e.g., PFs, mergers) are split into one column per element.
+    Both sparse (sparse_index dimension) and dense (tracks, times) statistics are supported,
+    dense variables are taken at the sparse (track, time) entries if both are present.
+
+    Args:
+        dsout: Xarray Dataset
+            Track statistics dataset.
+        statistics_outfile: string
+            Track statistics netCDF file name.
+        tracks_dimname: string
+            Tracks dimension name.
+        times_dimname: string
+            Times dimension name.
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        parquet_outpath: string
+            Parquet (track, time) table path. None if pyarrow is not available.
+    """
+    logger = logging.getLogger(__name__)
+    # Partition format (strftime) of the time table
+    partition_format = config.get("stats_parquet_partition", "%Y%m")
+    row_group_size = config.get("stats_parquet_row_group_size", 1000000)
+    sparse_dimname = "sparse_index"
+    basetime_varname = "base_time"
+    tracks_idx_varname = f"{tracks_dimname}_indices"
+    times_idx_varname = f"{times_dimname}_indices"
+
+    if importlib.util.find_spec("pyarrow") is None:
+        logger.warning("pyarrow is not installed, Parquet output is skipped.")
+        return None
+
+    outfile_base = os.path.splitext(statistics_outfile)[0]
+    parquet_tracksfile = f"{outfile_base}_tracks.parquet"
+    parquet_outpath = f"{outfile_base}_times.parquet"
+    ntracks = dsout.sizes[tracks_dimname]
+
+    # Per-track table
+    tracks_table = {tracks_dimname: np.arange(0, ntracks)}
+    for key, value in dsout.data_vars.items():
+        if value.dims == (tracks_dimname,):
+            tracks_table[key] = value.values
+
+    # (track, time) table
+    times_table = {}
+    if sparse_dimname in dsout.dims:
+        itrack = dsout[tracks_idx_varname].values
+        itime = dsout[times_idx_varname].values
+    else:
+        # Keep the (track, time) with valid base time
+        basetime = dsout[basetime_varname].values
+        if np.issubdtype(basetime.dtype, np.datetime64):
+            itrack, itime = np.where(~np.isnat(basetime))
+        else:
+            itrack, itime = np.where(np.isfinite(basetime) & (basetime > 0))
+    times_table[tracks_dimname] = itrack
+    times_table[times_dimname] = itime
+    for key, value in dsout.data_vars.items():
+        if key in [tracks_idx_varname, times_idx_varname]:
+            continue
+        if value.dims[0:1] == (sparse_dimname,):
+            values = value.values
+        elif value.dims[0:2] == (tracks_dimname, times_dimname):
+            values = value.values[itrack, itime]
+        else:
+            continue
+        if values.ndim == 1:
+            times_table[key] = values
+        else:
+            # One column per element of the extra dimension
+            values = values.reshape(len(itrack), -1)
+            for ii in range(values.shape[1]):
+                times_table[f"{key}_{ii}"] = values[:, ii]
+
+    # Time partition
+    basetime = times_table[basetime_varname]
+    if not np.issubdtype(basetime.dtype, np.datetime64):
+        basetime = pd.to_datetime(basetime, unit="s")
+    df_times = pd.DataFrame(times_table)
+    df_times["time_partition"] = pd.DatetimeIndex(basetime).strftime(partition_format)
+    df_times = df_times.sort_values(by=[basetime_varname, tracks_dimname], kind="stable")
+
+    # Delete output if it already exists
+    if os.path.isdir(parquet_outpath):
+        shutil.rmtree(parquet_outpath)
+    if os.path.isfile(parquet_tracksfile):
+        os.remove(parquet_tracksfile)
+
+    # Write Parquet tables
+    pd.DataFrame(tracks_table).to_parquet(parquet_tracksfile, engine="pyarrow", index=False)
+    df_times.to_parquet(
+        parquet_outpath,
+        engine="pyarrow",
+        index=False,
+        partition_cols=["time_partition"],
+        row_group_size=row_group_size,
+    )
+    logger.info(f"{parquet_tracksfile}")
+    logger.info(f"{parquet_outpath}")
+    return parquet_outpath
+
+
+def get_static_cache(key, loader, max_entries=8):
+    """
+    Get a value from the per-process static field cache, load it if not cached.
+
+    Args:
+        key: tuple
+            Cache key.
+        loader: function
+            Function without arguments that returns the value to cache.
+        max_entries: int, default=8
+            Maximum number of cached entries, least recently used entries are evicted.
+
+    Returns:
+        value: object
+            Cached value.
+    """
+    with _static_cache_lock:
+        if key in _static_cache:
+            _static_cache.move_to_end(key)
+            return _static_cache[key]
+    value = loader()
+    with _static_cache_lock:
+        _static_cache[key] = value
+        _static_cache.move_to_end(key)
+        while len(_static_cache) > max(max_entries, 1):
+            _static_cache.popitem(last=False)
+    return value
+
+
+def load_static_field(filename, varname, max_entries=8, **open_kwargs):
+    """
+    Load a variable from a static file (e.g., landmask, terrain), cached per process.
+
+    The cache key includes the file path, modification time, variable name and open options.
+    The returned data is read-only since it is shared by all tasks in the process.
+
+    Args:
+        filename: string
+            Static file name.
+        varname: string
+            Variable name.
+        max_entries: int, default=8
+            Maximum number of cached entries.
+        **open_kwargs:
+            Keyword arguments passed to xr.open_dataset.
+
+    Returns:
+        field: Xarray DataArray
+            Loaded variable.
+    """
+    key = (
+        "field",
+        os.path.abspath(filename),
+        os.path.getmtime(filename),
+        varname,
+        tuple(sorted(open_kwargs.items())),
+    )
+
+    def loader():
+        with xr.open_dataset(filename, **open_kwargs) as ds:
+            field = ds[varname].load()
+        field.data.flags.writeable = False
+        return field
+
+    return get_static_cache(key, loader, max_entries=max_entries)
+
+
+def get_geolimits_window(lat, lon, geolimits, max_entries=8):
+    """
+    Get 2D lat/lon and the subset window within geolimits, cached per process by grid.
+
+    Args:
+        lat: numpy array
+            Latitude, 1D or 2D.
+        lon: numpy array
+            Longitude, 1D or 2D.
+        geolimits: list
+            [lat_min, lon_min, lat_max, lon_max].
+        max_entries: int, default=8
+            Maximum number of cached entries.
+
+    Returns:
+        in_lat: numpy array
+            2D latitude.
+        in_lon: numpy array
+            2D longitude.
+        window: tuple
+            (ymin, ymax, xmin, xmax) of the subset, None if no grid point is within geolimits.
+    """
+    lat = np.ascontiguousarray(lat)
+    lon = np.ascontiguousarray(lon)
+    key = (
+        "geolimits",
+        lat.shape,
+        lon.shape,
+        hashlib.sha1(lat.tobytes()).hexdigest(),
+        hashlib.sha1(lon.tobytes()).hexdigest(),
+        tuple(geolimits),
+    )
+
+    def loader():
+        if (lat.ndim == 1) | (lon.ndim == 1):
+            # Mesh 1D coordinate into 2D
+            in_lon, in_lat = np.meshgrid(lon, lat)
+        else:
+            in_lon = lon
+            in_lat = lat
+        # Isolate data within lat/lon range set by limit
+        indicesy, indicesx = np.where(
+            (in_lat >= geolimits[0])
+            & (in_lat <= geolimits[2])
+            & (in_lon >= geolimits[1])
+            & (in_lon <= geolimits[3])
+        )
+        if (len(indicesx) > 0) and (len(indicesy) > 0):
+            window = (np.nanmin(indicesy), np.nanmax(indicesy) + 1,
+                      np.nanmin(indicesx), np.nanmax(indicesx) + 1)
+        else:
+            window = None
+        in_lat.flags.writeable = False
+        in_lon.flags.writeable = False
+        return in_lat, in_lon, window
+
+    return get_static_cache(key, loader, max_entries=max_entries)
+
+
+def link_mergesplit_entries(
+        link_tracknumber,
+        link_short,
+        trackidx_main,
+        entry_track,
+        entry_basetime,
+        nmaxmerge,
+        link_type="merge",
+):
+    """
+    Join short merging/splitting tracks to main tracks using the sparse (track, time) entries.
+
+    Each track is joined to the main track it ends merging into/starts splitting from by track number,
+    then each of its entries is joined to the main track entry at the same base time.
+
+    Args:
+        link_tracknumber: numpy array
+            Track number each track ends merging into or starts splitting from [tracks].
+        link_short: numpy array
+            Boolean flag of tracks shorter than the merge/split duration threshold [tracks].
+        trackidx_main: numpy array
+            Sorted main track indices.
+        entry_track: numpy array
+            Track index of each sparse entry, ordered by track then time.
+        entry_basetime: numpy array
+            Base time of each sparse entry.
+        nmaxmerge: int
+            Maximum number of merge/split clouds saved at each main track time.
+        link_type: string, default='merge'
+            'merge' or 'split', used in warning messages.
+
+    Returns:
+        main_entry: numpy array
+            Sparse entry index of the main track at the time of each merge/split cloud.
+        link_rank: numpy array
+            Position of each merge/split cloud among those at the same main track time.
+        link_entry: numpy array
+            Sparse entry index of each merge/split cloud.
+    """
+    logger = logging.getLogger(__name__)
+    ntracks = len(link_tracknumber)
+    nmain = len(trackidx_main)
+    maintracknumbers = trackidx_main + 1
+    empty = np.array([], dtype=int)
+
+    # Main track index each track is linked to
+    imain_link = np.minimum(np.searchsorted(trackidx_main, link_tracknumber - 1), max(nmain - 1, 0))
+    # Isolate merge/split tracks that have short duration
+    islinked = (nmain > 0) & (trackidx_main[imain_link] == (link_tracknumber - 1)) & link_short
+    # Make sure the merge/split tracks are not main track
+    islinked &= np.isin(np.arange(ntracks), maintracknumbers, invert=True)
+
+    ismain_track = np.zeros(ntracks, dtype=bool)
+    ismain_track[trackidx_main] = True
+    link_entry = np.nonzero(islinked[entry_track])[0]
+    main_entry = np.nonzero(ismain_track[entry_track])[0]
+    if len(link_entry) == 0:
+        return empty, empty, empty
+
+    # Join the merge/split entries with the main track entries on (main track, base time)
+    _, bt_code = np.unique(
+        np.concatenate((entry_basetime[link_entry], entry_basetime[main_entry])),
+        return_inverse=True,
+    )
+    ncodes = np.int64(bt_code.max() + 1)
+    link_key = imain_link[entry_track[link_entry]] * ncodes + bt_code[:len(link_entry)]
+    main_key = np.searchsorted(trackidx_main, entry_track[main_entry]) * ncodes + bt_code[len(link_entry):]
+    main_order = np.argsort(main_key, kind="stable")
+    imatch = np.minimum(np.searchsorted(main_key, link_key, sorter=main_order), len(main_key) - 1)
+    imatch = main_order[imatch]
+    matched = main_key[imatch] == link_key
+    link_entry = link_entry[matched]
+    main_entry = main_entry[imatch[matched]]
+
+    # Order the merge/split clouds at each main track time by track then time (stable sort)
+    order = np.argsort(main_entry, kind="stable")
+    link_entry = link_entry[order]
+    main_entry = main_entry[order]
+    nentries = len(link_entry)
+    slot_start = np.ones(nentries, dtype=bool)
+    slot_start[1:] = main_entry[1:] != main_entry[:-1]
+    istart = np.nonzero(slot_start)[0]
+    nlinks = np.diff(np.append(istart, nentries))
+    link_rank = np.arange(nentries) - np.repeat(istart, nlinks)
+
+    # Save up to nmaxmerge clouds at each main track time
+    for islot in np.nonzero(nlinks > nmaxmerge)[0]:
+        logger.warning(f'WARNING: number of {link_type} clouds ({nlinks[islot]}) > nmaxmerge ({nmaxmerge}), ' + \
+            f'only partial {link_type} clouds are saved.')
+        logger.warning(f'Main track index: {np.searchsorted(trackidx_main, entry_track[main_entry[istart[islot]]])}')
+        logger.warning('Increase nmaxmerge to avoid this WARNING.')
+    keep = link_rank < nmaxmerge
+    return main_entry[keep], link_rank[keep], link_entry[keep]
@@ -1,8 +1,92 @@
 import numpy as np
-from collections import deque
 from skimage.segmentation import watershed
 from skimage.feature import peak_local_max
 
+def get_renumber_lookup(
+    labelcell_number2d,
+    min_size,
+    grid_area=None,
+):
+    """
+    Get a lookup table that renumbers labeled cells by size, removing cells smaller than min_size.
+
+    Cells are counted with a single bincount over all pixels. Cells are ordered from largest
+    to smallest by number of pixels, with ties ordered the same as the reversed np.argsort.
+
+    Args:
+        labelcell_number2d: np.ndarray()
+            Labeled cell number array in 2D.
+        min_size: float
+            Minimum size to count as a cell.
+            If grid_area is None, this should be the minimum number of pixels.
+            If grid_area is supplied, this should be the minimum area.
+        grid_area: np.ndarray(), optional, default=None
+            Area of each grid. Dimensions must match labelcell_number2d.
+
+    Returns:
+        lut: np.ndarray(int)
+            New cell number for each input label number (0: background or removed cell).
+        sortedcell_npix: np.ndarray(int)
+            Number of pixels for each sorted cell in 1D.
+    """
+    # Get number of labeled cells
+    nlabelcells = int(np.nanmax(labelcell_number2d)) if np.size(labelcell_number2d) > 0 else 0
+    if nlabelcells <= 0:
+        # Return an empty array
+        return np.zeros(1, dtype=int), np.zeros(0)
+
+    # Count number of pixels for each labeled cell
+    mask = labelcell_number2d > 0
+    labels = labelcell_number2d[mask].astype(np.intp)
+    labelcell_npix = np.bincount(labels, minlength=nlabelcells + 1)[1:]
+    # Check if cell satisfies size threshold
+    if grid_area is None:
+        labelcell_size = labelcell_npix
+    else:
+        # If grid_area is supplied, sum grid area for each cell
+        labelcell_size = np.bincount(labels, weights=grid_area[mask], minlength=nlabelcells + 1)[1:]
+    labelcell_npix = np.where(labelcell_size > min_size, labelcell_npix, -999)
+
+    # Check if any of the cells passes the size threshold test
+    lut = np.zeros(nlabelcells + 1, dtype=int)
+    ivalidcells = np.where(labelcell_npix > 0)[0]
+    if len(ivalidcells) == 0:
+        # Return an empty array
+        return lut, np.zeros(0)
+
+    # Isolate cells that satisfy size threshold
+    # Add one since label numbers start at 1 and indices, which validcells reports starts at 0
+    labelcell_number1d = ivalidcells + 1
+    labelcell_npix = labelcell_npix[ivalidcells]
+
+    # Sort cells from largest to smallest and get the sorted index
+    order = np.argsort(labelcell_npix)[::-1]
+    sortedcell_npix = labelcell_npix[order]
+    # New cell numbers start from 1 for the largest cell
+    lut[labelcell_number1d[order]] = np.arange(1, len(order) + 1)
+    return lut, sortedcell_npix
+
+
+def apply_renumber_lookup(lut, labelcell_number2d):
+    """
+    Renumber labeled cells using a lookup table from get_renumber_lookup.
+
+    Args:
+        lut: np.ndarray(int)
+            New cell number for each label number.
+        labelcell_number2d: np.ndarray()
+            Labeled cell number array in 2D.
+
+    Returns:
+        sortedlabelcell_number2d: np.ndarray(int)
+            Renumbered cell number array in 2D, label numbers outside the lookup table are set to 0.
+    """
+    sortedlabelcell_number2d = np.zeros(np.shape(labelcell_number2d), dtype=int)
+    mask = (labelcell_number2d > 0) & (labelcell_number2d < len(lut))
+    sortedlabelcell_number2d[mask] = lut[labelcell_number2d[mask].astype(np.intp)]
+    return sortedlabelcell_number2d
+
+
 def sort_renumber(
     labelcell_number2d,
     min_size,
@@ -27,84 +111,8 @@ def sort_renumber(
         sortedcell_npix: np.ndarray(int)
             Number of pixels for each labeled cell in 1D.
     """
-
-    # Create output arrays
-    sortedlabelcell_number2d = np.zeros(np.shape(labelcell_number2d), dtype=int)
-
-    # Get number of labeled cells
-    nlabelcells = np.nanmax(labelcell_number2d)
-
-    # Check if there is any cells identified
-    if nlabelcells > 0:
-
-        labelcell_npix = np.full(nlabelcells, -999, dtype=int)
-        # Loop over each labeled cell
-        for ilabelcell in range(1, nlabelcells + 1):
-            # Count number of pixels for the cell
-            ilabelcell_npix = np.count_nonzero(labelcell_number2d == ilabelcell)
-            # Check if grid_area is supplied
-            if grid_area is None:
-                # If cell npix > min size threshold
-                if ilabelcell_npix > min_size:
-                    labelcell_npix[ilabelcell - 1] = ilabelcell_npix
-            else:
-                # If grid_area is supplied, sum grid area for the cell
-                ilabelcell_area = np.sum(grid_area[labelcell_number2d == ilabelcell])
-                # If cell area > min size threshold
-                if ilabelcell_area > min_size:
-                    labelcell_npix[ilabelcell - 1] = ilabelcell_npix
-
-
-        # # This faster approach does not work
-        # # Because when labelcell_number2d is not sequentially numbered (e.g., when some cells are removed)
-        # # This approach does not get the same sequence with the above one
-        # # Count number of pixels for each unique cells
-        # cellnum, labelcell_npix = np.unique(labelcell_number2d, return_counts=True)
-        # # Remove background and cells below size threshold
-        # labelcell_npix = labelcell_npix[(cellnum > 0)]
-        # labelcell_npix[(labelcell_npix <= min_size)] = -999
-
-        # Check if any of the cells passes the size threshold test
-        ivalidcells = np.where(labelcell_npix > 0)[0]
-        # ivalidcells = np.array(np.where(labelcell_npix > 0))[0, :]
-        ncells = len(ivalidcells)
-
-        if ncells > 0:
-            # Isolate cells that satisfy size threshold
-            # Add one since label numbers start at 1 and indices, which validcells reports starts at 0
-            labelcell_number1d = np.copy(ivalidcells) + 1
-            labelcell_npix = labelcell_npix[ivalidcells]
-
-            # Sort cells from largest to smallest and get the sorted index
-            order = np.argsort(labelcell_npix)[::-1]
-            # order = order[::-1]  # Reverses the order
-
-            # Sort the cells by size
-            sortedcell_npix = np.copy(labelcell_npix[order])
-            sortedcell_number1d = np.copy(labelcell_number1d[order])
-
-            # Loop over the 2D cell number to re-number them by size
-            cellstep = 0
-            for icell in range(0, ncells):
-                # Find 2D indices that match the cell number
-                sortedcell_indices = np.where(
-                    labelcell_number2d == sortedcell_number1d[icell]
-                )
-                # Get one of the dimensions from the 2D indices to count the size
-                nsortedcellindices = len(sortedcell_indices[1])
-                # Check if the size matches the sorted cell size
-                if nsortedcellindices == sortedcell_npix[icell]:
-                    # Renumber the cell in 2D
-                    cellstep += 1
-                    sortedlabelcell_number2d[sortedcell_indices] = np.copy(cellstep)
-
-        else:
-            # Return an empty array
-            sortedcell_npix = np.zeros(0)
-    else:
-        # Return an empty array
-        sortedcell_npix = np.zeros(0)
-
+    lut, sortedcell_npix = get_renumber_lookup(labelcell_number2d, min_size, grid_area=grid_area)
+    sortedlabelcell_number2d = apply_renumber_lookup(lut, labelcell_number2d)
     return (
         sortedlabelcell_number2d,
         sortedcell_npix,
@@ -136,80 +144,10 @@ def sort_renumber2vars(
         sortedcell_npix: np.ndarray(int)
             Number of pixels for each labeled cell in 1D.
     """
-
-    # Create output arrays
-    sortedlabelcell_number2d = np.zeros(np.shape(labelcell_number2d), dtype=int)
-    sortedlabelcell2_number2d = np.zeros(np.shape(labelcell_number2d), dtype=int)
-
-    # Get number of labeled cells
-    nlabelcells = np.nanmax(labelcell_number2d)
-
-    # Check if there is any cells identified
-    if nlabelcells > 0:
-
-        labelcell_npix = np.full(nlabelcells, -999, dtype=int)
-        # Loop over each labeled cell
-        for ilabelcell in range(1, nlabelcells + 1):
-            # Count number of pixels for the cell
-            ilabelcell_npix = np.count_nonzero(labelcell_number2d == ilabelcell)
-            # Check if cell satisfies size threshold
-            if ilabelcell_npix > min_cellpix:
-                labelcell_npix[ilabelcell - 1] = ilabelcell_npix
-
-        # # This faster approach does not work
-        # # Because when labelcell_number2d is not sequentially numbered (e.g., when some cells are removed)
-        # # This approach does not get the same sequence with the above one
-        # # Count number of pixels for each unique cells
-        # cellnum, labelcell_npix2 = np.unique(labelcell_number2d, return_counts=True)
-        # # Remove background and cells below size threshold
-        # labelcell_npix2 = labelcell_npix2[(cellnum > 0)]
-        # labelcell_npix2[(labelcell_npix2 <= min_cellpix)] = -999
-
-        # Check if any of the cells passes the size threshold test
-        ivalidcells = np.array(np.where(labelcell_npix > 0))[0, :]
-        ncells = len(ivalidcells)
-
-        if ncells > 0:
-            # Isolate cells that satisfy size threshold
-            # Add one since label numbers start at 1 and indices, which validcells reports starts at 0
-            labelcell_number1d = np.copy(ivalidcells) + 1
-            labelcell_npix = labelcell_npix[ivalidcells]
-
-            # Sort cells from largest to smallest and get the sorted index
-            order = np.argsort(labelcell_npix)
-            order = order[::-1]  # Reverses the order
-
-            # Sort the cells by size
-            sortedcell_npix = np.copy(labelcell_npix[order])
-            sortedcell_number1d = np.copy(labelcell_number1d[order])
-
-            # Loop over the 2D cell number to re-number them by size
-            cellstep = 0
-            for icell in range(0, ncells):
-                # Find 2D indices that match the cell number
-                # Use the same sorted index to label labelcell2_number2d
-                sortedcell_indices = np.where(
-                    labelcell_number2d == sortedcell_number1d[icell]
-                )
-                sortedcell2_indices = np.where(
-                    labelcell2_number2d == sortedcell_number1d[icell]
-                )
-                # Get one of the dimensions from the 2D indices to count the size
-                nsortedcellindices = len(sortedcell_indices[1])
-                # Check if the size matches the sorted cell size
-                if nsortedcellindices == sortedcell_npix[icell]:
-                    # Renumber the cell in 2D
-                    cellstep += 1
-                    sortedlabelcell_number2d[sortedcell_indices] = np.copy(cellstep)
-                    sortedlabelcell2_number2d[sortedcell2_indices] = np.copy(cellstep)
-
-        else:
-            # Return an empty array
-            sortedcell_npix = np.zeros(0)
-    else:
-        # Return an empty array
-        sortedcell_npix = np.zeros(0)
-
+    # Use the same size sorting from labelcell_number2d to renumber both variables
+    lut, sortedcell_npix = get_renumber_lookup(labelcell_number2d, min_cellpix)
+    sortedlabelcell_number2d = apply_renumber_lookup(lut, labelcell_number2d)
+    sortedlabelcell2_number2d = apply_renumber_lookup(lut, labelcell2_number2d)
     return (
         sortedlabelcell_number2d,
         sortedlabelcell2_number2d,
@@ -381,43 +319,70 @@ def olr_to_tb(OLR):
     tb = (-a + np.sqrt(a**2 + 4*b*tf))/(2*b)
     return tb
 
-def get_neighborhood(point, grid):
+def grow_labels_in_mask(label_number2d, growmask, nlabels=None):
     """
-    Given a grid of labeled points with 0=unlabeled, -1 to be processed, other # to be proccesed.
+    Grow all labeled regions together within a mask, one pixel (cross shape) per iteration.
+
+    This is a geodesic multi-label dilation. Each iteration adds the unlabeled pixels within growmask
+    that are 4-connected to the pixels added in the previous iteration. A pixel next to several labels
+    is assigned to the smallest label number, the same as dilating each label in turn starting from 1.
+    Growth stops when no pixel is added.
 
     Args:
-        point: np.array
-            Array containing seed points for growing
-        grid: np.array
-            Array containing labels.
-    
+        label_number2d: np.ndarray(int)
+            Labeled regions (> 0) in 2D, unlabeled = 0.
+        growmask: np.ndarray(bool)
+            Pixels that the labeled regions can grow into.
+        nlabels: int, optional, default=None
+            Only labels 1 to nlabels grow, other labels are kept as they are.
+            If None, all labels grow.
+
     Returns:
-        next_points: np.array
-            Neighboring points.
+        grown_number2d: np.ndarray(int)
+            Labeled regions after growth.
     """
-    shape = grid.shape
-    point_grid = [
-        [x + point[0], y + point[1]] for x in range(-1, 2) for y in range(-1, 2)
-    ]
-    next_points = []
-
-    for idx, i_point in enumerate(point_grid):
-        if i_point[0] < 0 or i_point[0] >= shape[0]:
-            continue
-        if i_point[1] < 0 or i_point[1] >= shape[1]:
-            continue
-        if i_point[0] == point[0] and i_point[1] == point[1]:
-            continue
-        else:  # We're good
-            if grid[i_point[0], i_point[1]] == 0:
-                next_points.append([i_point[0], i_point[1]])
-    return next_points  # Would probably be faster to pass in deque and directly add rather than a sublist.
+    ny, nx = np.shape(label_number2d)
+    grown_number1d = np.copy(label_number2d).ravel()
+    growable = np.ravel(growmask) & (grown_number1d == 0)
+    if nlabels is None:
+        front = np.nonzero(grown_number1d > 0)[0]
+    else:
+        front = np.nonzero((grown_number1d > 0) & (grown_number1d <= nlabels))[0]
+
+    while len(front) > 0:
+        # 4-connected neighbors (left, right, up, down) of the pixels added in the last iteration
+        front_x = front % nx
+        neighbor = np.concatenate((front - 1, front + 1, front - nx, front + nx))
+        neighbor_label = np.tile(grown_number1d[front], 4)
+        valid = np.concatenate((front_x > 0, front_x < nx - 1, front >= nx, front < (ny - 1) * nx))
+        neighbor = neighbor[valid]
+        neighbor_label = neighbor_label[valid]
+        # Only grow into unlabeled pixels within the mask
+        valid = growable[neighbor]
+        neighbor = neighbor[valid]
+        neighbor_label = neighbor_label[valid]
+        # Assign each pixel to the smallest adjacent label
+        order = np.lexsort((neighbor_label, neighbor))
+        neighbor = neighbor[order]
+        neighbor_label = neighbor_label[order]
+        first = np.ones(len(neighbor), dtype=bool)
+        first[1:] = neighbor[1:] != neighbor[:-1]
+        front = neighbor[first]
+        grown_number1d[front] = neighbor_label[first]
+        growable[front] = False
+
+    return grown_number1d.reshape(ny, nx)
 
 
 def grow_cells(grid):
     """
     Fast algorithm to grow and label areas based on nearest distance to the seeded regions.
 
+    The seeded regions grow one 8-connected level at a time, processing all pixels in a level as arrays.
+    Each grown pixel gets the most common label of its labeled neighbors (the smallest label for ties).
+    Neighbors in the same level count if they are earlier in the first-in-first-out order,
+    so the result is the same as growing one pixel at a time from a queue.
+
     Args:
         grid: np.array
             Array containing labeled seeded regions (values > 0).
@@ -427,35 +392,102 @@ def grow_cells(grid):
         grid: np.array
             Array containing labels after growth.
     """
+    ny, nx = grid.shape
+    # Pad the grid with excluded pixels so neighbors do not need boundary checks
+    nxp = nx + 2
+    label1d = np.pad(grid, 1, mode="constant", constant_values=-1).ravel()
+    # 8-connected neighbor offsets, ordered by row then column in the 3x3 window
+    offsets = np.array([-nxp - 1, -nxp, -nxp + 1, -1, 1, nxp - 1, nxp, nxp + 1])
+
+    # Seed points in row-major order
+    # Note: the number of seeds is the count of nonzero seed row indices, same as the previous queue version
     seed_points = np.where(grid > 0)
-    point_que = deque(
-        [
-            [seed_points[0][i], seed_points[1][i]]
-            for i in range(np.count_nonzero(seed_points[0]))
-        ]
-    )
-    while len(point_que) > 0:
-        current_pt = point_que.popleft()
-        neighbor_values = grid[
-            max(current_pt[0] - 1, 0) : current_pt[0] + 2,
-            max(0, current_pt[1] - 1) : current_pt[1] + 2,
-        ]
-        neighbors = get_neighborhood(current_pt, grid)
-
-        for point in neighbors:
-            grid[point[0], point[1]] = -1
-            point_que.append(point)
-        if (
-            grid[current_pt[0], current_pt[1]] < 1
-        ):  # Lets not reclassify currently classified points grabbed in beginning selection
-            counts_v, counts_i = np.unique(
-                neighbor_values[neighbor_values > 0], return_counts=True
-            )
-            mode_val = counts_v[np.argmax(counts_i)]
-            grid[current_pt[0], current_pt[1]] = mode_val
+    front = np.flatnonzero(label1d > 0)[0:np.count_nonzero(seed_points[0])]
+    # Level and order of each pixel in the queue
+    level = np.full(label1d.size, -1, dtype=np.int64)
+    order = np.zeros(label1d.size, dtype=np.int64)
+    queued = label1d != 0
+    ilevel = 0
+    level[front] = ilevel
+    order[front] = np.arange(len(front))
+
+    while len(front) > 0:
+        # Unprocessed neighbors are queued in the order of the current level, then the neighbor offsets
+        neighbors = (front[:, None] + offsets[None, :]).ravel()
+        neighbors = neighbors[~queued[neighbors]]
+        _, ifirst = np.unique(neighbors, return_index=True)
+        front = neighbors[np.sort(ifirst)]
+        nfront = len(front)
+        if nfront == 0:
+            break
+        ilevel += 1
+        queued[front] = True
+        level[front] = ilevel
+        order[front] = np.arange(nfront)
+
+        # Labels of the 3x3 window of each pixel in this level
+        window = front[:, None] + offsets[None, :]
+        # Same level neighbors earlier in the queue count toward the most common label
+        samelevel = level[window] == ilevel
+        earlier = samelevel & (order[window] < np.arange(nfront)[:, None])
+        # Other neighbors in this level or beyond do not count yet
+        window_label = np.where(samelevel & ~earlier, 0, label1d[window])
+        label1d[front] = _most_common_label(window_label)
+
+        # Update labels that depend on earlier neighbors in this level until no label changes,
+        # starting with all pixels having earlier neighbors, then those with changed earlier neighbors
+        changed = np.zeros(nfront, dtype=bool)
+        idep = np.nonzero(earlier.any(axis=1))[0]
+        while len(idep) > 0:
+            dep_label = window_label[idep]
+            dep_earlier = earlier[idep]
+            dep_label[dep_earlier] = label1d[window[idep][dep_earlier]]
+            new_label = _most_common_label(dep_label)
+            is_changed = new_label != label1d[front[idep]]
+            if not np.any(is_changed):
+                break
+            ichanged = idep[is_changed]
+            label1d[front[ichanged]] = new_label[is_changed]
+            changed[:] = False
+            changed[ichanged] = True
+            # Pixels with an earlier neighbor changed in this pass
+            changed_window = np.zeros(window.shape, dtype=bool)
+            changed_window[earlier] = changed[order[window[earlier]]]
+            idep = np.nonzero(changed_window.any(axis=1))[0]
+
+    grid[:, :] = label1d.reshape(ny + 2, nxp)[1:-1, 1:-1]
     return grid
 
 
+def _most_common_label(window_label):
+    """
+    Get the most common label (> 0) in each row, the smallest label is used for ties.
+
+    Args:
+        window_label: np.array
+            Labels of neighbors [npoints, nneighbors], values <= 0 are not counted.
+
+    Returns:
+        mode_label: np.array
+            Most common label for each point.
+    """
+    valid = window_label > 0
+    maxlabel = np.max(window_label) + 1
+    # Most points have a single label among the neighbors
+    mode_label = np.max(window_label, axis=1)
+    min_label = np.min(np.where(valid, window_label, maxlabel), axis=1)
+    imixed = np.nonzero(min_label != mode_label)[0]
+    if len(imixed) > 0:
+        mixed_label = window_label[imixed]
+        mixed_valid = valid[imixed]
+        counts = np.count_nonzero(
+            (mixed_label[:, :, None] == mixed_label[:, None, :]) & mixed_valid[:, None, :], axis=2
+        )
+        score = np.where(mixed_valid, counts * maxlabel - mixed_label, -1)
+        mode_label[imixed] = mixed_label[np.arange(len(imixed)), np.argmax(score, axis=1)]
+    return mode_label
+
+
 def skimage_watershed(fvar, config):
     """
     Label objects with skimage.watershed function
@@ -2,7 +2,8 @@ def futyan3(ir, pixel_radius, tb_threshs, area_thresh, warmanvilexpansion):
     ######################################################################
     # Import modules
     import numpy as np
-    from scipy.ndimage import label, binary_dilation, generate_binary_structure
+    from scipy.ndimage import label
+    from pyflextrkr.ftfunctions import grow_labels_in_mask
 
     ######################################################################
     # Define constants:
@@ -91,92 +92,11 @@ def futyan3(ir, pixel_radius, tb_threshs, area_thresh, warmanvilexpansion):
             ##################################################################
             # Add the warm anvil to features by dilating the cold anvil + core region outward.
             if warmanvilexpansion == 1:
-                keepspreading = 1
-
-                # Keep looping through dilating code as long as at least one feature is growing. At this point limit it to 20 dilations. Remove this once use real data.
-                while keepspreading > 0:
-                    keepspreading = 0
-
-                    # Loop through each feature
-                    for ifeature in range(1, final_nclouds + 1):
-                        # Create map of single feature
-                        featuremap = np.copy(final_cloudnumber)
-                        featuremap[final_cloudnumber != ifeature] = 0
-                        featuremap[final_cloudnumber == ifeature] = 1
-
-                        # Find maximum extent of the of the feature
-                        extenty = np.nansum(featuremap, axis=1)
-                        extenty = np.array(np.where(extenty > 0))[0, :]
-                        miny = extenty[0]
-                        maxy = extenty[-1]
-
-                        extentx = np.nansum(featuremap, axis=0)
-                        extentx = np.array(np.where(extentx > 0))[0, :]
-                        minx = extentx[0]
-                        maxx = extentx[-1]
-
-                        # Subset ir and map data to smaller region around feature. This reduces computation time. Add a 10 pixel buffer around the edges of the feature.
-                        if minx <= 10:
-                            minx = 0
-                        else:
-                            minx = minx - 10
-
-                        if maxx >= nx - 10:
-                            maxx = nx
-                        else:
-                            maxx = maxx + 11
-
-                        if miny <= 10:
-                            miny = 0
-                        else:
-                            miny = miny - 10
-
-                        if maxy >= ny - 10:
-                            maxy = ny
-                        else:
-                            maxy = maxy + 11
-
-                        irsubset = ir[miny:maxy, minx:maxx]
-                        fullsubset = final_cloudnumber[miny:maxy, minx:maxx]
-                        featuresubset = featuremap[miny:maxy, minx:maxx]
-
-                        # Dilate cloud region
-                        dilationstructure = generate_binary_structure(
-                            2, 1
-                        )  # Defines shape of growth. This grows one pixel as a cross
-
-                        dilatedsubset = binary_dilation(
-                            featuresubset, structure=dilationstructure, iterations=1
-                        ).astype(featuremap.dtype)
-
-                        # Isolate region that was dilated.
-                        expansionzone = dilatedsubset - featuresubset
-
-                        # Only keep pixels in dilated regions that are below the warm anvil threshold and are not associated with another feature
-                        expansionzone[
-                            np.where((expansionzone == 1) & (fullsubset != 0))
-                        ] = 0
-                        expansionzone[
-                            np.where((expansionzone == 1) & (irsubset >= thresh_warm))
-                        ] = 0
-
-                        # Find indices of accepted dilated regions
-                        expansionindices = np.column_stack(np.where(expansionzone == 1))
-
-                        # Add the accepted dilated region to the map of the cloud numbers
-                        final_cloudnumber[
-                            expansionindices[:, 0] + miny, expansionindices[:, 1] + minx
-                        ] = ifeature
-
-                        # Add the number of expanded pixels to pixel count
-                        ncorecoldpix[ifeature - 1] = (
-                            len(expanxisionindices[:, 0]) + ncorecoldpix[ifeature - 1]
-                        )
-
-                        # Count the number of dilated pixels. Add to the keepspreading variable. As long as this variables is > 0 the code continues to run the dilating portion. Also at this point have a requirement that can't dilate more than 20 times. This shoudl be removed when have actual data.
-                        keepspreading = keepspreading + len(
-                            np.extract(expansionzone == 1, expansionzone)
-                        )
+                # Expand all features together into the warm anvil, one pixel (cross shape) per iteration,
+                # only into pixels that are below the warm anvil threshold and are not associated with another feature
+                final_cloudnumber = grow_labels_in_mask(
+                    final_cloudnumber, ~(ir >= thresh_warm), nlabels=final_nclouds,
+                )
 
         ################################################################
         # Once dilation complete calculate the number of core, cold, and warm pixels in each feature. Also create a map of cloud number for only core and cold region
@@ -5,7 +5,10 @@ import os
 from netCDF4 import Dataset
 import xarray as xr
 import logging
+import dask
 from pyflextrkr.ft_utilities import subset_files_timerange
+from pyflextrkr.gettracks_func import link_clouds_loop, link_clouds_graph
+from pyflextrkr.tracksingle_func import read_link_index
 
 def gettracknumbers(config):
     """
@@ -31,10 +34,12 @@ def gettracknumbers(config):
     enddate = config["enddate"]
     timegap = config["timegap"]
     maxnclouds = config["maxnclouds"]
-    featuresize_varname = config.get("featuresize_varname", "npix_feature")
     start_basetime = config["start_basetime"]
     end_basetime = config["end_basetime"]
     fillval = config["fillval"]
+    run_parallel = config["run_parallel"]
+    gettracks_nblocks = config.get("gettracks_nblocks", 1)
+    linkindex_filebase = config.get("linkindex_filebase", "linkindex_")
 
     logger = logging.getLogger(__name__)
     np.set_printoptions(threshold=np.inf)
@@ -52,6 +57,17 @@ def gettracknumbers(config):
                                               start_basetime,
                                               end_basetime)
 
+    # Read link index written by trackclouds, so that the cloudid files do not need to be opened
+    linkindex_file = f"{tracking_outpath}{linkindex_filebase}{startdate}_{enddate}.nc"
+    link_index = None
+    if os.path.isfile(linkindex_file):
+        link_index = read_link_index(linkindex_file)
+        if all(os.path.basename(ifile) in link_index for ifile in files):
+            logger.info(f"Using link index: {linkindex_file}")
+        else:
+            logger.info(f"Link index does not include all track files, not used: {linkindex_file}")
+            link_index = None
+
     ############################################################################
     # Initialize matrices
     # KB HARDCODED GAP
@@ -60,492 +76,97 @@ def gettracknumbers(config):
     nfiles = len(files)
     logger.info(f"Total number of files to process: {nfiles}")
 
-    fillval_f = np.nan
     tracknumber = np.full((1, nfiles, maxnclouds), fillval, dtype=int)
-    referencetrackstatus = np.full((nfiles, maxnclouds), fillval_f, dtype=float)
-    newtrackstatus = np.full((nfiles, maxnclouds), fillval_f, dtype=float)
-    trackstatus = np.full((1, nfiles, maxnclouds), fillval, dtype=int)
+    trackstatus = np.zeros((1, nfiles, maxnclouds), dtype=int)
     trackmergenumber = np.full((1, nfiles, maxnclouds), fillval, dtype=int)
     tracksplitnumber = np.full((1, nfiles, maxnclouds), fillval, dtype=int)
     basetime = np.empty(nfiles, dtype="datetime64[s]")
     trackreset = np.full((1, nfiles, maxnclouds), fillval, dtype=int)
 
-    ############################################################################
-    # Load first file
-    logger.debug("Processing first file")
-    logger.debug(f"tracking_outpath: {tracking_outpath}")
-    logger.debug(f"files[0]: {files[0]}")
-    # singletracking_data = Dataset(tracking_outpath + files[0], "r")
-    singletracking_data = Dataset(files[0], "r")
-
-    # Number of clouds in reference file
-    nclouds_reference = int(np.nanmax(singletracking_data["nclouds_ref"][:]) + 1)
-    basetime_ref = singletracking_data["basetime_ref"][:]
-    # basetime_units =  singletracking_data['basetime_ref'].units
-    # basetime_calendar = singletracking_data['basetime_ref'].calendar
-    ref_file = singletracking_data.getncattr("ref_file")
-    singletracking_data.close()
-
-    # Make sure number of clouds does not exceed maximum.
-    if nclouds_reference > maxnclouds:
-        logger.critical(f"Error: Number of clouds in reference file exceed allowed maximum number of clouds")
-        logger.critical(f"nclouds_reference: {nclouds_reference}, nmaxclouds: {maxnclouds}")
-        logger.critical("Increase maxnclouds in the config file.")
-        sys.exit("Code exits in gettracks.py")
-
-    # Isolate file name and add it to the filelist
-    basetime[0] = basetime_ref.item()
-
-    temp_referencefile = os.path.basename(ref_file)
-    strlength = len(temp_referencefile)
-    cloudidfiles = np.chararray((nfiles, int(strlength)))
-    cloudidfiles[0, :] = list(os.path.basename(ref_file))
-
-    # Initate track numbers
-    tracknumber[0, 0, 0 : int(nclouds_reference)] = (
-        np.arange(0, int(nclouds_reference)) + 1
-    )
-    itrack = nclouds_reference + 1
-
-    # Rocord that the tracks are being reset / initialized
-    trackreset[0, 0, :] = 1
-
     ###########################################################################
-    # Loop over files and generate tracks
-    logger.debug("Loop through the rest of the files")
+    # Split the files into contiguous time blocks and generate tracks in each block
+    # The last file is not processed (its new clouds are the last time)
+    # Blocks only start where the reference file is the new file of the previous track file without a time gap
+    block_starts = get_block_starts(files, gettracks_nblocks, timegap, link_index=link_index)
+    block_ends = block_starts[1:] + [nfiles - 1]
+    nblocks = len(block_starts)
     logger.debug(f"Number of files: {str(nfiles)}")
+    logger.debug(f"Number of time blocks: {nblocks}")
     logger.debug((time.ctime()))
-    ifill = 0
-
-    for ifile in range(0, nfiles):
-        logger.info(os.path.basename(files[ifile]))
-
-        ######################################################################
-        # Load single track file
-        # logger.debug('Load track data')
-        # logger.debug((time.ctime()))
-        # singletracking_data = Dataset(tracking_outpath + files[ifile], "r")
-        singletracking_data = Dataset(files[ifile], "r")
-        # Number of clouds in reference file
-        nclouds_reference = int(np.nanmax(singletracking_data["nclouds_ref"][:]) + 1)
-        nclouds_new = int(np.nanmax(singletracking_data["nclouds_new"][:]) + 1)
-        basetime_ref = singletracking_data["basetime_ref"][:]
-        basetime_new = singletracking_data["basetime_new"][:]
-        # basetime_units =  singletracking_data['basetime_ref'].units
-        # basetime_calendar = singletracking_data['basetime_ref'].calendar
-        # Number of clouds in new file
-        refcloud_forward_index = singletracking_data["refcloud_forward_index"][:].astype(int)
-        # Each row represents a cloud in the reference file and
-        # the numbers in that row are indices of clouds in new file linked that cloud in the reference file
-        newcloud_backward_index = singletracking_data["newcloud_backward_index"][:].astype(int)
-        # Each row represents a cloud in the new file and
-        # the numbers in that row are indices of clouds in the reference file linked that cloud in the new file
-        ref_file = singletracking_data.getncattr("ref_file")
-        new_file = singletracking_data.getncattr("new_file")
-        ref_date = singletracking_data.getncattr("ref_date")
-        new_date = singletracking_data.getncattr("new_date")
-
-        singletracking_data.close()
-
-        # Make sure number of clouds does not exceed maximum. If does indicates over-segmenting data
-        if nclouds_reference > maxnclouds:
-            logger.critical(f"Error: Number of clouds in reference file exceed allowed maximum number of clouds")
-            logger.critical(f"nclouds_reference: {nclouds_reference}, nmaxclouds: {maxnclouds}")
-            logger.critical("Increase maxnclouds in the config file.")
-            sys.exit("Code exits in gettracks.py")
-
-        ########################################################################
-        # Load cloudid files
-        # logger.debug('Load cloudid files')
-        # logger.debug((time.ctime()))
-        # Reference cloudid file
-        referencecloudid_data = Dataset(ref_file, "r")
-        npix_reference = referencecloudid_data[featuresize_varname][:]
-        referencecloudid_data.close()
 
-        # New cloudid file
-        newcloudid_data = Dataset(new_file, "r")
-        npix_new = newcloudid_data[featuresize_varname][:]
-        newcloudid_data.close()
-
-        # Remove possible extra time dimension to make sure npix is a 1D array
-        # npix_reference = npix_reference.squeeze()
-        # npix_new = npix_new.squeeze()
+    # Serial version
+    if (run_parallel == 0) | (nblocks == 1):
+        results = []
+        for ifile_start, ifile_end in zip(block_starts, block_ends):
+            result = gettracks_block(files, ifile_start, ifile_end, config,
+                                     link_index=subset_link_index(link_index, files[ifile_start:ifile_end]))
+            results.append(result)
+    # Parallel version
+    elif run_parallel >= 1:
+        results = []
+        for ifile_start, ifile_end in zip(block_starts, block_ends):
+            result = dask.delayed(gettracks_block)(
+                files, ifile_start, ifile_end, config,
+                link_index=subset_link_index(link_index, files[ifile_start:ifile_end]),
+            )
+            results.append(result)
+        results = dask.compute(*results)
+    else:
+        sys.exit('Valid parallelization flag not provided.')
 
-        ########################################################################
-        # Check time gap between consecutive track files
-        # logger.debug('Checking if time gap between files satisfactory')
-        # logger.debug((time.ctime()))
-
-        # Set previous and new times
-        if ifile < 1:
-            time_prev = np.copy(basetime_new[0])
-
-        time_new = np.copy(basetime_new[0])
-
-        # Check if files immediately follow each other. Missing files can exist.
-        # If missing files exist need to increment index and track numbers
-        if ifile > 0:
-            hour_diff = np.array([time_new - time_prev]).astype(float)
-            if hour_diff > (timegap * 3.6 * 10 ** 12):
-                logger.debug(f"Track terminates on: {ref_date}")
-                logger.debug(f"Time difference: {str(hour_diff)}")
-                logger.debug(f"Maximum timegap allowed: {str(timegap)}")
-                logger.debug(f"New track starts on: {new_date}")
-
-                # Flag the previous file as the last file
-                trackreset[0, ifill, :] = 2
-
-                ifill = ifill + 2
-
-                # Fill tracking matrices with reference data and record that the track ended
-                cloudidfiles[ifill, :] = list(os.path.basename(ref_file))
-                basetime[ifill] = basetime_ref.item()
-
-                # Record that break in data occurs
-                trackreset[0, ifill, :] = 1
-
-                # Treat all clouds in the reference file as new clouds
-                for ncr in range(1, nclouds_reference + 1):
-                    tracknumber[0, ifill, ncr - 1] = itrack
-                    itrack = itrack + 1
-
-        time_prev = time_new
-        cloudidfiles[ifill + 1, :] = list(os.path.basename(new_file))
-        basetime[ifill + 1] = basetime_new.item()
-
-        ########################################################################################
-        # Compare forward and backward single track matirces to link new and reference clouds
-        # Intiailize matrix for this time period
-        # logger.debug('Generating tracks')
-        # logger.debug((time.ctime()))
-        trackfound = np.ones(nclouds_reference + 1, dtype=int) * -9999
-
-        # Loop over all reference clouds
-        # logger.debug('Looping over all clouds in the reference file')
-        # logger.debug(('Number of clouds to process: ' + str(nclouds_reference)))
-        # logger.debug((time.ctime()))
-        for ncr in np.arange(
-            1, nclouds_reference + 1
-        ):  # Looping over each reference cloud. Start at 1 since clouds numbered starting at 1.
-            # logger.debug(('Reference cloud #: ' + str(ncr)))
-            # logger.debug((time.ctime()))
-            if trackfound[ncr - 1] < 1:
-
-                # Find all clouds (both forward and backward) associated with this reference cloud
-                nreferenceclouds = 0
-                ntemp_referenceclouds = 1  # Start by forcing to see if track exists
-                temp_referenceclouds = [ncr]
-
-                trackpresent = 0
-                # logger.debug('Finding all associated clouds')
-                # logger.debug((time.ctime()))
-                while ntemp_referenceclouds > nreferenceclouds:
-                    associated_referenceclouds = np.copy(temp_referenceclouds).astype(
-                        int
-                    )
-                    nreferenceclouds = ntemp_referenceclouds
-
-                    for nr in range(0, nreferenceclouds):
-                        # logger.debug(('Processing cloud #: ' + str(nr)))
-                        # logger.debug((time.ctime()))
-                        tempncr = associated_referenceclouds[nr]
-
-                        # Find indices of forward linked clouds.
-                        # Need to subtract one since looping based on core number and
-                        # since python starts with indices at zero.
-                        # Row of that core is one less than its number.
-                        newforwardindex = np.array(
-                            np.where(refcloud_forward_index[0, tempncr - 1, :] > 0)
-                        )
-                        nnewforward = np.shape(newforwardindex)[1]
-                        if nnewforward > 0:
-                            core_newforward = refcloud_forward_index[
-                                0, tempncr - 1, newforwardindex[0, :]
-                            ]
-
-                        # Find indices of backwards linked clouds
-                        newbackwardindex = np.array(
-                            np.where(newcloud_backward_index[0, :, :] == tempncr)
-                        )
-                        nnewbackward = np.shape(newbackwardindex)[1]
-                        if nnewbackward > 0:
-                            # Need to add one since want the core index, which starts at one.
-                            # But this is using that row number, which starts at zero.
-                            core_newbackward = (newbackwardindex[0, :] + 1)
-
-                        # Put all the indices associated with new clouds linked to the reference cloud in one vector
-                        if nnewforward > 0:
-                            if trackpresent == 0:
-                                associated_newclouds = core_newforward[:].astype(int)
-                                trackpresent = trackpresent + 1
-                            else:
-                                associated_newclouds = np.append(
-                                    associated_newclouds, core_newforward.astype(int)
-                                )
-
-                        if nnewbackward > 0:
-                            if trackpresent == 0:
-                                associated_newclouds = core_newbackward[:]
-                                trackpresent = trackpresent + 1
-                            else:
-                                associated_newclouds = np.append(
-                                    associated_newclouds, core_newbackward.astype(int)
-                                )
-
-                        if nnewbackward == 0 and nnewforward == 0:
-                            associated_newclouds = []
-
-                        # If the reference cloud is linked to a new cloud
-                        if trackpresent > 0:
-                            # Sort and find the unique new clouds associated with the reference cloud
-                            if len(associated_newclouds) > 1:
-                                associated_newclouds = np.unique(
-                                    np.sort(associated_newclouds)
-                                )
-                            nnewclouds = len(associated_newclouds)
-
-                            # Find reference clouds associated with each new cloud.
-                            # Look to see if these new clouds are linked to other cells in the reference file as well.
-                            for nnew in range(0, nnewclouds):
-                                # Find associated reference clouds
-                                referencecloudindex = np.array(
-                                    np.where(
-                                        refcloud_forward_index[0, :, :]
-                                        == associated_newclouds[nnew]
-                                    )
-                                )
-                                nassociatedreference = np.shape(referencecloudindex)[1]
-                                if nassociatedreference > 0:
-                                    temp_referenceclouds = np.append(
-                                        temp_referenceclouds, referencecloudindex[0] + 1
-                                    )
-                                    temp_referenceclouds = np.unique(
-                                        np.sort(temp_referenceclouds)
-                                    )
-
-                            ntemp_referenceclouds = len(temp_referenceclouds)
-                        else:
-                            nnewclouds = 0
-
-                #################################################################
-                # Now get the track status
-
-                if nnewclouds > 0:
-                    ############################################################
-                    # Find the largest reference and new clouds
-                    # Largest reference cloud
-                    # Need to subtract one since associated_referenceclouds gives core index and matrix starts at zero
-                    allreferencepix = npix_reference[associated_referenceclouds - 1]
-                    largestreferenceindex = np.argmax(allreferencepix)
-                    # Cloud number of the largest reference cloud
-                    largest_referencecloud = associated_referenceclouds[largestreferenceindex]
-
-                    # Largest new cloud
-                    # Need to subtract one since associated_newclouds gives cloud number and the matrix starts at zero
-                    allnewpix = npix_new[associated_newclouds - 1]
-                    largestnewindex = np.argmax(allnewpix)
-                    # Cloud number of the largest new cloud
-                    largest_newcloud = associated_newclouds[largestnewindex]
-
-                    if nnewclouds == 1 and nreferenceclouds == 1:
-                        ############################################################
-                        # Simple continuation
-
-                        # Check trackstatus already has a valid value.
-                        # This will prtrack splits from a previous step being overwritten
-
-                        # logger.debug(trackstatus[ifill,ncr-1])
-                        referencetrackstatus[ifill, ncr - 1] = 1
-                        trackfound[ncr - 1] = 1
-                        tracknumber[0, ifill + 1, associated_newclouds - 1] = np.copy(
-                            tracknumber[0, ifill, ncr - 1]
-                        )
-
-                    elif nreferenceclouds > 1:
-                        ##############################################################
-                        # Merging only
-
-                        # Loop through the reference clouds and assign the track to the largest one,
-                        # the rest just go away
-                        if nnewclouds == 1:
-                            for tempreferencecloud in associated_referenceclouds:
-                                trackfound[tempreferencecloud - 1] = 1
-
-                                # If this reference cloud is the largest fragment of the merger,
-                                # label this reference time (file) as the larger part of merger (2)
-                                # and merging at the next time (ifile + 1)
-                                if tempreferencecloud == largest_referencecloud:
-                                    referencetrackstatus[
-                                        ifill, tempreferencecloud - 1
-                                    ] = 2
-                                    tracknumber[
-                                        0, ifill + 1, associated_newclouds - 1
-                                    ] = np.copy(
-                                        tracknumber[
-                                            0, ifill, largest_referencecloud - 1
-                                        ]
-                                    )
-                                # If this reference cloud is the smaller fragment of the merger,
-                                # label the reference time (ifile) as the small merger (12)
-                                # and merging at the next time (file + 1)
-                                else:
-                                    referencetrackstatus[
-                                        ifill, tempreferencecloud - 1
-                                    ] = 21
-                                    trackmergenumber[
-                                        0, ifill, tempreferencecloud - 1
-                                    ] = np.copy(
-                                        tracknumber[
-                                            0, ifill, largest_referencecloud - 1
-                                        ]
-                                    )
-
-                        #################################################################
-                        # Merging and spliting
-                        else:
-
-                            # Loop over the reference clouds and assign the track the largest one
-                            for tempreferencecloud in associated_referenceclouds:
-                                trackfound[tempreferencecloud - 1] = 1
-
-                                # If this is the larger fragment ofthe merger,
-                                # label the reference time (ifill) as large merger (2)
-                                # and the actual merging track at the next time [ifill+1]
-                                if tempreferencecloud == largest_referencecloud:
-                                    referencetrackstatus[
-                                        ifill, tempreferencecloud - 1
-                                    ] = (2 + 13)
-                                    tracknumber[
-                                        0, ifill + 1, largest_newcloud - 1
-                                    ] = np.copy(
-                                        tracknumber[
-                                            0, ifill, largest_referencecloud - 1
-                                        ]
-                                    )
-                                # For the smaller fragment of the merger,
-                                # label the reference time (ifill) as the small merge and
-                                # have the actual merging occur at the next time (ifill+1)
-                                else:
-                                    referencetrackstatus[
-                                        ifill, tempreferencecloud - 1
-                                    ] = (21 + 13)
-                                    trackmergenumber[
-                                        0, ifill, tempreferencecloud - 1
-                                    ] = np.copy(
-                                        tracknumber[
-                                            0, ifill, largest_referencecloud - 1
-                                        ]
-                                    )
-
-                            # Loop through the new clouds and assign the smaller ones a new track
-                            for tempnewcloud in associated_newclouds:
-
-                                # For the smaller fragment of the split,
-                                # label the new time (ifill+1) as the small split
-                                # because the cloud only occurs at the new time step
-                                if tempnewcloud != largest_newcloud:
-                                    newtrackstatus[ifill + 1, tempnewcloud - 1] = 31
-
-                                    tracknumber[0, ifill + 1, tempnewcloud - 1] = itrack
-                                    itrack = itrack + 1
-
-                                    tracksplitnumber[
-                                        0, ifill + 1, tempnewcloud - 1
-                                    ] = np.copy(
-                                        tracknumber[
-                                            0, ifill, largest_referencecloud - 1
-                                        ]
-                                    )
-
-                                    trackreset[0, ifill + 1, tempnewcloud - 1] = 0
-                                # For the larger fragment of the split,
-                                # label the new time (ifill+1) as the large split
-                                # so that is consistent with the small fragments.
-                                # The track continues to follow this cloud so the tracknumber is not incramented.
-                                else:
-                                    newtrackstatus[ifill + 1, tempnewcloud - 1] = 3
-                                    tracknumber[
-                                        0, ifill + 1, tempnewcloud - 1
-                                    ] = np.copy(
-                                        tracknumber[
-                                            0, ifill, largest_referencecloud - 1
-                                        ]
-                                    )
-
-                    #####################################################################
-                    # Splitting only
-                    elif nnewclouds > 1:
-                        # logger.debug('Splitting only')
-                        # logger.debug((time.ctime()))
-                        # Label reference cloud as a pure split
-                        referencetrackstatus[ifill, ncr - 1] = 13
-                        tracknumber[0, ifill, ncr - 1] = np.copy(
-                            tracknumber[0, ifill, largest_referencecloud - 1]
-                        )
-
-                        # Loop over the clouds and assign new tracks to the smaller ones
-                        for tempnewcloud in associated_newclouds:
-                            # For the smaller fragment of the split,
-                            # label the new time (ifill+1) as teh small split (13)
-                            # because the cloud only occurs at the new time.
-                            if tempnewcloud != largest_newcloud:
-                                newtrackstatus[ifill + 1, tempnewcloud - 1] = 31
-
-                                tracknumber[0, ifill + 1, tempnewcloud - 1] = itrack
-                                itrack = itrack + 1
-
-                                tracksplitnumber[
-                                    0, ifill + 1, tempnewcloud - 1
-                                ] = np.copy(tracknumber[0, ifill, ncr - 1])
-
-                                trackreset[0, ifill + 1, tempnewcloud - 1] = 0
-                            # For the larger fragment of the split,
-                            # label new time (ifill+1) as the large split (3)
-                            # so that is consistent with the small fragments
-                            else:
-                                newtrackstatus[ifill + 1, tempnewcloud - 1] = 3
-                                tracknumber[0, ifill + 1, tempnewcloud - 1] = np.copy(
-                                    tracknumber[0, ifill, ncr - 1]
-                                )
-
-                    else:
-                        sys.exit(str(ncr) + " How did we get here?")
-
-                ######################################################################################
-                # No new clouds. Track dissipated
-                else:
-
-                    trackfound[ncr - 1] = 1
-
-                    referencetrackstatus[ifill, ncr - 1] = 0
-
-        ##############################################################################
-        # Find any clouds in the new track that don't have a track number. These are new clouds this file
-
-        for ncn in range(1, int(nclouds_new) + 1):
-            if tracknumber[0, ifill + 1, ncn - 1] < 0:
-                tracknumber[0, ifill + 1, ncn - 1] = itrack
-                itrack = itrack + 1
-
-                trackreset[0, ifill + 1, ncn - 1] = 0
-
-        #############################################################################
-        # Flag the last file in the dataset
-        if ifile == nfiles - 2:
-            logger.debug("WE ARE AT THE LAST FILE")
-            for ncn in range(1, int(nclouds_new) + 1):
-                trackreset[0, ifill + 1, :] = 2
-            break
-
-        ##############################################################################
-        # Increment to next fill
-        ifill = ifill + 1
-
-    trackstatus[0, :, :] = np.nansum(
-        np.dstack((referencetrackstatus, newtrackstatus)), 2
-    )
-    trackstatus[np.isnan(trackstatus)] = -9999
+    ###########################################################################
+    # Stitch the time blocks together
+    # The first time of a block is the last time of the previous block.
+    # Track numbers in each block start from 1, where 1 to nclouds_first are the clouds at the first time.
+    # These are converted to the track numbers of the previous block, and the rest are incremented.
+    logger.debug("Stitching time blocks")
+    itrack = 1
+    islot_last = 0
+    newtrackstatus_last = None
+    for iblock, result in enumerate(results):
+        nslots = result["nslots"]
+        if iblock == 0:
+            nlinked = 0
+            islot_start = 0
+        else:
+            nlinked = result["nclouds_first"]
+            islot_start = islot_last
+
+        # Lookup table to convert block track numbers
+        lut = np.zeros(result["itrack"], dtype=int)
+        lut[1:nlinked + 1] = tracknumber[0, islot_start, 0:nlinked]
+        lut[nlinked + 1:] = itrack + np.arange(result["itrack"] - nlinked - 1)
+        itrack = itrack + result["itrack"] - nlinked - 1
+        for block_var in ["tracknumber", "trackmergenumber", "tracksplitnumber"]:
+            ivalid = result[block_var] > 0
+            result[block_var][ivalid] = lut[result[block_var][ivalid]]
+
+        # Track status is the sum of the reference and new cloud status
+        referencetrackstatus = result["referencetrackstatus"]
+        newtrackstatus = result["newtrackstatus"]
+        if nlinked > 0:
+            # Split numbers, reset flags and status of new clouds at the shared time are from the previous block
+            newtrackstatus[0, :] = newtrackstatus_last
+            result["tracksplitnumber"][0, :] = tracksplitnumber[0, islot_start, :]
+            result["trackreset"][0, :] = trackreset[0, islot_start, :]
+        newtrackstatus_last = newtrackstatus[nslots - 1, :]
+
+        slots = slice(islot_start, islot_start + nslots)
+        tracknumber[0, slots, :] = result["tracknumber"][0:nslots, :]
+        trackmergenumber[0, slots, :] = result["trackmergenumber"][0:nslots, :]
+        tracksplitnumber[0, slots, :] = result["tracksplitnumber"][0:nslots, :]
+        trackreset[0, slots, :] = result["trackreset"][0:nslots, :]
+        trackstatus[0, slots, :] = np.nansum(
+            np.dstack((referencetrackstatus[0:nslots, :], newtrackstatus[0:nslots, :])), 2
+        )
+        basetime[slots] = result["basetime"][0:nslots]
+        if iblock == 0:
+            strlength = len(result["cloudid_files"][0])
+            cloudidfiles = np.chararray((nfiles, int(strlength)))
+        for islot, cloudid_file in enumerate(result["cloudid_files"][0:nslots]):
+            if cloudid_file is not None:
+                cloudidfiles[islot_start + islot, :] = list(cloudid_file)
+        islot_last = islot_start + nslots - 1
 
     logger.debug("Tracking Done")
 
@@ -740,4 +361,372 @@ def gettracknumbers(config):
     )
     logger.info(tracknumbers_outfile)
     logger.info('Get track numbers done.')
-    return tracknumbers_outfile
\ No newline at end of file
+    return tracknumbers_outfile
+
+
+def gettracks_block(files, ifile_start, ifile_end, config, link_index=None):
+    """
+    Track features sequentially through a contiguous block of single track files.
+
+    Track numbers start from 1 for the clouds in the reference file of the first track file.
+    Blocks are stitched together in gettracknumbers, a block after the first one must start
+    at a track file that continues the previous track file without a time gap (see get_block_starts).
+
+    Arguments:
+        files: list
+            Single track file names (all files).
+        ifile_start: int
+            Index of the first track file to process.
+        ifile_end: int
+            Index after the last track file to process.
+        config: dictionary
+            Dictionary containing config parameters.
+        link_index: dictionary, optional, default=None
+            Link index from read_link_index for the block files. If None, the cloudid files are opened.
+
+    Returns:
+        result: dictionary
+            Dictionary containing the track arrays for the block (time by clouds),
+            the time of each cloudid file, the cloudid file names,
+            the next track number, number of clouds in the first file
+            and number of times filled.
+    """
+    timegap = config["timegap"]
+    maxnclouds = config["maxnclouds"]
+    featuresize_varname = config.get("featuresize_varname", "npix_feature")
+    fillval = config["fillval"]
+    gettracks_method = config.get("gettracks_method", "graph")
+
+    logger = logging.getLogger(__name__)
+
+    ############################################################################
+    # Initialize matrices
+    nfiles = len(files)
+    nslots = ifile_end - ifile_start + 1
+    fillval_f = np.nan
+    tracknumber = np.full((1, nslots, maxnclouds), fillval, dtype=int)
+    referencetrackstatus = np.full((nslots, maxnclouds), fillval_f, dtype=float)
+    newtrackstatus = np.full((nslots, maxnclouds), fillval_f, dtype=float)
+    trackmergenumber = np.full((1, nslots, maxnclouds), fillval, dtype=int)
+    tracksplitnumber = np.full((1, nslots, maxnclouds), fillval, dtype=int)
+    basetime = np.empty(nslots, dtype="datetime64[s]")
+    trackreset = np.full((1, nslots, maxnclouds), fillval, dtype=int)
+    cloudidfiles = [None] * nslots
+
+    ############################################################################
+    # Load first file
+    logger.debug(f"Processing first file: {files[ifile_start]}")
+    singletrack = read_singletrack_file(files[ifile_start], featuresize_varname, link_index, links=False)
+
+    # Number of clouds in reference file
+    nclouds_reference = singletrack["nclouds_ref"]
+    basetime_ref = singletrack["basetime_ref"]
+    ref_file = singletrack["ref_file"]
+
+    # Make sure number of clouds does not exceed maximum.
+    if nclouds_reference > maxnclouds:
+        logger.critical(f"Error: Number of clouds in reference file exceed allowed maximum number of clouds")
+        logger.critical(f"nclouds_reference: {nclouds_reference}, nmaxclouds: {maxnclouds}")
+        logger.critical("Increase maxnclouds in the config file.")
+        sys.exit("Code exits in gettracks.py")
+
+    # Isolate file name and add it to the filelist
+    basetime[0] = basetime_ref.item()
+    cloudidfiles[0] = os.path.basename(ref_file)
+    nclouds_first = nclouds_reference
+
+    # Initate track numbers
+    tracknumber[0, 0, 0 : int(nclouds_reference)] = (
+        np.arange(0, int(nclouds_reference)) + 1
+    )
+    itrack = nclouds_reference + 1
+
+    # Rocord that the tracks are being reset / initialized
+    trackreset[0, 0, :] = 1
+
+    ###########################################################################
+    # Loop over files and generate tracks
+    ifill = 0
+
+    for ifile in range(ifile_start, ifile_end):
+        logger.info(os.path.basename(files[ifile]))
+
+        ######################################################################
+        # Load single track file, and number of pixels from the cloudid files
+        singletrack = read_singletrack_file(files[ifile], featuresize_varname, link_index)
+        # Number of clouds in reference file
+        nclouds_reference = singletrack["nclouds_ref"]
+        # Number of clouds in new file
+        nclouds_new = singletrack["nclouds_new"]
+        basetime_ref = singletrack["basetime_ref"]
+        basetime_new = singletrack["basetime_new"]
+        # Each row represents a cloud in the reference file and
+        # the numbers in that row are indices of clouds in new file linked that cloud in the reference file
+        refcloud_forward_index = singletrack["refcloud_forward_index"]
+        # Each row represents a cloud in the new file and
+        # the numbers in that row are indices of clouds in the reference file linked that cloud in the new file
+        newcloud_backward_index = singletrack["newcloud_backward_index"]
+        ref_file = singletrack["ref_file"]
+        new_file = singletrack["new_file"]
+        ref_date = singletrack["ref_date"]
+        new_date = singletrack["new_date"]
+        npix_reference = singletrack["npix_ref"]
+        npix_new = singletrack["npix_new"]
+
+        # Make sure number of clouds does not exceed maximum. If does indicates over-segmenting data
+        if nclouds_reference > maxnclouds:
+            logger.critical(f"Error: Number of clouds in reference file exceed allowed maximum number of clouds")
+            logger.critical(f"nclouds_reference: {nclouds_reference}, nmaxclouds: {maxnclouds}")
+            logger.critical("Increase maxnclouds in the config file.")
+            sys.exit("Code exits in gettracks.py")
+
+        # Remove possible extra time dimension to make sure npix is a 1D array
+        # npix_reference = npix_reference.squeeze()
+        # npix_new = npix_new.squeeze()
+
+        ########################################################################
+        # Check time gap between consecutive track files
+        # logger.debug('Checking if time gap between files satisfactory')
+        # logger.debug((time.ctime()))
+
+        # Set previous and new times
+        # A block starts without a time gap, the first file is not checked
+        if ifile == ifile_start:
+            time_prev = np.copy(basetime_new[0])
+
+        time_new = np.copy(basetime_new[0])
+
+        # Check if files immediately follow each other. Missing files can exist.
+        # If missing files exist need to increment index and track numbers
+        if ifile > 0:
+            if is_time_gap(time_prev, time_new, timegap):
+                logger.debug(f"Track terminates on: {ref_date}")
+                logger.debug(f"Time difference: {str(time_new - time_prev)}")
+                logger.debug(f"Maximum timegap allowed: {str(timegap)}")
+                logger.debug(f"New track starts on: {new_date}")
+
+                # Flag the previous file as the last file
+                trackreset[0, ifill, :] = 2
+
+                ifill = ifill + 2
+
+                # Fill tracking matrices with reference data and record that the track ended
+                cloudidfiles[ifill] = os.path.basename(ref_file)
+                basetime[ifill] = basetime_ref.item()
+
+                # Record that break in data occurs
+                trackreset[0, ifill, :] = 1
+
+                # Treat all clouds in the reference file as new clouds
+                for ncr in range(1, nclouds_reference + 1):
+                    tracknumber[0, ifill, ncr - 1] = itrack
+                    itrack = itrack + 1
+
+        time_prev = time_new
+        cloudidfiles[ifill + 1] = os.path.basename(new_file)
+        basetime[ifill + 1] = basetime_new.item()
+        nslots_filled = ifill + 2
+
+        ########################################################################################
+        # Compare forward and backward single track matirces to link new and reference clouds
+        if gettracks_method == "loop":
+            link_clouds = link_clouds_loop
+        else:
+            link_clouds = link_clouds_graph
+        itrack = link_clouds(
+            refcloud_forward_index,
+            newcloud_backward_index,
+            npix_reference,
+            npix_new,
+            nclouds_reference,
+            ifill,
+            itrack,
+            tracknumber,
+            referencetrackstatus,
+            newtrackstatus,
+            trackmergenumber,
+            tracksplitnumber,
+            trackreset,
+        )
+
+        ##############################################################################
+        # Find any clouds in the new track that don't have a track number. These are new clouds this file
+
+        for ncn in range(1, int(nclouds_new) + 1):
+            if tracknumber[0, ifill + 1, ncn - 1] < 0:
+                tracknumber[0, ifill + 1, ncn - 1] = itrack
+                itrack = itrack + 1
+
+                trackreset[0, ifill + 1, ncn - 1] = 0
+
+        #############################################################################
+        # Flag the last file in the dataset
+        if ifile == nfiles - 2:
+            logger.debug("WE ARE AT THE LAST FILE")
+            for ncn in range(1, int(nclouds_new) + 1):
+                trackreset[0, ifill + 1, :] = 2
+            break
+
+        ##############################################################################
+        # Increment to next fill
+        ifill = ifill + 1
+
+    result = {
+        "tracknumber": tracknumber[0, :, :],
+        "referencetrackstatus": referencetrackstatus,
+        "newtrackstatus": newtrackstatus,
+        "trackmergenumber": trackmergenumber[0, :, :],
+        "tracksplitnumber": tracksplitnumber[0, :, :],
+        "trackreset": trackreset[0, :, :],
+        "basetime": basetime,
+        "cloudid_files": cloudidfiles,
+        "itrack": itrack,
+        "nclouds_first": nclouds_first,
+        "nslots": nslots_filled,
+    }
+    return result
+
+
+def is_time_gap(time_prev, time_new, timegap):
+    """
+    Check if there is a time gap between the new times of consecutive track files.
+
+    Arguments:
+        time_prev: np.array
+            New time of the previous track file.
+        time_new: np.array
+            New time of the current track file.
+        timegap: float
+            Maximum time gap allowed [hour].
+
+    Returns:
+        gap: bool
+            True if the time difference is larger than the time gap.
+    """
+    hour_diff = np.array([time_new - time_prev]).astype(float)
+    return bool(hour_diff > (timegap * 3.6 * 10 ** 12))
+
+
+def get_block_starts(files, gettracks_nblocks, timegap, link_index=None):
+    """
+    Get the first track file of each time block.
+
+    The track files are split evenly into blocks. Each block start is moved forward to the first track file
+    whose reference file is the new file of the previous track file without a time gap,
+    so that stitching the blocks gives the same tracks as a single block.
+
+    Arguments:
+        files: list
+            Single track file names (all files).
+        gettracks_nblocks: int
+            Number of time blocks requested.
+        timegap: float
+            Maximum time gap allowed [hour].
+        link_index: dictionary, optional, default=None
+            Link index from read_link_index. If None, the single track files are opened.
+
+    Returns:
+        block_starts: list
+            Index of the first track file of each block.
+    """
+    nfiles = len(files)
+    # The last file is not processed (its new clouds are the last time)
+    nblocks = int(max(min(gettracks_nblocks, nfiles - 1), 1))
+    if nblocks == 1:
+        return [0]
+
+    # Find track files that can start a block
+    singletracks = [read_singletrack_file(ifile, None, link_index, links=False) for ifile in files[0:nfiles - 1]]
+    can_start = np.zeros(nfiles - 1, dtype=bool)
+    for ifile in range(1, nfiles - 1):
+        prev_track = singletracks[ifile - 1]
+        track = singletracks[ifile]
+        can_start[ifile] = (os.path.basename(track["ref_file"]) == os.path.basename(prev_track["new_file"])) and \
+            not is_time_gap(prev_track["basetime_new"][0], track["basetime_new"][0], timegap)
+    istart_valid = np.where(can_start)[0]
+
+    # Move the evenly split block starts to the next valid start
+    block_starts = [0]
+    for ifiles in np.array_split(np.arange(0, nfiles - 1), nblocks)[1:]:
+        idx = np.searchsorted(istart_valid, max(ifiles[0], block_starts[-1] + 1))
+        if idx < len(istart_valid):
+            block_starts.append(int(istart_valid[idx]))
+    return block_starts
+
+
+def subset_link_index(link_index, block_files):
+    """
+    Subset the link index to the track files of a time block.
+
+    Arguments:
+        link_index: dictionary
+            Link index from read_link_index, or None.
+        block_files: list
+            Single track file names in the block.
+
+    Returns:
+        block_link_index: dictionary
+            Link index of the block files, or None.
+    """
+    if link_index is None:
+        return None
+    return {os.path.basename(ifile): link_index[os.path.basename(ifile)] for ifile in block_files}
+
+
+def read_singletrack_file(track_file, featuresize_varname, link_index=None, links=True):
+    """
+    Read a single track file and the number of pixels for each feature from the cloudid files.
+
+    Arguments:
+        track_file: string
+            Single track file name.
+        featuresize_varname: string
+            Feature size variable name in the cloudid files.
+        link_index: dictionary, optional, default=None
+            Link index from read_link_index. If provided, the times, number of clouds, file names
+            and number of pixels are from the link index, and the cloudid files are not opened.
+        links: bool, optional, default=True
+            If False, only the times, number of clouds and file names are read.
+
+    Returns:
+        singletrack: dictionary
+            Dictionary containing the single track variables.
+    """
+    if link_index is not None:
+        singletrack = dict(link_index[os.path.basename(track_file)])
+        if links:
+            singletracking_data = Dataset(track_file, "r")
+            singletrack["refcloud_forward_index"] = singletracking_data["refcloud_forward_index"][:].astype(int)
+            singletrack["newcloud_backward_index"] = singletracking_data["newcloud_backward_index"][:].astype(int)
+            singletracking_data.close()
+        return singletrack
+
+    singletrack = {}
+    singletracking_data = Dataset(track_file, "r")
+    # Number of clouds in reference and new file
+    singletrack["nclouds_ref"] = int(np.nanmax(singletracking_data["nclouds_ref"][:]) + 1)
+    singletrack["nclouds_new"] = int(np.nanmax(singletracking_data["nclouds_new"][:]) + 1)
+    singletrack["basetime_ref"] = singletracking_data["basetime_ref"][:]
+    singletrack["basetime_new"] = singletracking_data["basetime_new"][:]
+    # basetime_units =  singletracking_data['basetime_ref'].units
+    # basetime_calendar = singletracking_data['basetime_ref'].calendar
+    if links:
+        singletrack["refcloud_forward_index"] = singletracking_data["refcloud_forward_index"][:].astype(int)
+        singletrack["newcloud_backward_index"] = singletracking_data["newcloud_backward_index"][:].astype(int)
+    singletrack["ref_file"] = singletracking_data.getncattr("ref_file")
+    singletrack["new_file"] = singletracking_data.getncattr("new_file")
+    singletrack["ref_date"] = singletracking_data.getncattr("ref_date")
+    singletrack["new_date"] = singletracking_data.getncattr("new_date")
+    singletracking_data.close()
+
+    if links:
+        # Reference cloudid file
+        referencecloudid_data = Dataset(singletrack["ref_file"], "r")
+        singletrack["npix_ref"] = referencecloudid_data[featuresize_varname][:]
+        referencecloudid_data.close()
+
+        # New cloudid file
+        newcloudid_data = Dataset(singletrack["new_file"], "r")
+        singletrack["npix_new"] = newcloudid_data[featuresize_varname][:]
+        newcloudid_data.close()
+    return singletrack
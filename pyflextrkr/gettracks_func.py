@@ -0,0 +1,704 @@
+import sys
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+def link_clouds_loop(
+    refcloud_forward_index,
+    newcloud_backward_index,
+    npix_reference,
+    npix_new,
+    nclouds_reference,
+    ifill,
+    itrack,
+    tracknumber,
+    referencetrackstatus,
+    newtrackstatus,
+    trackmergenumber,
+    tracksplitnumber,
+    trackreset,
+):
+    """
+    Link reference and new clouds from one single track file by looping over each reference cloud.
+
+    Args:
+        refcloud_forward_index: np.ndarray(int)
+            New cloud indices linked to each reference cloud, shape (1, nclouds_reference, nlinks).
+        newcloud_backward_index: np.ndarray(int)
+            Reference cloud indices linked to each new cloud, shape (1, nclouds_new, nlinks).
+        npix_reference: np.ndarray(int)
+            Number of pixels for each reference cloud.
+        npix_new: np.ndarray(int)
+            Number of pixels for each new cloud.
+        nclouds_reference: int
+            Number of reference clouds (rows in refcloud_forward_index).
+        ifill: int
+            Time index of the reference clouds in the track arrays.
+        itrack: int
+            Next track number to assign.
+        tracknumber: np.ndarray(int)
+            Track number array, shape (1, nfiles, maxnclouds). Updated in place.
+        referencetrackstatus: np.ndarray(float)
+            Track status of the reference clouds, shape (nfiles, maxnclouds). Updated in place.
+        newtrackstatus: np.ndarray(float)
+            Track status of the new clouds, shape (nfiles, maxnclouds). Updated in place.
+        trackmergenumber: np.ndarray(int)
+            Track merge number array, shape (1, nfiles, maxnclouds). Updated in place.
+        tracksplitnumber: np.ndarray(int)
+            Track split number array, shape (1, nfiles, maxnclouds). Updated in place.
+        trackreset: np.ndarray(int)
+            Track reset flag array, shape (1, nfiles, maxnclouds). Updated in place.
+
+    Returns:
+        itrack: int
+            Next track number to assign.
+    """
+
+    ########################################################################################
+    # Compare forward and backward single track matirces to link new and reference clouds
+    # Intiailize matrix for this time period
+    # logger.debug('Generating tracks')
+    # logger.debug((time.ctime()))
+    trackfound = np.ones(nclouds_reference + 1, dtype=int) * -9999
+
+    # Loop over all reference clouds
+    # logger.debug('Looping over all clouds in the reference file')
+    # logger.debug(('Number of clouds to process: ' + str(nclouds_reference)))
+    # logger.debug((time.ctime()))
+    for ncr in np.arange(
+        1, nclouds_reference + 1
+    ):  # Looping over each reference cloud. Start at 1 since clouds numbered starting at 1.
+        # logger.debug(('Reference cloud #: ' + str(ncr)))
+        # logger.debug((time.ctime()))
+        if trackfound[ncr - 1] < 1:
+
+            # Find all clouds (both forward and backward) associated with this reference cloud
+            nreferenceclouds = 0
+            ntemp_referenceclouds = 1  # Start by forcing to see if track exists
+            temp_referenceclouds = [ncr]
+
+            trackpresent = 0
+            # logger.debug('Finding all associated clouds')
+            # logger.debug((time.ctime()))
+            while ntemp_referenceclouds > nreferenceclouds:
+                associated_referenceclouds = np.copy(temp_referenceclouds).astype(
+                    int
+                )
+                nreferenceclouds = ntemp_referenceclouds
+
+                for nr in range(0, nreferenceclouds):
+                    # logger.debug(('Processing cloud #: ' + str(nr)))
+                    # logger.debug((time.ctime()))
+                    tempncr = associated_referenceclouds[nr]
+
+                    # Find indices of forward linked clouds.
+                    # Need to subtract one since looping based on core number and
+                    # since python starts with indices at zero.
+                    # Row of that core is one less than its number.
+                    newforwardindex = np.array(
+                        np.where(refcloud_forward_index[0, tempncr - 1, :] > 0)
+                    )
+                    nnewforward = np.shape(newforwardindex)[1]
+                    if nnewforward > 0:
+                        core_newforward = refcloud_forward_index[
+                            0, tempncr - 1, newforwardindex[0, :]
+                        ]
+
+                    # Find indices of backwards linked clouds
+                    newbackwardindex = np.array(
+                        np.where(newcloud_backward_index[0, :, :] == tempncr)
+                    )
+                    nnewbackward = np.shape(newbackwardindex)[1]
+                    if nnewbackward > 0:
+                        # Need to add one since want the core index, which starts at one.
+                        # But this is using that row number, which starts at zero.
+                        core_newbackward = (newbackwardindex[0, :] + 1)
+
+                    # Put all the indices associated with new clouds linked to the reference cloud in one vector
+                    if nnewforward > 0:
+                        if trackpresent == 0:
+                            associated_newclouds = core_newforward[:].astype(int)
+                            trackpresent = trackpresent + 1
+                        else:
+                            associated_newclouds = np.append(
+                                associated_newclouds, core_newforward.astype(int)
+                            )
+
+                    if nnewbackward > 0:
+                        if trackpresent == 0:
+                            associated_newclouds = core_newbackward[:]
+                            trackpresent = trackpresent + 1
+                        else:
+                            associated_newclouds = np.append(
+                                associated_newclouds, core_newbackward.astype(int)
+                            )
+
+                    if nnewbackward == 0 and nnewforward == 0:
+                        associated_newclouds = []
+
+                    # If the reference cloud is linked to a new cloud
+                    if trackpresent > 0:
+                        # Sort and find the unique new clouds associated with the reference cloud
+                        if len(associated_newclouds) > 1:
+                            associated_newclouds = np.unique(
+                                np.sort(associated_newclouds)
+                            )
+                        nnewclouds = len(associated_newclouds)
+
+                        # Find reference clouds associated with each new cloud.
+                        # Look to see if these new clouds are linked to other cells in the reference file as well.
+                        for nnew in range(0, nnewclouds):
+                            # Find associated reference clouds
+                            referencecloudindex = np.array(
+                                np.where(
+                                    refcloud_forward_index[0, :, :]
+                                    == associated_newclouds[nnew]
+                                )
+                            )
+                            nassociatedreference = np.shape(referencecloudindex)[1]
+                            if nassociatedreference > 0:
+                                temp_referenceclouds = np.append(
+                                    temp_referenceclouds, referencecloudindex[0] + 1
+                                )
+                                temp_referenceclouds = np.unique(
+                                    np.sort(temp_referenceclouds)
+                                )
+
+                        ntemp_referenceclouds = len(temp_referenceclouds)
+                    else:
+                        nnewclouds = 0
+
+            #################################################################
+            # Now get the track status
+
+            if nnewclouds > 0:
+                ############################################################
+                # Find the largest reference and new clouds
+                # Largest reference cloud
+                # Need to subtract one since associated_referenceclouds gives core index and matrix starts at zero
+                allreferencepix = npix_reference[associated_referenceclouds - 1]
+                largestreferenceindex = np.argmax(allreferencepix)
+                # Cloud number of the largest reference cloud
+                largest_referencecloud = associated_referenceclouds[largestreferenceindex]
+
+                # Largest new cloud
+                # Need to subtract one since associated_newclouds gives cloud number and the matrix starts at zero
+                allnewpix = npix_new[associated_newclouds - 1]
+                largestnewindex = np.argmax(allnewpix)
+                # Cloud number of the largest new cloud
+                largest_newcloud = associated_newclouds[largestnewindex]
+
+                if nnewclouds == 1 and nreferenceclouds == 1:
+                    ############################################################
+                    # Simple continuation
+
+                    # Check trackstatus already has a valid value.
+                    # This will prtrack splits from a previous step being overwritten
+
+                    # logger.debug(trackstatus[ifill,ncr-1])
+                    referencetrackstatus[ifill, ncr - 1] = 1
+                    trackfound[ncr - 1] = 1
+                    tracknumber[0, ifill + 1, associated_newclouds - 1] = np.copy(
+                        tracknumber[0, ifill, ncr - 1]
+                    )
+
+                elif nreferenceclouds > 1:
+                    ##############################################################
+                    # Merging only
+
+                    # Loop through the reference clouds and assign the track to the largest one,
+                    # the rest just go away
+                    if nnewclouds == 1:
+                        for tempreferencecloud in associated_referenceclouds:
+                            trackfound[tempreferencecloud - 1] = 1
+
+                            # If this reference cloud is the largest fragment of the merger,
+                            # label this reference time (file) as the larger part of merger (2)
+                            # and merging at the next time (ifile + 1)
+                            if tempreferencecloud == largest_referencecloud:
+                                referencetrackstatus[
+                                    ifill, tempreferencecloud - 1
+                                ] = 2
+                                tracknumber[
+                                    0, ifill + 1, associated_newclouds - 1
+                                ] = np.copy(
+                                    tracknumber[
+                                        0, ifill, largest_referencecloud - 1
+                                    ]
+                                )
+                            # If this reference cloud is the smaller fragment of the merger,
+                            # label the reference time (ifile) as the small merger (12)
+                            # and merging at the next time (file + 1)
+                            else:
+                                referencetrackstatus[
+                                    ifill, tempreferencecloud - 1
+                                ] = 21
+                                trackmergenumber[
+                                    0, ifill, tempreferencecloud - 1
+                                ] = np.copy(
+                                    tracknumber[
+                                        0, ifill, largest_referencecloud - 1
+                                    ]
+                                )
+
+                    #################################################################
+                    # Merging and spliting
+                    else:
+
+                        # Loop over the reference clouds and assign the track the largest one
+                        for tempreferencecloud in associated_referenceclouds:
+                            trackfound[tempreferencecloud - 1] = 1
+
+                            # If this is the larger fragment ofthe merger,
+                            # label the reference time (ifill) as large merger (2)
+                            # and the actual merging track at the next time [ifill+1]
+                            if tempreferencecloud == largest_referencecloud:
+                                referencetrackstatus[
+                                    ifill, tempreferencecloud - 1
+                                ] = (2 + 13)
+                                tracknumber[
+                                    0, ifill + 1, largest_newcloud - 1
+                                ] = np.copy(
+                                    tracknumber[
+                                        0, ifill, largest_referencecloud - 1
+                                    ]
+                                )
+                            # For the smaller fragment of the merger,
+                            # label the reference time (ifill) as the small merge and
+                            # have the actual merging occur at the next time (ifill+1)
+                            else:
+                                referencetrackstatus[
+                                    ifill, tempreferencecloud - 1
+                                ] = (21 + 13)
+                                trackmergenumber[
+                                    0, ifill, tempreferencecloud - 1
+                                ] = np.copy(
+                                    tracknumber[
+                                        0, ifill, largest_referencecloud - 1
+                                    ]
+                                )
+
+                        # Loop through the new clouds and assign the smaller ones a new track
+                        for tempnewcloud in associated_newclouds:
+
+                            # For the smaller fragment of the split,
+                            # label the new time (ifill+1) as the small split
+                            # because the cloud only occurs at the new time step
+                            if tempnewcloud != largest_newcloud:
+                                newtrackstatus[ifill + 1, tempnewcloud - 1] = 31
+
+                                tracknumber[0, ifill + 1, tempnewcloud - 1] = itrack
+                                itrack = itrack + 1
+
+                                tracksplitnumber[
+                                    0, ifill + 1, tempnewcloud - 1
+                                ] = np.copy(
+                                    tracknumber[
+                                        0, ifill, largest_referencecloud - 1
+                                    ]
+                                )
+
+                                trackreset[0, ifill + 1, tempnewcloud - 1] = 0
+                            # For the larger fragment of the split,
+                            # label the new time (ifill+1) as the large split
+                            # so that is consistent with the small fragments.
+                            # The track continues to follow this cloud so the tracknumber is not incramented.
+                            else:
+                                newtrackstatus[ifill + 1, tempnewcloud - 1] = 3
+                                tracknumber[
+                                    0, ifill + 1, tempnewcloud - 1
+                                ] = np.copy(
+                                    tracknumber[
+                                        0, ifill, largest_referencecloud - 1
+                                    ]
+                                )
+
+                #####################################################################
+                # Splitting only
+                elif nnewclouds > 1:
+                    # logger.debug('Splitting only')
+                    # logger.debug((time.ctime()))
+                    # Label reference cloud as a pure split
+                    referencetrackstatus[ifill, ncr - 1] = 13
+                    tracknumber[0, ifill, ncr - 1] = np.copy(
+                        tracknumber[0, ifill, largest_referencecloud - 1]
+                    )
+
+                    # Loop over the clouds and assign new tracks to the smaller ones
+                    for tempnewcloud in associated_newclouds:
+                        # For the smaller fragment of the split,
+                        # label the new time (ifill+1) as teh small split (13)
+                        # because the cloud only occurs at the new time.
+                        if tempnewcloud != largest_newcloud:
+                            newtrackstatus[ifill + 1, tempnewcloud - 1] = 31
+
+                            tracknumber[0, ifill + 1, tempnewcloud - 1] = itrack
+                            itrack = itrack + 1
+
+                            tracksplitnumber[
+                                0, ifill + 1, tempnewcloud - 1
+                            ] = np.copy(tracknumber[0, ifill, ncr - 1])
+
+                            trackreset[0, ifill + 1, tempnewcloud - 1] = 0
+                        # For the larger fragment of the split,
+                        # label new time (ifill+1) as the large split (3)
+                        # so that is consistent with the small fragments
+                        else:
+                            newtrackstatus[ifill + 1, tempnewcloud - 1] = 3
+                            tracknumber[0, ifill + 1, tempnewcloud - 1] = np.copy(
+                                tracknumber[0, ifill, ncr - 1]
+                            )
+
+                else:
+                    sys.exit(str(ncr) + " How did we get here?")
+
+            ######################################################################################
+            # No new clouds. Track dissipated
+            else:
+
+                trackfound[ncr - 1] = 1
+
+                referencetrackstatus[ifill, ncr - 1] = 0
+
+    return itrack
+
+
+def link_clouds_graph(
+    refcloud_forward_index,
+    newcloud_backward_index,
+    npix_reference,
+    npix_new,
+    nclouds_reference,
+    ifill,
+    itrack,
+    tracknumber,
+    referencetrackstatus,
+    newtrackstatus,
+    trackmergenumber,
+    tracksplitnumber,
+    trackreset,
+):
+    """
+    Link reference and new clouds from one single track file using connected components.
+
+    The forward and backward links are turned into an edge list, and the merge/split groups
+    are the connected components of the reference-new cloud graph. Groups are resolved
+    with bulk array operations. Results are identical to link_clouds_loop.
+
+    In link_clouds_loop, the reference clouds in a group are found from a starting reference cloud
+    by following any link to new clouds, but only forward links back to reference clouds.
+    If a group cannot be reached from all of its reference clouds this way, the result depends
+    on the order the reference clouds are visited, and these groups are resolved sequentially.
+
+    Args:
+        See link_clouds_loop.
+
+    Returns:
+        itrack: int
+            Next track number to assign.
+    """
+    nref = int(nclouds_reference)
+    forward_index = np.ma.filled(refcloud_forward_index[0], 0)
+    backward_index = np.ma.filled(newcloud_backward_index[0], 0)
+    nnew = backward_index.shape[0]
+
+    ############################################################################
+    # Edge list of the links, cloud numbers converted to indices (start at 0)
+    irow, icol = np.nonzero(forward_index > 0)
+    forward_ref = irow
+    forward_new = forward_index[irow, icol] - 1
+    irow, icol = np.nonzero(backward_index > 0)
+    backward_ref = backward_index[irow, icol] - 1
+    backward_new = irow
+    # Any link between reference and new clouds (duplicates are summed)
+    link_any = csr_matrix(
+        (np.ones(len(forward_ref) + len(backward_ref), dtype=int),
+         (np.concatenate((forward_ref, backward_ref)), np.concatenate((forward_new, backward_new)))),
+        shape=(nref, nnew),
+    )
+    link_any.data[:] = 1
+    link_forward = csr_matrix(
+        (np.ones(len(forward_ref), dtype=int), (forward_ref, forward_new)), shape=(nref, nnew),
+    )
+    link_forward.data[:] = 1
+
+    ############################################################################
+    # Groups: connected components of the reference (0:nref) - new (nref:) cloud graph
+    graph = csr_matrix(
+        (np.ones(link_any.nnz, dtype=int), (link_any.nonzero()[0], link_any.nonzero()[1] + nref)),
+        shape=(nref + nnew, nref + nnew),
+    )
+    ngroups, group = connected_components(graph, directed=False)
+    group_ref = group[:nref]
+    group_new = group[nref:]
+    nref_group = np.bincount(group_ref, minlength=ngroups)
+    nnew_group = np.bincount(group_new, minlength=ngroups)
+
+    # Reference clouds reachable in link_clouds_loop: ref -> (any link) -> new -> (forward link) -> ref
+    # A group is resolved in bulk if all its reference clouds can reach each other
+    reach = link_any @ link_forward.T
+    _, strong_ref = connected_components(reach, directed=True, connection="strong")
+    group_strong = np.unique(np.stack((group_ref, strong_ref), axis=1), axis=0)
+    nstrong_group = np.bincount(group_strong[:, 0], minlength=ngroups)
+    sequential_group = nstrong_group > 1
+
+    ############################################################################
+    # Largest reference and new cloud in each group, first cloud number for ties
+    npix_ref_f = _npix_for_argmax(npix_reference, nref)
+    npix_new_f = _npix_for_argmax(npix_new, nnew)
+    order = np.lexsort((np.arange(nref), -npix_ref_f, group_ref))
+    ifirst = np.unique(group_ref[order], return_index=True)[1]
+    largest_ref = np.full(ngroups, -1, dtype=int)
+    largest_ref[group_ref[order[ifirst]]] = order[ifirst]
+    order = np.lexsort((np.arange(nnew), -npix_new_f, group_new))
+    ifirst = np.unique(group_new[order], return_index=True)[1]
+    largest_new = np.full(ngroups, -1, dtype=int)
+    largest_new[group_new[order[ifirst]]] = order[ifirst]
+    # First reference cloud in each group starts the group in link_clouds_loop
+    first_ref = np.full(ngroups, nref, dtype=int)
+    np.minimum.at(first_ref, group_ref, np.arange(nref))
+
+    ############################################################################
+    # Number of new track numbers used by each group (small split clouds),
+    # assigned in the order of the reference clouds that start the groups
+    bulk_group = (nref_group > 0) & ~sequential_group
+    event_ref = [first_ref[bulk_group]]
+    event_count = [np.where(nnew_group[bulk_group] > 1, nnew_group[bulk_group] - 1, 0)]
+    sequential_links = {}
+    for igroup in np.nonzero(sequential_group)[0]:
+        sequential_links[igroup] = _group_links(
+            np.nonzero(group_ref == igroup)[0], link_any, link_forward,
+        )
+        seeds, counts = _link_group_sequential(
+            sequential_links[igroup], npix_ref_f, npix_new_f, ifill, None,
+        )
+        event_ref.append(seeds)
+        event_count.append(counts)
+    event_ref = np.concatenate(event_ref)
+    event_count = np.concatenate(event_count)
+    order = np.argsort(event_ref, kind="stable")
+    event_start = np.empty(len(event_ref), dtype=int)
+    event_start[order] = itrack + np.cumsum(event_count[order]) - event_count[order]
+    itrack = itrack + int(np.sum(event_count))
+    nbulk = np.count_nonzero(bulk_group)
+    track_start = np.zeros(ngroups, dtype=int)
+    track_start[bulk_group] = event_start[:nbulk]
+
+    ############################################################################
+    # Reference clouds in groups resolved in bulk
+    iref = np.nonzero(bulk_group[group_ref])[0]
+    igroup = group_ref[iref]
+    nr = nref_group[igroup]
+    nn = nnew_group[igroup]
+    islargest = iref == largest_ref[igroup]
+    ref_tracknumber = tracknumber[0, ifill, largest_ref[igroup]]
+    # Dissipation (0), continuation (1), split only (13),
+    # largest merger (2), small merger (21), largest merger with split (15), small merger with split (34)
+    status = np.select(
+        [nn == 0, (nr == 1) & (nn == 1), nr == 1, islargest & (nn == 1), islargest, nn == 1],
+        [0, 1, 13, 2, 15, 21],
+        default=34,
+    )
+    referencetrackstatus[ifill, iref] = status
+    imerge = (nr > 1) & (nn > 0) & ~islargest
+    trackmergenumber[0, ifill, iref[imerge]] = ref_tracknumber[imerge]
+
+    ############################################################################
+    # New clouds in groups resolved in bulk
+    inew = np.nonzero(bulk_group[group_new])[0]
+    igroup = group_new[inew]
+    nn = nnew_group[igroup]
+    ref_tracknumber = tracknumber[0, ifill, largest_ref[igroup]]
+    islargest = inew == largest_new[igroup]
+    # Continuation, merger, largest split (3): follow the largest reference cloud
+    ifollow = (nn == 1) | islargest
+    tracknumber[0, ifill + 1, inew[ifollow]] = ref_tracknumber[ifollow]
+    ilargest = (nn > 1) & islargest
+    newtrackstatus[ifill + 1, inew[ilargest]] = 3
+    # Small split (31): new track, in order of cloud number within each group
+    isplit = ~ifollow
+    order = np.lexsort((inew[isplit], igroup[isplit]))
+    inew = inew[isplit][order]
+    igroup = igroup[isplit][order]
+    ref_tracknumber = ref_tracknumber[isplit][order]
+    rank = np.arange(len(inew)) - np.searchsorted(igroup, igroup, side="left")
+    newtrackstatus[ifill + 1, inew] = 31
+    tracknumber[0, ifill + 1, inew] = track_start[igroup] + rank
+    tracksplitnumber[0, ifill + 1, inew] = ref_tracknumber
+    trackreset[0, ifill + 1, inew] = 0
+
+    ############################################################################
+    # Groups that depend on the order of the reference clouds
+    start_dict = dict(zip(event_ref[nbulk:], event_start[nbulk:]))
+    for igroup in sequential_links:
+        _link_group_sequential(
+            sequential_links[igroup], npix_ref_f, npix_new_f, ifill, start_dict,
+            tracknumber=tracknumber,
+            referencetrackstatus=referencetrackstatus,
+            newtrackstatus=newtrackstatus,
+            trackmergenumber=trackmergenumber,
+            tracksplitnumber=tracksplitnumber,
+            trackreset=trackreset,
+        )
+
+    return itrack
+
+
+def _npix_for_argmax(npix, nclouds):
+    """
+    Get cloud sizes as float for finding the largest cloud, masked or missing sizes set to -inf.
+
+    Args:
+        npix: np.ndarray(int) or np.ma.MaskedArray
+            Number of pixels for each cloud.
+        nclouds: int
+            Number of clouds.
+
+    Returns:
+        npix_f: np.ndarray(float)
+            Number of pixels for each cloud.
+    """
+    npix = np.ma.ravel(npix)
+    npix_f = np.full(nclouds, -np.inf, dtype=float)
+    nvalid = min(len(npix), nclouds)
+    npix_f[:nvalid] = np.ma.filled(npix[:nvalid].astype(float), -np.inf)
+    return npix_f
+
+
+def _group_links(
+    refs,
+    link_any,
+    link_forward,
+):
+    """
+    Get the links of a group of reference clouds as sets.
+
+    Args:
+        refs: np.ndarray(int)
+            Reference cloud indices in the group, sorted.
+        link_any: scipy.sparse.csr_matrix
+            Any link between reference (rows) and new (columns) clouds.
+        link_forward: scipy.sparse.csr_matrix
+            Forward link between reference (rows) and new (columns) clouds.
+
+    Returns:
+        refs: np.ndarray(int)
+            Reference cloud indices in the group, sorted.
+        any_new: dictionary
+            New cloud indices linked to each reference cloud.
+        forward_ref: dictionary
+            Reference cloud indices with a forward link to each new cloud.
+    """
+    any_new = {}
+    forward_ref = {}
+    for iref in refs:
+        any_new[iref] = set(link_any.indices[link_any.indptr[iref]:link_any.indptr[iref + 1]])
+        for inew in link_forward.indices[link_forward.indptr[iref]:link_forward.indptr[iref + 1]]:
+            forward_ref.setdefault(inew, set()).add(iref)
+    return refs, any_new, forward_ref
+
+
+def _link_group_sequential(
+    group_links,
+    npix_ref_f,
+    npix_new_f,
+    ifill,
+    track_start,
+    tracknumber=None,
+    referencetrackstatus=None,
+    newtrackstatus=None,
+    trackmergenumber=None,
+    tracksplitnumber=None,
+    trackreset=None,
+):
+    """
+    Link the clouds in one group by visiting the reference clouds in order, same as link_clouds_loop.
+
+    Args:
+        group_links: tuple
+            Links in the group from _group_links.
+        npix_ref_f: np.ndarray(float)
+            Number of pixels for each reference cloud.
+        npix_new_f: np.ndarray(float)
+            Number of pixels for each new cloud.
+        ifill: int
+            Time index of the reference clouds in the track arrays.
+        track_start: dictionary or None
+            First new track number for each starting reference cloud.
+            If None, only count the new track numbers needed without updating the track arrays.
+        tracknumber, referencetrackstatus, newtrackstatus,
+        trackmergenumber, tracksplitnumber, trackreset: np.ndarray
+            Track arrays updated in place, see link_clouds_loop.
+
+    Returns:
+        seeds: np.ndarray(int)
+            Reference clouds that start a group.
+        counts: np.ndarray(int)
+            Number of new track numbers used by each group.
+    """
+    refs, any_new, forward_ref = group_links
+    update = track_start is not None
+    trackfound = set()
+    seeds = []
+    counts = []
+    for ncr in refs:
+        if ncr in trackfound:
+            continue
+
+        # Find all reference and new clouds associated with this reference cloud
+        associated_referenceclouds = {ncr}
+        while True:
+            associated_newclouds = set().union(*[any_new[iref] for iref in associated_referenceclouds])
+            expanded = associated_referenceclouds.union(
+                *[forward_ref.get(inew, set()) for inew in associated_newclouds]
+            )
+            if len(expanded) == len(associated_referenceclouds):
+                break
+            associated_referenceclouds = expanded
+        associated_referenceclouds = np.array(sorted(associated_referenceclouds))
+        associated_newclouds = np.array(sorted(associated_newclouds), dtype=int)
+        nreferenceclouds = len(associated_referenceclouds)
+        nnewclouds = len(associated_newclouds)
+
+        # No new clouds. Track dissipated
+        if nnewclouds == 0:
+            trackfound.add(ncr)
+            if update:
+                referencetrackstatus[ifill, ncr] = 0
+            continue
+
+        largest_referencecloud = associated_referenceclouds[np.argmax(npix_ref_f[associated_referenceclouds])]
+        largest_newcloud = associated_newclouds[np.argmax(npix_new_f[associated_newclouds])]
+        if nreferenceclouds == 1 and nnewclouds == 1:
+            # Simple continuation
+            trackfound.add(ncr)
+        elif nreferenceclouds > 1:
+            # Merging
+            trackfound.update(associated_referenceclouds)
+        if nnewclouds > 1:
+            seeds.append(ncr)
+            counts.append(nnewclouds - 1)
+        if not update:
+            continue
+
+        ref_tracknumber = tracknumber[0, ifill, largest_referencecloud]
+        if nreferenceclouds == 1:
+            referencetrackstatus[ifill, ncr] = 1 if nnewclouds == 1 else 13
+        else:
+            small_referenceclouds = associated_referenceclouds[associated_referenceclouds != largest_referencecloud]
+            referencetrackstatus[ifill, largest_referencecloud] = 2 if nnewclouds == 1 else (2 + 13)
+            referencetrackstatus[ifill, small_referenceclouds] = 21 if nnewclouds == 1 else (21 + 13)
+            trackmergenumber[0, ifill, small_referenceclouds] = ref_tracknumber
+        if nnewclouds == 1:
+            tracknumber[0, ifill + 1, associated_newclouds] = ref_tracknumber
+        else:
+            # Splitting: the largest new cloud continues the track, the smaller ones start new tracks
+            small_newclouds = associated_newclouds[associated_newclouds != largest_newcloud]
+            newtrackstatus[ifill + 1, largest_newcloud] = 3
+            tracknumber[0, ifill + 1, largest_newcloud] = ref_tracknumber
+            newtrackstatus[ifill + 1, small_newclouds] = 31
+            tracknumber[0, ifill + 1, small_newclouds] = track_start[ncr] + np.arange(nnewclouds - 1)
+            tracksplitnumber[0, ifill + 1, small_newclouds] = ref_tracknumber
+            trackreset[0, ifill + 1, small_newclouds] = 0
+
+    return np.array(seeds, dtype=int), np.array(counts, dtype=int)
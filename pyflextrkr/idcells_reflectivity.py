@@ -6,9 +6,9 @@ from datetime import datetime
 from pyflextrkr.steiner_func import make_dilation_step_func
 from pyflextrkr.steiner_func import mod_steiner_classification
 from pyflextrkr.steiner_func import expand_conv_core
-from pyflextrkr.echotop_func import echotop_height
-from pyflextrkr.echotop_func import echotop_height_wrf
+from pyflextrkr.echotop_func import echotop_heights
 from pyflextrkr.netcdf_io import write_radar_cellid
+from pyflextrkr.ft_utilities import load_static_field
 
 def idcells_reflectivity(
     input_filename,
@@ -174,30 +174,15 @@ def idcells_reflectivity(
 
     # Calculate echo-top heights for various reflectivity thresholds
     shape_2d = refl.shape
+    # Height is 1D for radar/regridded data, and 3D [z, y, x] for WRF
     if (input_source == 'radar') or \
         (input_source == 'csapr_cacti') or \
-        (input_source == 'wrf_regrid'):
-        echotop10 = echotop_height(dbz3d_filt, height, z_dimname, shape_2d,
-                                   dbz_thresh=10, gap=echotop_gap, min_thick=0)
-        echotop20 = echotop_height(dbz3d_filt, height, z_dimname, shape_2d,
-                                   dbz_thresh=20, gap=echotop_gap, min_thick=0)
-        echotop30 = echotop_height(dbz3d_filt, height, z_dimname, shape_2d,
-                                   dbz_thresh=30, gap=echotop_gap, min_thick=0)
-        echotop40 = echotop_height(dbz3d_filt, height, z_dimname, shape_2d,
-                                   dbz_thresh=40, gap=echotop_gap, min_thick=0)
-        echotop50 = echotop_height(dbz3d_filt, height, z_dimname, shape_2d,
-                                   dbz_thresh=50, gap=echotop_gap, min_thick=0)
-    elif (input_source == 'wrf'):
-        echotop10 = echotop_height_wrf(dbz3d_filt, height, z_dimname, shape_2d,
-                                       dbz_thresh=10, gap=echotop_gap, min_thick=0)
-        echotop20 = echotop_height_wrf(dbz3d_filt, height, z_dimname, shape_2d,
-                                       dbz_thresh=20, gap=echotop_gap, min_thick=0)
-        echotop30 = echotop_height_wrf(dbz3d_filt, height, z_dimname, shape_2d,
-                                       dbz_thresh=30, gap=echotop_gap, min_thick=0)
-        echotop40 = echotop_height_wrf(dbz3d_filt, height, z_dimname, shape_2d,
-                                       dbz_thresh=40, gap=echotop_gap, min_thick=0)
-        echotop50 = echotop_height_wrf(dbz3d_filt, height, z_dimname, shape_2d,
-                                       dbz_thresh=50, gap=echotop_gap, min_thick=0)
+        (input_source == 'wrf_regrid') or \
+        (input_source == 'wrf'):
+        echotop10, echotop20, echotop30, echotop40, echotop50 = echotop_heights(
+            dbz3d_filt, height, z_dimname, shape_2d,
+            dbz_threshs=[10, 20, 30, 40, 50], gap=echotop_gap, min_thick=0,
+        )
     del dbz3d_filt
 
     # Put all Steiner parameters in a dictionary
@@ -718,6 +703,7 @@ def get_composite_reflectivity_radar(input_filename, config):
     terrain_file = config.get('terrain_file', None)
     elev_varname = config.get('elev_varname', None)
     rangemask_varname = config.get('rangemask_varname', None)
+    static_cache_size = config.get('static_cache_size', 8)
 
     # Read radar file
     ds = xr.open_dataset(input_filename)
@@ -749,8 +735,11 @@ def get_composite_reflectivity_radar(input_filename, config):
     ds[z_dimname] = z_agl
 
     if terrain_file is not None:
-        # Read terrain file
-        dster = xr.open_dataset(terrain_file)
+        # Read terrain file (cached in each worker process)
+        dster = xr.Dataset({
+            elev_varname: load_static_field(terrain_file, elev_varname, max_entries=static_cache_size),
+            rangemask_varname: load_static_field(terrain_file, rangemask_varname, max_entries=static_cache_size),
+        })
         # Assign coordinate from radar file to the terrain file so they have the same coordinates
         dster = dster.assign_coords({y_dimname: (ds[y_varname]), x_dimname: (ds[x_varname])})
         sfc_elev = dster[elev_varname]
@@ -840,6 +829,7 @@ def get_composite_reflectivity_csapr_cacti(input_filename, config):
     terrain_file = config.get('terrain_file', None)
     elev_varname = config.get('elev_varname', None)
     rangemask_varname = config.get('rangemask_varname', None)
+    static_cache_size = config.get('static_cache_size', 8)
 
     # Read radar file
     ds = xr.open_dataset(input_filename)
@@ -863,8 +853,11 @@ def get_composite_reflectivity_csapr_cacti(input_filename, config):
     z_agl = ds[z_dimname] + radar_alt
     ds[z_dimname] = z_agl
 
-    # Read terrain file
-    dster = xr.open_dataset(terrain_file)
+    # Read terrain file (cached in each worker process)
+    dster = xr.Dataset({
+        elev_varname: load_static_field(terrain_file, elev_varname, max_entries=static_cache_size),
+        rangemask_varname: load_static_field(terrain_file, rangemask_varname, max_entries=static_cache_size),
+    })
     # Change terrain file dimension name to be consistent with radar file
     # dster = dster.rename({'latdim':y_dimname, 'londim':x_dimname})
     # Assign coordinate from radar file to the terrain file so they have the same coordinates
@@ -11,6 +11,7 @@ from pyflextrkr.ftfunctions import olr_to_tb
 from pyflextrkr.futyan3 import futyan3
 from pyflextrkr.label_and_grow_cold_clouds import label_and_grow_cold_clouds
 from pyflextrkr.ftfunctions import sort_renumber, sort_renumber2vars, link_pf_tb
+from pyflextrkr.ft_utilities import get_geolimits_window
 
 def idclouds_tbpf(
     filename,
@@ -53,6 +54,7 @@ def idclouds_tbpf(
     miss_thresh = config['miss_thresh']
     tb_varname = config.get("tb_varname", 'tb')
     geolimits = config['geolimits']
+    static_cache_size = config.get('static_cache_size', 8)
     cloudidmethod = config['cloudidmethod']
     pixel_radius = config['pixel_radius']
     area_thresh = config['area_thresh']
@@ -121,12 +123,12 @@ def idclouds_tbpf(
     rawdata.close()
 
     # Check coordinate dimensions
-    if (lat.ndim == 1) | (lon.ndim == 1):
-        # Mesh 1D coordinate into 2D
-        in_lon, in_lat = np.meshgrid(lon, lat)
-    elif (lat.ndim == 2) | (lon.ndim == 2):
-        in_lon = lon
-        in_lat = lat
+    if (lat.ndim == 1) | (lon.ndim == 1) | (lat.ndim == 2) | (lon.ndim == 2):
+        # Get 2D lat/lon and the subset window within geolimits
+        # The grid geometry is the same for all times and is cached in each worker process
+        in_lat, in_lon, geowindow = get_geolimits_window(
+            lat, lon, geolimits, max_entries=static_cache_size,
+        )
     else:
         logger.critical("ERROR: Unexpected input data x, y coordinate dimensions.")
         logger.critical(f"{xcoord_name} dimension: {lon.ndim}")
@@ -178,20 +180,10 @@ def idclouds_tbpf(
             # determine geographic region of interest is within the data set.
             # if it is proceed and limit the data to that geographic region. if not exit the code.
 
-            # isolate data within lat/lon range set by limit
-            indicesy, indicesx = np.array(
-                np.where(
-                    (in_lat >= geolimits[0])
-                    & (in_lat <= geolimits[2])
-                    & (in_lon >= geolimits[1])
-                    & (in_lon <= geolimits[3])
-                )
-            )
-            ymin, ymax = np.nanmin(indicesy), np.nanmax(indicesy) + 1
-            xmin, xmax = np.nanmin(indicesx), np.nanmax(indicesx) + 1
-
             # proceed if file covers the geographic region in interest
-            if (len(indicesx) > 0) and (len(indicesy) > 0):
+            if geowindow is not None:
+                # isolate data within lat/lon range set by limit
+                ymin, ymax, xmin, xmax = geowindow
                 out_lat = np.copy(in_lat[ymin:ymax, xmin:xmax])
                 out_lon = np.copy(in_lon[ymin:ymax, xmin:xmax])
                 out_ir = np.copy(in_ir[ymin:ymax, xmin:xmax])
@@ -4,7 +4,7 @@ import os
 import sys
 import xarray as xr
 import logging
-from pyflextrkr.ft_utilities import load_sparse_trackstats
+from pyflextrkr.ft_utilities import load_sparse_trackstats, write_stats_parquet, link_mergesplit_entries
 
 def identifymcs_tb(config):
     """
@@ -69,7 +69,6 @@ def identifymcs_tb(config):
     trackstat_coldarea = sparse_dict["cold_area"]
     basetime = sparse_dict["base_time"]
     cloudnumbers = sparse_dict["cloudnumber"]
-    track_status = sparse_dict["track_status"]
 
     # import pdb; pdb.set_trace()
 
@@ -82,169 +81,86 @@ def identifymcs_tb(config):
 
     ###################################################################
     # Identify MCSs
-    trackidx_mcs = []
-    trackid_nonmcs = []
-
-    mcstype = np.zeros(ntracks_all, dtype=np.int16)
-    mcsstatus = np.full((ntracks_all, max_trackduration), fillval, dtype=np.int16)
-
-    logger.debug(f"Total number of tracks to check: {ntracks_all}")
-    for nt in range(0, ntracks_all):
-        # Get data for a given track
-        track_corearea = trackstat_corearea[nt, :].data
-        # Get CCS area
-        track_ccsarea = trackstat_corearea[nt, :].data + trackstat_coldarea[nt, :].data
-
-        # Remove fill values
-        track_corearea = track_corearea[
-            (~np.isnan(track_corearea)) & (track_corearea != 0)
-        ]
-        track_ccsarea = track_ccsarea[~np.isnan(track_ccsarea)]
-
-        # Must have a cold core
-        if np.shape(track_corearea)[0] != 0 and np.nanmax(track_corearea > 0):
-
-            # Cold cloud shield area requirement
-            iccs = np.array(np.where(track_ccsarea > mcs_tb_area_thresh))[0, :]
-            nccs = len(iccs)
-
-            # Find continuous times
-            groups = np.split(iccs, np.where(np.diff(iccs) > timegap)[0] + 1)
-            nbreaks = len(groups)
-
-            # System may have multiple periods satisfying area and duration requirements
-            # Loop over each period
-            if iccs != []:
-                for t in range(0, nbreaks):
-                    # Duration requirement
-                    # Duration length should be group's last index - first index + 1
-                    duration_group = np.multiply(
-                        (groups[t][-1] - groups[t][0] + 1), time_resolution
-                    )
-                    if duration_group >= duration_thresh:
-                        mcstype[nt] = 1
-                        mcsstatus[nt, groups[t][:]] = 1
-                        trackidx_mcs = np.append(trackidx_mcs, nt)
-                    else:
-                        # Size requirement met but too short of a period
-                        trackid_nonmcs = np.append(trackid_nonmcs, nt)
-
-            else:
-                # Size requirement not met
-                trackid_nonmcs = np.append(trackid_nonmcs, nt)
+    # The area and duration criteria are applied to all tracks at once using the sparse arrays,
+    # each sparse entry is a (track, time) pair ordered by track then time
+    entry_track = np.repeat(np.arange(ntracks_all), np.diff(trackstat_corearea.indptr))
+    entry_tidx = np.arange(trackstat_corearea.nnz) - trackstat_corearea.indptr[entry_track]
+    entry_corearea = trackstat_corearea.data
+    entry_ccsarea = trackstat_corearea.data + trackstat_coldarea.data
+
+    # Must have a cold core
+    has_core = np.bincount(entry_track[entry_corearea > 0], minlength=ntracks_all) > 0
+
+    # Time index of each CCS area entry within its track after removing fill values
+    valid = ~np.isnan(entry_ccsarea)
+    nvalid_cumsum = np.cumsum(valid)
+    nvalid_before = np.concatenate(([0], nvalid_cumsum))[trackstat_corearea.indptr[:-1]]
+    valid_tidx = nvalid_cumsum - 1 - nvalid_before[entry_track]
+
+    # Cold cloud shield area requirement
+    iccs = np.where(valid & (entry_ccsarea > mcs_tb_area_thresh) & has_core[entry_track])[0]
+    ccs_track = entry_track[iccs]
+    ccs_tidx = valid_tidx[iccs]
+
+    # Find continuous periods, a new period starts at a new track or after a time gap
+    # System may have multiple periods satisfying area and duration requirements
+    period_start = np.ones(len(iccs), dtype=bool)
+    period_start[1:] = (ccs_track[1:] != ccs_track[:-1]) | (np.diff(ccs_tidx) > timegap)
+    period_end = np.ones(len(iccs), dtype=bool)
+    period_end[:-1] = period_start[1:]
+    period_id = np.cumsum(period_start) - 1
+    # Duration requirement
+    # Duration length should be period's last index - first index + 1
+    duration_period = np.multiply(
+        (ccs_tidx[period_end] - ccs_tidx[period_start] + 1), time_resolution
+    )
+    ccs_mcs = (duration_period >= duration_thresh)[period_id]
 
     ################################################################
     # Get unique track indices
-    trackidx_mcs = np.unique(trackidx_mcs.astype(int))
+    trackidx_mcs = np.unique(ccs_track[ccs_mcs])
     # Provide warning message and exit if no MCS identified
-    if trackidx_mcs == []:
+    if len(trackidx_mcs) == 0:
         logger.critical("WARNING: No MCS identified.")
         logger.critical(f"Tracking will now exit.")
         sys.exit()
 
     ################################################################
     # Subset MCS track index
-    # trackid = np.array(np.where(mcstype > 0))[0, :]
     nmcs = len(trackidx_mcs)
     logger.info(f"Number of Tb defined MCS: {nmcs}")
 
-    if nmcs > 0:
-        mcsstatus = mcsstatus[trackidx_mcs, :]
-        mcstype = mcstype[trackidx_mcs]
-
-        # Get duration when MCS status is met
-        mcs_duration = np.nansum(mcsstatus > 0, axis=1)
-
-    # trackidx_mcs is the index number, want the track number so add one
-    mcstracknumbers = np.copy(trackidx_mcs) + 1
+    # MCS status is 1 for times within periods that meet both requirements
+    mcsstatus = np.full((nmcs, max_trackduration), fillval, dtype=np.int16)
+    mcsstatus[np.searchsorted(trackidx_mcs, ccs_track[ccs_mcs]), ccs_tidx[ccs_mcs]] = 1
 
+    # Get duration when MCS status is met
+    mcs_duration = np.nansum(mcsstatus > 0, axis=1)
 
     ###############################################################
     # Find small merging and spliting clouds and add to MCS
     mcs_merge_cloudnumber = np.full((nmcs, max_trackduration, nmaxmerge), fillval, dtype=np.int32)
-    mcs_merge_status = np.full((nmcs, max_trackduration, nmaxmerge), fillval, dtype=np.int32)
     mcs_merge_ccsarea = np.full((nmcs, max_trackduration, nmaxmerge), fillval_f, dtype=np.float32)
     mcs_split_cloudnumber = np.full((nmcs, max_trackduration, nmaxmerge), fillval, dtype=np.int32)
-    mcs_split_status = np.full((nmcs, max_trackduration, nmaxmerge), fillval, dtype=np.int32)
     mcs_split_ccsarea = np.full((nmcs, max_trackduration, nmaxmerge), fillval_f, dtype=np.float32)
 
-    # Loop through each MCS and link small clouds merging in
-    for imcs in np.arange(0, nmcs):
-        ###################################################################################
-        # Find tracks that end as merging with the MCS
-        mergetrack_idx = np.where(end_merge_tracknumber == mcstracknumbers[imcs])[0]
-        if len(mergetrack_idx) > 0:
-            # Isolate merge tracks that have short duration
-            mergetrack_idx = mergetrack_idx[trackstat_lifetime[mergetrack_idx] < merge_duration]
-
-            # Make sure the merge tracks are not MCS
-            mergetrack_idx = mergetrack_idx[np.isin(mergetrack_idx, mcstracknumbers, invert=True)]
-            if len(mergetrack_idx) > 0:
-                # Get data for merging tracks
-                mergingcloudnumber = cloudnumbers[mergetrack_idx, :].data
-                mergingbasetime = basetime[mergetrack_idx, :].data
-                mergingstatus = track_status[mergetrack_idx, :].data
-                mergingccsarea = trackstat_corearea[mergetrack_idx, :].data +\
-                                 trackstat_coldarea[mergetrack_idx, :].data
-
-                # Get MCS basetime
-                imcsbasetime = basetime[int(mcstracknumbers[imcs])-1, :].data
-
-                # Loop through each timestep in the MCS track
-                for t in np.arange(0, len(imcsbasetime)):
-                    # Find merging cloud times that match current MCS track time
-                    timematch = np.where(mergingbasetime == imcsbasetime[int(t)])[0]
-                    nmergers = len(timematch)
-                    if nmergers > 0:
-                        # Find the smaller value between the two
-                        # to make sure it fits into the array
-                        nmergers_sav = np.min([nmergers, nmaxmerge])
-                        mcs_merge_cloudnumber[imcs, int(t), 0:nmergers_sav] = mergingcloudnumber[timematch[0:nmergers_sav]]
-                        mcs_merge_status[imcs, int(t), 0:nmergers_sav] = mergingstatus[timematch[0:nmergers_sav]]
-                        mcs_merge_ccsarea[imcs, int(t), 0:nmergers_sav] = mergingccsarea[timematch[0:nmergers_sav]]
-                        if (nmergers > nmaxmerge):
-                            logger.warning(f'WARNING: nmergers ({nmergers}) > nmaxmerge ({nmaxmerge}), ' + \
-                                'only partial merge clouds are saved.')
-                            logger.warning(f'MCS track index: {imcs}')
-                            logger.warning(f'Increase nmaxmerge to avoid this WARNING.')
-
-        ###################################################################################
-        # Find tracks that split from the MCS
-        splittrack_idx = np.where(start_split_tracknumber == mcstracknumbers[imcs])[0]
-        if len(splittrack_idx) > 0:
-            # Isolate split tracks that have short duration
-            splittrack_idx = splittrack_idx[trackstat_lifetime[splittrack_idx] < split_duration]
-
-            # Make sure the split tracks are not MCS
-            splittrack_idx = splittrack_idx[np.isin(splittrack_idx, mcstracknumbers, invert=True)]
-            if len(splittrack_idx) > 0:
-                # Get data for split tracks
-                splittingcloudnumber = cloudnumbers[splittrack_idx, :].data
-                splittingbasetime = basetime[splittrack_idx, :].data
-                splittingstatus = track_status[splittrack_idx, :].data
-                splittingccsarea = trackstat_corearea[splittrack_idx, :].data +\
-                                   trackstat_coldarea[splittrack_idx, :].data
-
-                # Get MCS basetime
-                imcsbasetime = basetime[int(mcstracknumbers[imcs]) - 1, :].data
-
-                # Loop through each timestep in the MCS track
-                for t in np.arange(0, len(imcsbasetime)):
-                    # Find splitting cloud times that match current MCS track time
-                    timematch = np.where(splittingbasetime == imcsbasetime[int(t)])[0]
-                    nspliters = len(timematch)
-                    if nspliters > 0:
-                        # Find the smaller value between the two
-                        # to make sure it fits into the array
-                        nspliters_sav = np.min([nspliters, nmaxmerge])
-                        mcs_split_cloudnumber[imcs, int(t), 0:nspliters_sav] = splittingcloudnumber[timematch[0:nspliters_sav]]
-                        mcs_split_status[imcs, int(t), 0:nspliters_sav] = splittingstatus[timematch[0:nspliters_sav]]
-                        mcs_split_ccsarea[imcs, int(t), 0:nspliters_sav] = splittingccsarea[timematch[0:nspliters_sav]]
-                        if (nspliters > nmaxmerge):
-                            logger.warning(f'WARNING: nspliters ({nspliters}) > nmaxmerge ({nmaxmerge}), ' + \
-                                'only partial split clouds are saved.')
-                            logger.warning(f'MCS track index: {imcs}')
-                            logger.warning(f'Increase nmaxmerge to avoid this WARNING.')
+    # Join merging tracks to the MCS entries at the same time
+    main_entry, link_rank, link_entry = link_mergesplit_entries(
+        end_merge_tracknumber, trackstat_lifetime < merge_duration, trackidx_mcs,
+        entry_track, basetime.data, nmaxmerge, link_type="merge",
+    )
+    imcs = np.searchsorted(trackidx_mcs, entry_track[main_entry])
+    mcs_merge_cloudnumber[imcs, entry_tidx[main_entry], link_rank] = cloudnumbers.data[link_entry]
+    mcs_merge_ccsarea[imcs, entry_tidx[main_entry], link_rank] = entry_ccsarea[link_entry]
+
+    # Join splitting tracks to the MCS entries at the same time
+    main_entry, link_rank, link_entry = link_mergesplit_entries(
+        start_split_tracknumber, trackstat_lifetime < split_duration, trackidx_mcs,
+        entry_track, basetime.data, nmaxmerge, link_type="split",
+    )
+    imcs = np.searchsorted(trackidx_mcs, entry_track[main_entry])
+    mcs_split_cloudnumber[imcs, entry_tidx[main_entry], link_rank] = cloudnumbers.data[link_entry]
+    mcs_split_ccsarea[imcs, entry_tidx[main_entry], link_rank] = entry_ccsarea[link_entry]
 
 
     ###########################################################################
@@ -396,4 +312,9 @@ def identifymcs_tb(config):
                     format="NETCDF4", unlimited_dims=tracks_dimname, encoding=encoding)
     logger.info(f"{statistics_outfile}")
 
-    return statistics_outfile
\ No newline at end of file
+    # Write columnar Parquet tables
+    if config.get("stats_parquet", 0) == 1:
+        write_stats_parquet(dsout, statistics_outfile, tracks_dimname, times_dimname, config)
+
+    return statistics_outfile
+
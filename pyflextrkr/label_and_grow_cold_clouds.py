@@ -1,8 +1,8 @@
 import logging
 import numpy as np
-from scipy.ndimage import label, binary_dilation, generate_binary_structure
+from scipy.ndimage import label
 from astropy.convolution import Box2DKernel, convolve
-from pyflextrkr.ftfunctions import sort_renumber, grow_cells
+from pyflextrkr.ftfunctions import sort_renumber, apply_renumber_lookup, grow_cells, grow_labels_in_mask
 
 
 def label_and_grow_cold_clouds(
@@ -115,13 +115,9 @@ def label_and_grow_cold_clouds(
             # This is probably not necessary though.
 
             # Update the cloud sizes
-            cloud_indices, cloud_sizes = np.unique(
-                labelcorecold_number2d, return_counts=True
-            )
-            for index in cloud_indices:
-                if index == 0:
-                    continue
-                labelcorecold_npix[index - 1] = cloud_sizes[index]
+            labelcorecold_npix = np.bincount(
+                labelcorecold_number2d[labelcorecold_number2d > 0], minlength=ncores + 1
+            )[1:ncores + 1]
 
 
         ############################################################
@@ -173,36 +169,27 @@ def label_and_grow_cold_clouds(
         sortedcorecoldisolated_number1d = np.copy(labelcorecoldisolated_number1d[order])
 
         # Re-number clouds
-        sortedcorecoldisolated_number2d = np.zeros((ny, nx), dtype=int)
-        final_ncorepix = np.ones(ncorecoldisolated, dtype=int) * -9999
-        final_ncoldpix = np.ones(ncorecoldisolated, dtype=int) * -9999
+        sortedcorecoldisolated_number2d, ivalidfeatures = renumber_sorted_features(
+            labelcorecoldisolated_number2d,
+            sortedcorecoldisolated_number1d,
+            sortedcorecoldisolated_npix,
+        )
         final_nwarmpix = np.ones(ncorecoldisolated, dtype=int) * -9999
-        featurecount = 0
-        for ifeature in range(0, ncorecoldisolated):
-            #  Find pixels that have matching #
-            feature_indices = (
-                labelcorecoldisolated_number2d
-                == sortedcorecoldisolated_number1d[ifeature]
-            )
-            nfeatureindices = np.count_nonzero(feature_indices)
 
-            if nfeatureindices == sortedcorecoldisolated_npix[ifeature]:
-                featurecount = featurecount + 1
-                sortedcorecoldisolated_number2d[feature_indices] = featurecount
-
-                final_ncorepix[featurecount - 1] = np.nansum(core_flag[feature_indices])
-                final_ncoldpix[featurecount - 1] = np.nansum(
-                    coldanvil_flag[feature_indices]
-                )
+        # Count core and cold anvil pixels for each cloud
+        validcorecoldisolated_number1d = sortedcorecoldisolated_number1d[ivalidfeatures]
+        final_ncorepix = np.bincount(
+            labelcorecoldisolated_number2d[core_flag > 0], minlength=ncorecoldisolated + 1
+        )[validcorecoldisolated_number1d]
+        final_ncoldpix = np.bincount(
+            labelcorecoldisolated_number2d[coldanvil_flag > 0], minlength=ncorecoldisolated + 1
+        )[validcorecoldisolated_number1d]
 
         ##############################################
         # Save final matrices
         final_corecoldnumber = np.copy(sortedcorecoldisolated_number2d)
         final_ncorecold = np.copy(ncorecoldisolated)
 
-        final_ncorepix = final_ncorepix[0:featurecount]
-        final_ncoldpix = final_ncoldpix[0:featurecount]
-
         final_ncorecoldpix = final_ncorepix + final_ncoldpix
 
     ######################################################################
@@ -214,31 +201,28 @@ def label_and_grow_cold_clouds(
         corecold_number2d, ncorecold = label(coldanvil_flag)
 
         ##########################################################
-        # Loop through clouds and only keep those where core + cold anvil exceed threshold
+        # Only keep clouds where core + cold anvil exceed threshold
         if ncorecold > 0:
-            labelcorecold_number2d = np.zeros((ny, nx), dtype=int)
             labelcore_npix = np.ones(ncorecold, dtype=int) * -9999
             labelcold_npix = np.ones(ncorecold, dtype=int) * -9999
             labelwarm_npix = np.ones(ncorecold, dtype=int) * -9999
-            featurecount = 0
 
-            for ifeature in range(1, ncorecold + 1):
-                feature_indices = np.where(corecold_number2d == ifeature)
-                nfeatureindices = np.shape(feature_indices)[1]
-
-                if nfeatureindices > 0:
-                    temp_core = np.copy(core_flag[feature_indices])
-                    temp_corenpix = np.nansum(temp_core)
-
-                    temp_cold = np.copy(coldanvil_flag[feature_indices])
-                    temp_coldnpix = np.nansum(temp_cold)
-
-                    if temp_corenpix + temp_coldnpix >= nthresh:
-                        featurecount = featurecount + 1
-
-                        labelcorecold_number2d[feature_indices] = np.copy(featurecount)
-                        labelcore_npix[featurecount - 1] = np.copy(temp_corenpix)
-                        labelcold_npix[featurecount - 1] = np.copy(temp_coldnpix)
+            # Count core and cold anvil pixels for each cloud
+            feature_corenpix = np.bincount(
+                corecold_number2d[core_flag > 0], minlength=ncorecold + 1
+            )[1:]
+            feature_coldnpix = np.bincount(
+                corecold_number2d[coldanvil_flag > 0], minlength=ncorecold + 1
+            )[1:]
+            ikeepfeatures = np.nonzero(feature_corenpix + feature_coldnpix >= nthresh)[0]
+            featurecount = len(ikeepfeatures)
+            labelcore_npix[0:featurecount] = feature_corenpix[ikeepfeatures]
+            labelcold_npix[0:featurecount] = feature_coldnpix[ikeepfeatures]
+
+            # Renumber kept clouds consecutively in the original label order
+            keep_lut = np.zeros(ncorecold + 1, dtype=int)
+            keep_lut[ikeepfeatures + 1] = np.arange(1, featurecount + 1)
+            labelcorecold_number2d = apply_renumber_lookup(keep_lut, corecold_number2d)
 
             ###############################
             # Update feature count
@@ -268,19 +252,9 @@ def label_and_grow_cold_clouds(
                 # Re-number cores
                 sortedcorecold_number1d = np.copy(labelcorecold_number1d[order])
 
-                sortedcorecold_number2d = np.zeros((ny, nx), dtype=int)
-                corecoldstep = 0
-                for isortedcorecold in range(0, ncorecold):
-                    sortedcorecold_indices = np.where(
-                        labelcorecold_number2d
-                        == sortedcorecold_number1d[isortedcorecold]
-                    )
-                    nsortedcorecoldindices = np.shape(sortedcorecold_indices)[1]
-                    if nsortedcorecoldindices == sortedcorecold_npix[isortedcorecold]:
-                        corecoldstep = corecoldstep + 1
-                        sortedcorecold_number2d[sortedcorecold_indices] = np.copy(
-                            corecoldstep
-                        )
+                sortedcorecold_number2d, _ = renumber_sorted_features(
+                    labelcorecold_number2d, sortedcorecold_number1d, sortedcorecold_npix,
+                )
 
             ##############################################
             # Save final matrices
@@ -306,97 +280,16 @@ def label_and_grow_cold_clouds(
             labelcorecoldwarm_number2d = np.copy(final_corecoldnumber)
             ncorecoldwarmpix = np.copy(final_ncorecoldpix)
 
-            keepspreading = 1
-            # Keep looping through dilating code as long as at least one feature is growing.
-            # At this point limit it to 20 dilations. Remove this once use real data.
-            while keepspreading > 0:
-                keepspreading = 0
-
-                # Loop through each feature
-                for ifeature in range(1, final_ncorecold + 1):
-                    # Create map of single feature
-                    featuremap = np.copy(labelcorecoldwarm_number2d)
-                    featuremap[labelcorecoldwarm_number2d != ifeature] = 0
-                    featuremap[labelcorecoldwarm_number2d == ifeature] = 1
-
-                    # Find maximum extent of the of the feature
-                    extenty = np.nansum(featuremap, axis=1)
-                    extenty = np.array(np.where(extenty > 0))[0, :]
-                    miny = extenty[0]
-                    maxy = extenty[-1]
-
-                    extentx = np.nansum(featuremap, axis=0)
-                    extentx = np.array(np.where(extentx > 0))[0, :]
-                    minx = extentx[0]
-                    maxx = extentx[-1]
-
-                    # Subset ir and map data to smaller region around feature.
-                    # This reduces computation time. Add a 10 pixel buffer around the edges of the feature.
-                    if minx <= 10:
-                        minx = 0
-                    else:
-                        minx = minx - 10
-
-                    if maxx >= nx - 10:
-                        maxx = nx
-                    else:
-                        maxx = maxx + 11
-
-                    if miny <= 10:
-                        miny = 0
-                    else:
-                        miny = miny - 10
-
-                    if maxy >= ny - 10:
-                        maxy = ny
-                    else:
-                        maxy = maxy + 11
-
-                    irsubset = ir[miny:maxy, minx:maxx]
-                    fullsubset = labelcorecoldwarm_number2d[miny:maxy, minx:maxx]
-                    featuresubset = featuremap[miny:maxy, minx:maxx]
-
-                    # Dilate cloud region
-                    dilationstructure = generate_binary_structure(
-                        2, 1
-                    )  # Defines shape of growth. This grows one pixel as a cross
-
-                    dilatedsubset = binary_dilation(
-                        featuresubset, structure=dilationstructure, iterations=1
-                    ).astype(featuremap.dtype)
-
-                    # Isolate region that was dilated.
-                    expansionzone = dilatedsubset - featuresubset
-
-                    # Only keep pixels in dilated regions that are below the warm anvil threshold
-                    # and are not associated with another feature
-                    expansionzone[
-                        np.where((expansionzone == 1) & (fullsubset != 0))
-                    ] = 0
-                    expansionzone[
-                        np.where((expansionzone == 1) & (irsubset >= thresh_warm))
-                    ] = 0
-
-                    # Find indices of accepted dilated regions
-                    expansionindices = np.column_stack(np.where(expansionzone == 1))
-
-                    # Add the accepted dilated region to the map of the cloud numbers
-                    labelcorecoldwarm_number2d[
-                        expansionindices[:, 0] + miny, expansionindices[:, 1] + minx
-                    ] = ifeature
-
-                    # Add the number of expanded pixels to pixel count
-                    ncorecoldwarmpix[ifeature - 1] = (
-                        len(expansionindices[:, 0]) + ncorecoldwarmpix[ifeature - 1]
-                    )
-
-                    # Count the number of dilated pixels. Add to the keepspreading variable.
-                    # As long as this variables is > 0 the code continues to run the dilating portion.
-                    # Also at this point have a requirement that can't dilate more than 20 times.
-                    # This shoudl be removed when have actual data.
-                    keepspreading = keepspreading + len(
-                        np.extract(expansionzone == 1, expansionzone)
-                    )
+            # Expand all clouds together into the warm anvil, one pixel (cross shape) per iteration,
+            # only into pixels that are below the warm anvil threshold and are not associated with another cloud
+            labelcorecoldwarm_number2d = grow_labels_in_mask(
+                labelcorecoldwarm_number2d, ~(ir >= thresh_warm), nlabels=final_ncorecold,
+            )
+            # Add the number of expanded pixels to pixel count
+            nexpandpix = np.bincount(
+                labelcorecoldwarm_number2d[final_corecoldnumber == 0], minlength=final_ncorecold + 1,
+            )[1:final_ncorecold + 1]
+            ncorecoldwarmpix = ncorecoldwarmpix + nexpandpix
 
             ##############################################################################
             # Save final matrices
@@ -424,6 +317,38 @@ def label_and_grow_cold_clouds(
     }
 
 
+def renumber_sorted_features(label_number2d, sorted_number1d, sorted_npix):
+    """
+    Renumber labeled features in sorted order using a lookup table.
+
+    Features are renumbered consecutively from 1 following sorted_number1d.
+    Features whose number of pixels do not match sorted_npix are removed.
+
+    Args:
+        label_number2d: np.array
+            Array containing labeled feature numbers (1 to number of features).
+        sorted_number1d: np.array
+            Array containing feature numbers in sorted order.
+        sorted_npix: np.array
+            Array containing number of pixels for each sorted feature.
+
+    Returns:
+        sorted_number2d: np.array
+            Array containing renumbered features.
+        ivalidfeatures: np.array
+            Indices of the sorted features that are kept.
+    """
+    nfeatures = len(sorted_number1d)
+    # Count number of pixels for each feature
+    label_npix = np.bincount(label_number2d[label_number2d > 0], minlength=nfeatures + 1)
+    ivalidfeatures = np.nonzero(label_npix[sorted_number1d] == sorted_npix)[0]
+    # New feature numbers start from 1 in sorted order
+    lut = np.zeros(nfeatures + 1, dtype=int)
+    lut[sorted_number1d[ivalidfeatures]] = np.arange(1, len(ivalidfeatures) + 1)
+    sorted_number2d = apply_renumber_lookup(lut, label_number2d)
+    return sorted_number2d, ivalidfeatures
+
+
 def find_and_label_cold_cores(smoothir, thresh_core):
     """
     Label cold cores using ndimage.label.
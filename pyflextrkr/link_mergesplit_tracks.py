@@ -4,7 +4,7 @@ import os
 import sys
 import xarray as xr
 import logging
-from pyflextrkr.ft_utilities import load_sparse_trackstats
+from pyflextrkr.ft_utilities import load_sparse_trackstats, link_mergesplit_entries
 
 def link_mergesplit_tracks(config):
     """
@@ -38,6 +38,7 @@ def link_mergesplit_tracks(config):
     fillval = config["fillval"]
     fillval_f = np.nan
     max_trackduration = int(max(duration_range))
+    mergesplit_sparse = config.get("mergesplit_sparse", 0)
 
     np.set_printoptions(threshold=np.inf)
     logger = logging.getLogger(__name__)
@@ -67,7 +68,6 @@ def link_mergesplit_tracks(config):
     trackstat_area = sparse_dict["area"]
     basetime = sparse_dict["base_time"]
     cloudnumbers = sparse_dict["cloudnumber"]
-    track_status = sparse_dict["track_status"]
 
     logger.info(f"Number of tracks to process: {ntracks_all}")
 
@@ -85,7 +85,7 @@ def link_mergesplit_tracks(config):
         (trackstat_maxarea >= maintrack_area_thresh)
     ))[0]
     # Provide warning message and exit if no main track identified
-    if maintrack_idx == []:
+    if len(maintrack_idx) == 0:
         logger.critical("WARNING: No main track identified.")
         logger.critical(f"Tracking will now exit.")
         sys.exit()
@@ -94,144 +94,67 @@ def link_mergesplit_tracks(config):
     ntracks_main = len(maintrack_idx)
     logger.info(f"Number of main track defined: {ntracks_main}")
 
-    # maintrack_idx is the index number, want the track number so add one
-    maintracknumbers = np.copy(maintrack_idx) + 1
-
     ###################################################################################
     # Find small merge or split tracks and link to main tracks
-    merge_cloudnumber = np.full((ntracks_main, max_trackduration, nmaxmerge), fillval, dtype=np.int32)
-    merge_status = np.full((ntracks_main, max_trackduration, nmaxmerge), fillval, dtype=np.int32)
-    merge_area = np.full((ntracks_main, max_trackduration, nmaxmerge), fillval_f, dtype=np.float32)
-    split_cloudnumber = np.full((ntracks_main, max_trackduration, nmaxmerge), fillval, dtype=np.int32)
-    split_status = np.full((ntracks_main, max_trackduration, nmaxmerge), fillval, dtype=np.int32)
-    split_area = np.full((ntracks_main, max_trackduration, nmaxmerge), fillval_f, dtype=np.float32)
-
-    # Loop through each main track and link small clouds merging in
-    for itrack in np.arange(0, ntracks_main):
-        ###################################################################################
-        # Find tracks that end as merging with the main track
-        mergetrack_idx = np.where(end_merge_tracknumber == maintracknumbers[itrack])[0]
-        if len(mergetrack_idx) > 0:
-            # Isolate merge tracks that have short duration
-            mergetrack_idx = mergetrack_idx[trackstat_lifetime[mergetrack_idx] < merge_duration]
-
-            # Make sure the merge tracks are not main track
-            mergetrack_idx = mergetrack_idx[np.isin(mergetrack_idx, maintracknumbers, invert=True)]
-            if len(mergetrack_idx) > 0:
-                # Get data for merging tracks
-                mergingcloudnumber = cloudnumbers[mergetrack_idx, :].data
-                mergingbasetime = basetime[mergetrack_idx, :].data
-                mergingstatus = track_status[mergetrack_idx, :].data
-                mergingarea = trackstat_area[mergetrack_idx, :].data
-
-                # Get main track basetime
-                itrack_bt = basetime[int(maintracknumbers[itrack]) - 1, :].data
-
-                # Loop through each timestep in the main track
-                for t in np.arange(0, len(itrack_bt)):
-                    # Find merging cloud times that match current main track time
-                    timematch = np.where(mergingbasetime == itrack_bt[int(t)])[0]
-                    nmergers = len(timematch)
-                    if nmergers > 0:
-                        # Find the smaller value between the two
-                        # to make sure it fits into the array
-                        nmergers_sav = np.min([nmergers, nmaxmerge])
-                        merge_cloudnumber[itrack, int(t), 0:nmergers_sav] = mergingcloudnumber[
-                            timematch[0:nmergers_sav]]
-                        merge_status[itrack, int(t), 0:nmergers_sav] = mergingstatus[timematch[0:nmergers_sav]]
-                        merge_area[itrack, int(t), 0:nmergers_sav] = mergingarea[timematch[0:nmergers_sav]]
-                        if (nmergers > nmaxmerge):
-                            logger.warning(f'WARNING: nmergers ({nmergers}) > nmaxmerge ({nmaxmerge}), ' + \
-                                           'only partial merge clouds are saved.')
-                            logger.warning(f'Main track index: {itrack}')
-                            logger.warning(f'Increase nmaxmerge to avoid this WARNING.')
-
-        ###################################################################################
-        # Find tracks that split from the main track
-        splittrack_idx = np.where(start_split_tracknumber == maintracknumbers[itrack])[0]
-        if len(splittrack_idx) > 0:
-            # Isolate split tracks that have short duration
-            splittrack_idx = splittrack_idx[trackstat_lifetime[splittrack_idx] < split_duration]
-
-            # Make sure the split tracks are not main track
-            splittrack_idx = splittrack_idx[np.isin(splittrack_idx, maintracknumbers, invert=True)]
-            if len(splittrack_idx) > 0:
-                # Get data for split tracks
-                splittingcloudnumber = cloudnumbers[splittrack_idx, :].data
-                splittingbasetime = basetime[splittrack_idx, :].data
-                splittingstatus = track_status[splittrack_idx, :].data
-                splittingarea = trackstat_area[splittrack_idx, :].data
-
-                # Get main track basetime
-                itrack_bt = basetime[int(maintracknumbers[itrack]) - 1, :].data
-
-                # Loop through each timestep in the main track
-                for t in np.arange(0, len(itrack_bt)):
-                    # Find splitting cloud times that match current main track time
-                    timematch = np.where(splittingbasetime == itrack_bt[int(t)])[0]
-                    nspliters = len(timematch)
-                    if nspliters > 0:
-                        # Find the smaller value between the two
-                        # to make sure it fits into the array
-                        nspliters_sav = np.min([nspliters, nmaxmerge])
-                        split_cloudnumber[itrack, int(t), 0:nspliters_sav] = splittingcloudnumber[
-                            timematch[0:nspliters_sav]]
-                        split_status[itrack, int(t), 0:nspliters_sav] = splittingstatus[timematch[0:nspliters_sav]]
-                        split_area[itrack, int(t), 0:nspliters_sav] = splittingarea[timematch[0:nspliters_sav]]
-                        if (nspliters > nmaxmerge):
-                            logger.warning(f'WARNING: nspliters ({nspliters}) > nmaxmerge ({nmaxmerge}), ' + \
-                                           'only partial split clouds are saved.')
-                            logger.warning(f'Main track index: {itrack}')
-                            logger.warning(f'Increase nmaxmerge to avoid this WARNING.')
-
+    # Each sparse entry is a (track, time) pair ordered by track then time
+    entry_track = np.repeat(np.arange(ntracks_all), np.diff(basetime.indptr))
+    entry_time = basetime.indices
+    # Sparse entries of the main tracks
+    ismaintrack = np.zeros(ntracks_all, dtype=bool)
+    ismaintrack[maintrack_idx] = True
+    main_entry_idx = np.nonzero(ismaintrack[entry_track])[0]
+    nentries_main = len(main_entry_idx)
+    main_entry_track = np.searchsorted(maintrack_idx, entry_track[main_entry_idx])
+    main_entry_time = entry_time[main_entry_idx]
+
+    # Merge/split clouds at each main track entry
+    merge_cloudnumber = np.full((nentries_main, nmaxmerge), fillval, dtype=np.int32)
+    merge_area = np.full((nentries_main, nmaxmerge), fillval_f, dtype=np.float32)
+    split_cloudnumber = np.full((nentries_main, nmaxmerge), fillval, dtype=np.int32)
+    split_area = np.full((nentries_main, nmaxmerge), fillval_f, dtype=np.float32)
+
+    # Join merging tracks to the main track entries at the same time
+    main_entry, link_rank, link_entry = link_mergesplit_entries(
+        end_merge_tracknumber, trackstat_lifetime < merge_duration, maintrack_idx,
+        entry_track, basetime.data, nmaxmerge, link_type="merge",
+    )
+    imain = np.searchsorted(main_entry_idx, main_entry)
+    merge_cloudnumber[imain, link_rank] = cloudnumbers.data[link_entry]
+    merge_area[imain, link_rank] = trackstat_area.data[link_entry]
+
+    # Join splitting tracks to the main track entries at the same time
+    main_entry, link_rank, link_entry = link_mergesplit_entries(
+        start_split_tracknumber, trackstat_lifetime < split_duration, maintrack_idx,
+        entry_track, basetime.data, nmaxmerge, link_type="split",
+    )
+    imain = np.searchsorted(main_entry_idx, main_entry)
+    split_cloudnumber[imain, link_rank] = cloudnumbers.data[link_entry]
+    split_area[imain, link_rank] = trackstat_area.data[link_entry]
 
     ###########################################################################
     # Prepare output dataset
+    # The main track entries stay sparse until here, dense arrays are only created for the output
 
-    # Subset tracks in sparse array dictionary
-    for ivar in sparse_dict.keys():
-        sparse_dict[ivar] = sparse_dict[ivar][maintrack_idx, :]
     # Remove the tracks/times indices variables
     sparse_dict.pop(tracks_idx_varname, None)
     sparse_dict.pop(times_idx_varname, None)
-
-    # Create a dense mask for no clouds
-    mask = sparse_dict['base_time'].toarray() == 0
-    # Convert sparse dictionary to dataset
-    varlist = {}
-    # Define output variable dictionary
-    for key, value in sparse_dict.items():
-        dense_array = value.toarray()
-        # Replace missing values based on variable type
-        if isinstance(dense_array[0, 0], np.floating):
-            dense_array[mask] = fillval_f
-        else:
-            dense_array[mask] = fillval
-        varlist[key] = ([tracks_dimname, times_dimname], dense_array, sparse_attrs_dict[key])
-    # Define coordinate
-    tracks_coord = np.arange(0, ntracks_main)
-    times_coord = np.arange(0, max_trackduration)
-    coordlist = {
-        tracks_dimname: ([tracks_dimname], tracks_coord),
-        times_dimname: ([times_dimname], times_coord),
-    }
-    # Define 2D Xarray dataset
-    ds_2d = xr.Dataset(varlist, coords=coordlist)
-    # Subset main tracks from 1D dataset
-    # Note: the tracks_dimname cannot be used here as Xarray does not seem to have
-    # a method to select data with a string variable
-    ds_1d = ds_1d.sel(tracks=maintrack_idx)
-    # Replace tracks coordinate
-    ds_1d[tracks_dimname] = tracks_coord
-    # Merge 1D & 2D datasets
-    dsout = xr.merge([ds_1d, ds_2d], compat="override", combine_attrs="no_conflicts")
     # Remove no use variables
     drop_vars_list = [
         "merge_tracknumbers", "split_tracknumbers",
         "start_split_tracknumber", "start_split_timeindex",
         "end_merge_tracknumber", "end_merge_timeindex",
     ]
-    dsout = dsout.drop_vars(drop_vars_list, errors='ignore')
+    for ivar in drop_vars_list:
+        sparse_dict.pop(ivar, None)
+
+    # Define coordinate
+    tracks_coord = np.arange(0, ntracks_main)
+    times_coord = np.arange(0, max_trackduration)
+    sparse_dimname = "sparse_index"
+    sparse_coord = np.arange(0, nentries_main)
+    # Create mergers/splits coordinates
+    mergers_dimname = "mergers"
+    mergers_coord = np.arange(0, nmaxmerge)
 
     # Define new variables dictionary
     var_dict = {
@@ -263,28 +186,57 @@ def link_mergesplit_tracks(config):
         },
     }
 
-    # Create mergers/splits coordinates
-    mergers_dimname = "mergers"
-    mergers_coord = np.arange(0, nmaxmerge)
-
-    # Define output variable dictionary
-    varlist = {}
-    for key, value in var_dict.items():
-        if value.ndim == 1:
-            varlist[key] = ([tracks_dimname], value, var_attrs[key])
-        if value.ndim == 2:
-            varlist[key] = ([tracks_dimname, times_dimname], value, var_attrs[key])
-        if value.ndim == 3:
-            varlist[key] = ([tracks_dimname, times_dimname, mergers_dimname], value, var_attrs[key])
-    # Define coordinate list
-    coordlist = {
-        tracks_dimname: ([tracks_dimname], tracks_coord),
-        times_dimname: ([times_dimname], times_coord),
-        mergers_dimname: ([mergers_dimname], mergers_coord),
-    }
-    # Define extra variable Dataset
+    if mergesplit_sparse == 1:
+        # Keep the main track entries in sparse format
+        varlist = {}
+        for key, value in sparse_dict.items():
+            varlist[key] = ([sparse_dimname], value.data[main_entry_idx], sparse_attrs_dict[key])
+        varlist[tracks_idx_varname] = ([sparse_dimname], main_entry_track, sparse_attrs_dict[tracks_idx_varname])
+        varlist[times_idx_varname] = ([sparse_dimname], main_entry_time, sparse_attrs_dict[times_idx_varname])
+        for key, value in var_dict.items():
+            varlist[key] = ([sparse_dimname, mergers_dimname], value, var_attrs[key])
+        coordlist = {
+            tracks_dimname: ([tracks_dimname], tracks_coord),
+            sparse_dimname: ([sparse_dimname], sparse_coord),
+            mergers_dimname: ([mergers_dimname], mergers_coord),
+        }
+    else:
+        # Create a dense mask for no clouds
+        mask = np.ones((ntracks_main, max_trackduration), dtype=bool)
+        mask[main_entry_track, main_entry_time] = basetime.data[main_entry_idx] == 0
+        # Convert sparse entries to dense arrays
+        varlist = {}
+        for key, value in sparse_dict.items():
+            dense_array = np.zeros((ntracks_main, max_trackduration), dtype=value.dtype)
+            dense_array[main_entry_track, main_entry_time] = value.data[main_entry_idx]
+            # Replace missing values based on variable type
+            if np.issubdtype(dense_array.dtype, np.floating):
+                dense_array[mask] = fillval_f
+            else:
+                dense_array[mask] = fillval
+            varlist[key] = ([tracks_dimname, times_dimname], dense_array, sparse_attrs_dict[key])
+        for key, value in var_dict.items():
+            dense_array = np.full((ntracks_main, max_trackduration, nmaxmerge),
+                                  var_attrs[key]["_FillValue"], dtype=value.dtype)
+            dense_array[main_entry_track, main_entry_time] = value
+            varlist[key] = ([tracks_dimname, times_dimname, mergers_dimname], dense_array, var_attrs[key])
+        coordlist = {
+            tracks_dimname: ([tracks_dimname], tracks_coord),
+            times_dimname: ([times_dimname], times_coord),
+            mergers_dimname: ([mergers_dimname], mergers_coord),
+        }
+    # Define stats Dataset
     ds_vars = xr.Dataset(varlist, coords=coordlist)
 
+    # Subset main tracks from 1D dataset
+    # Note: the tracks_dimname cannot be used here as Xarray does not seem to have
+    # a method to select data with a string variable
+    ds_1d = ds_1d.sel(tracks=maintrack_idx)
+    # Replace tracks coordinate
+    ds_1d[tracks_dimname] = tracks_coord
+    # Remove no use variables
+    dsout = ds_1d.drop_vars(drop_vars_list, errors='ignore')
+
     # Merge Datasets
     dsout = xr.merge([dsout, ds_vars], compat="override", combine_attrs="no_conflicts")
     # Update global attributes
@@ -21,7 +21,7 @@ def mapfeature_driver(
         config: dictionary
             Dictionary containing config parameters.
         trackstats_filebase: string, default="trackstats_"
-            Track statistics file basename.
+            Track statistics file basename, dense or sparse (e.g., "trackstats_sparse_") format.
         outpath_basename: string, default=None
             Output path basename for pixel-level files.
             If None, pixeltracking_outpath defaults to config["pixeltracking_outpath"].
@@ -58,28 +58,38 @@ def mapfeature_driver(
     # feature_type = config["feature_type"]
     nmaxlinks = config["nmaxlinks"]
     tracks_dimname = config.get("tracks_dimname", "tracks")
-    times_dimname = config.get("times_dimname", "times")
     fillval = config.get("fillval", -9999)
 
     #########################################################################################
     # Read track stats
+    # Both dense (tracks, times) and sparse (sparse_index) track stats files are supported
     trackstats_file = f"{stats_path}{trackstats_filebase}{startdate}_{enddate}.nc"
     ds = xr.open_dataset(
         trackstats_file,
         mask_and_scale=False,
         decode_times=False,
-    ).compute()
+    )
     # Get track stats variable names
     stats_varnames = list(ds.data_vars)
-    # Get track stats dimensions
-    ntracks = ds.sizes[tracks_dimname]
-    ntimes = ds.sizes[times_dimname]
-    # Get track variables
-    stats_basetime = ds["base_time"].data
-    stats_cloudnumber = ds["cloudnumber"].data
-    stats_trackstatus = ds["track_status"].data
     trackstats_comments = ds["track_status"].comments
-    ds.close()
+
+    # Get the (track, time) entries with valid base time
+    # Track stats are sparse if base_time is on the sparse dimension
+    # (e.g., PF statistics may be sparse while the track variables are dense)
+    sparse_dimname = "sparse_index"
+    if (ds["base_time"].dims == (sparse_dimname,)) and (f"{tracks_dimname}_indices" in ds):
+        entry_track = ds[f"{tracks_dimname}_indices"].values
+        entry_basetime = ds["base_time"].values
+        entry_idx = np.arange(0, len(entry_basetime))
+    else:
+        stats_basetime = ds["base_time"].values
+        entry_track, entry_time = np.where(np.isfinite(stats_basetime))
+        entry_basetime = stats_basetime[entry_track, entry_time]
+        entry_idx = (entry_track, entry_time)
+    nentries = len(entry_basetime)
+    # Get track variables for each entry
+    stats_cloudnumber = ds["cloudnumber"].values[entry_idx]
+    stats_trackstatus = ds["track_status"].values[entry_idx]
 
     # Put merge/split tracknumbers & cloudnumbers in a list
     ms_tracknumber = ["merge_tracknumbers", "split_tracknumbers"]
@@ -87,19 +97,25 @@ def mapfeature_driver(
 
     # Check if tracknumber are in the stats dataset
     if (set(ms_tracknumber).issubset(set(stats_varnames))):
-        stats_mergetracknumber = ds["merge_tracknumbers"].data
-        stats_splittracknumber = ds["split_tracknumbers"].data
+        stats_mergetracknumber = ds["merge_tracknumbers"].values[entry_idx]
+        stats_splittracknumber = ds["split_tracknumbers"].values[entry_idx]
     else:
-        stats_mergetracknumber = np.full((ntracks, ntimes), fillval, dtype=int)
-        stats_splittracknumber = np.full((ntracks, ntimes), fillval, dtype=int)
+        stats_mergetracknumber = np.full(nentries, fillval, dtype=int)
+        stats_splittracknumber = np.full(nentries, fillval, dtype=int)
 
     # Check if cloudnumber are in the stats dataset
     if (set(ms_cloudnumber).issubset(set(stats_varnames))):
-        stats_mergecloudnumber = ds["merge_cloudnumber"].data
-        stats_splitcloudnumber = ds["split_cloudnumber"].data
+        stats_mergecloudnumber = ds["merge_cloudnumber"].values[entry_idx]
+        stats_splitcloudnumber = ds["split_cloudnumber"].values[entry_idx]
     else:
-        stats_mergecloudnumber = np.full((ntracks, ntimes, nmaxlinks), fillval, dtype=int)
-        stats_splitcloudnumber = np.full((ntracks, ntimes, nmaxlinks), fillval, dtype=int)
+        stats_mergecloudnumber = np.full((nentries, nmaxlinks), fillval, dtype=int)
+        stats_splitcloudnumber = np.full((nentries, nmaxlinks), fillval, dtype=int)
+    ntracks = ds.sizes[tracks_dimname]
+    ds.close()
+
+    # Sort the entries by base time to look up the entries of each file
+    basetime_order = np.argsort(entry_basetime, kind="stable")
+    sorted_basetime = entry_basetime[basetime_order]
 
     #########################################################################################
     # Identify files to process
@@ -118,20 +134,21 @@ def mapfeature_driver(
     results = []
     # Loop over each pixel file
     for ifile in range(0, nfiles):
-        # Find all matching time indices from stats file to the current cloudid file
-        itrack, itime = np.array(
-            np.where(
-                np.abs(stats_basetime - cloudidfiles_basetime[ifile]) < match_pixel_dt_thresh)
-        )
+        # Find all matching entries from stats file to the current cloudid file
+        # (entries with base time within match_pixel_dt_thresh of the file time)
+        istart = np.searchsorted(sorted_basetime, cloudidfiles_basetime[ifile] - match_pixel_dt_thresh, side="right")
+        iend = np.searchsorted(sorted_basetime, cloudidfiles_basetime[ifile] + match_pixel_dt_thresh, side="left")
+        # Keep the entries in track order
+        ientry = np.sort(basetime_order[istart:iend])
 
         # Get cloudnumbers for this time (file)
-        file_trackindex = itrack
-        file_cloudnumber = stats_cloudnumber[itrack, itime]
-        file_trackstatus = stats_trackstatus[itrack, itime]
+        file_trackindex = entry_track[ientry]
+        file_cloudnumber = stats_cloudnumber[ientry]
+        file_trackstatus = stats_trackstatus[ientry]
 
         # Cloudnumbers for merge/split
-        file_mergecloudnumber = stats_mergecloudnumber[itrack, itime, :]
-        file_splitcloudnumber = stats_splitcloudnumber[itrack, itime, :]
+        file_mergecloudnumber = stats_mergecloudnumber[ientry, :]
+        file_splitcloudnumber = stats_splitcloudnumber[ientry, :]
         if (file_mergecloudnumber.size > 0) & (file_splitcloudnumber.size > 0):
             # Get number of max merge/split for all clouds at this time (file)
             max_merge = np.sum(file_mergecloudnumber > 0, axis=1).max()
@@ -141,8 +158,8 @@ def mapfeature_driver(
             file_splitcloudnumber = file_splitcloudnumber[:, :max_split]
 
         # General merge/split tracknumber
-        file_mergetracknumber = stats_mergetracknumber[itrack, itime]
-        file_splittracknumber = stats_splittracknumber[itrack, itime]
+        file_mergetracknumber = stats_mergetracknumber[ientry]
+        file_splittracknumber = stats_splittracknumber[ientry]
 
         # Serial
         if run_parallel == 0:
@@ -160,6 +177,7 @@ def mapfeature_driver(
                 config,
                 pixeltracking_outpath,
                 pixeltracking_filebase,
+                ntracks=ntracks,
             )
         # Parallel
         elif run_parallel >= 1:
@@ -177,6 +195,7 @@ def mapfeature_driver(
                 config,
                 pixeltracking_outpath,
                 pixeltracking_filebase,
+                ntracks=ntracks,
             )
             results.append(result)
         else:
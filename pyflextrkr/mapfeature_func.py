@@ -18,6 +18,7 @@ def map_feature(
         config,
         pixeltracking_outpath,
         pixeltracking_filebase,
+        ntracks=None,
 ):
     """
     Map track numbers to pixel level files for all feature tracking.
@@ -49,6 +50,8 @@ def map_feature(
             Output directory for pixel-level files.
         pixeltracking_filebase: string
             Output pixel-level file basename.
+        ntracks: int, default=None
+            Number of tracks, used to choose the track map data type if pixeltracking_newvars_only=1.
 
     Returns:
         tracksmap_outfile: string
@@ -60,6 +63,11 @@ def map_feature(
     y_dimname = "lat"
     x_dimname = "lon"
     fillval = config.get("fillval", -9999)
+    # Write only the track maps, with a narrow data type
+    newvars_only = config.get("pixeltracking_newvars_only", 0)
+    chunksize = config.get("pixeltracking_chunksize", 512)
+    # Field used by the movement speed step, kept for pixeltracking_newvars_only=1
+    track_field_for_speed = config.get("track_field_for_speed", None)
 
     np.set_printoptions(threshold=np.inf)
     logger = logging.getLogger(__name__)
@@ -90,96 +98,72 @@ def map_feature(
 
     ################################################################
     # Create map of status and track number for every feature in this file
-    statusmap = np.full((1, ny, nx), fillval, dtype=int)
-    trackmap = np.zeros((1, ny, nx), dtype=int)
-    allmergemap = np.zeros((1, ny, nx), dtype=int)
-    allsplitmap = np.zeros((1, ny, nx), dtype=int)
-
-    trackmap_include_ms = np.zeros((1, ny, nx), dtype=int)
-    trackmap_merge = np.zeros((1, ny, nx), dtype=int)
-    trackmap_split = np.zeros((1, ny, nx), dtype=int)
+    # Each map is a lookup table indexed by feature number, applied to the feature number image in one pass.
+    # Feature numbers outside the lookup table index the last element, which is never assigned.
+    label_image = np.where(feature_number >= 0, feature_number, -1).astype(np.int64)
+    nlabels = max(label_image.max(), -1) + 1
+    label_npix = np.bincount(label_image[label_image >= 0], minlength=nlabels)
+    lut_trackmap = np.zeros(nlabels + 1, dtype=int)
+    lut_statusmap = np.full(nlabels + 1, fillval, dtype=int)
+    lut_allmergemap = np.zeros(nlabels + 1, dtype=int)
+    lut_allsplitmap = np.zeros(nlabels + 1, dtype=int)
+    lut_trackmap_include_ms = np.zeros(nlabels + 1, dtype=int)
+    lut_trackmap_merge = np.zeros(nlabels + 1, dtype=int)
+    lut_trackmap_split = np.zeros(nlabels + 1, dtype=int)
 
     # Check number of matched features
     nmatchcloud = len(file_cloudnumber)
     if nmatchcloud > 0:
-        ##############################################################
-        # Loop over each instance matching the trackstats time
-        for jj in range(0, nmatchcloud):
-            # Get cloud number
-            jjcloudnumber = file_cloudnumber[jj]
-            jjstatus = file_trackstatus[jj]
-
-            # Get the mask matching this feature number
-            cmask = feature_number == jjcloudnumber
-
-            # Label this feature with the track number.
-            # Need to add one to the cloud number since have the index number and we want the track number
-            if np.count_nonzero(cmask) > 0:
-                trackmap[0, cmask] = file_trackindex[jj] + 1
-                trackmap_include_ms[0, cmask] = file_trackindex[jj] + 1
-                statusmap[0, cmask] = jjstatus
-            else:
-                logger.warning(f"Warning: No matching cloud pixel found: {jjcloudnumber}")
+        file_cloudnumber = np.asarray(file_cloudnumber)
+        # Track number: need to add one to the track index
+        file_tracknumber = np.asarray(file_trackindex) + 1
+        # Splitting/merging clouds, in the order of the matched features, then the merge/split slots
+        isplit_cloud, isplit_slot = np.where(file_splitcloudnumber > 0)
+        imerge_cloud, imerge_slot = np.where(file_mergecloudnumber > 0)
+        split_number = file_splitcloudnumber[isplit_cloud, isplit_slot]
+        merge_number = file_mergecloudnumber[imerge_cloud, imerge_slot]
 
-            ###########################################################
-            # Find splitting clouds
-            jjsplit = np.where(file_splitcloudnumber[jj, :] > 0)[0]
-            # Loop through splitting clouds if present
-            if len(jjsplit) > 0:
-                for isplit in jjsplit:
-                    # Get mask matching the splitting cloud
-                    is_number = file_splitcloudnumber[jj, isplit]
-                    s_cmask = feature_number == is_number
-                    # Label this cloud with the track number
-                    if np.count_nonzero(s_cmask) > 0:
-                        trackmap_include_ms[0, s_cmask] = file_trackindex[jj] + 1
-                        trackmap_split[0, s_cmask] = file_trackindex[jj] + 1
-                    else:
-                        logger.warning(f"Warning: No matching splitting cloud found: {is_number}")
+        # Label the features with the track number
+        set_label_lookup(lut_trackmap, file_cloudnumber, file_tracknumber, label_npix)
+        set_label_lookup(lut_statusmap, file_cloudnumber, file_trackstatus, label_npix)
+        # Label splitting/merging clouds with the track number
+        set_label_lookup(lut_trackmap_split, split_number, file_tracknumber[isplit_cloud], label_npix)
+        set_label_lookup(lut_trackmap_merge, merge_number, file_tracknumber[imerge_cloud], label_npix)
+        # Track number including merge/split: each feature, then its splitting clouds, then its merging clouds
+        ms_number = np.concatenate((file_cloudnumber, split_number, merge_number))
+        ms_cloud = np.concatenate((np.arange(nmatchcloud), isplit_cloud, imerge_cloud))
+        ms_type = np.concatenate((np.zeros(nmatchcloud, dtype=int),
+                                  np.ones(len(split_number), dtype=int),
+                                  np.full(len(merge_number), 2, dtype=int)))
+        ms_order = np.lexsort((ms_type, ms_cloud))
+        ms_number, ms_cloud, ms_type = ms_number[ms_order], ms_cloud[ms_order], ms_type[ms_order]
+        ms_found = set_label_lookup(lut_trackmap_include_ms, ms_number, file_tracknumber[ms_cloud], label_npix)
 
-            ###########################################################
-            # Find merging clouds
-            jjmerge = np.where(file_mergecloudnumber[jj, :] > 0)[0]
-            # Loop through merging clouds if present
-            if len(jjmerge) > 0:
-                for imerge in jjmerge:
-                    # Get mask matching the merging cloud
-                    im_number = file_mergecloudnumber[jj, imerge]
-                    m_cmask = feature_number == im_number
-                    # Label this cloud with the track number
-                    if np.count_nonzero(m_cmask) > 0:
-                        trackmap_include_ms[0, m_cmask] = file_trackindex[jj] + 1
-                        trackmap_merge[0, m_cmask] = file_trackindex[jj] + 1
-                    else:
-                        logger.warning(f"Warning: No matching merging cloud found: {im_number}")
+        # Warn for features not found in this file
+        warning_messages = [
+            "Warning: No matching cloud pixel found: ",
+            "Warning: No matching splitting cloud found: ",
+            "Warning: No matching merging cloud found: ",
+        ]
+        for imiss in np.where(~ms_found)[0]:
+            logger.warning(f"{warning_messages[ms_type[imiss]]}{ms_number[imiss]}")
 
-            ###########################################################
-            # Get split tracknumber within this time
-            jjallsplit = file_splittracknumber[jj]
-            # Count valid split cloudnumbers (> 0)
-            splitpresent = np.count_nonzero(jjallsplit > 0)
-            if splitpresent > 0:
-                # Find valid split tracknumbers (> 0)
-                splittracks = jjallsplit[jjallsplit > 0]
-                splitcloudid = jjcloudnumber[jjallsplit > 0]
-                if len(splittracks) > 0:
-                    for isplit in range(0, len(splittracks)):
-                        s_cmask = feature_number == splitcloudid[isplit]
-                        allsplitmap[0, s_cmask] = splittracks[isplit]
+        # Label the features with the split/merge track number
+        file_splittracknumber = np.asarray(file_splittracknumber)
+        file_mergetracknumber = np.asarray(file_mergetracknumber)
+        isplit = file_splittracknumber > 0
+        imerge = file_mergetracknumber > 0
+        set_label_lookup(lut_allsplitmap, file_cloudnumber[isplit], file_splittracknumber[isplit], label_npix)
+        set_label_lookup(lut_allmergemap, file_cloudnumber[imerge], file_mergetracknumber[imerge], label_npix)
 
-            ###########################################################
-            # Get merge tracknumber within this time
-            jjallmerge = file_mergetracknumber[jj]
-            # Count valid split cloudnumbers (> 0)
-            mergepresent = np.count_nonzero(jjallmerge > 0)
-            if mergepresent > 0:
-                # Find valid merge tracknumbers (> 0)
-                mergetracks = jjallmerge[jjallmerge > 0]
-                mergecloudid = jjcloudnumber[jjallmerge > 0]
-                if len(mergetracks) > 0:
-                    for imerge in range(0, len(mergetracks)):
-                        m_cmask = feature_number == mergecloudid[imerge]
-                        allmergemap[0, m_cmask] = mergetracks[imerge]
+    # Apply the lookup tables to the feature number image
+    trackmap = lut_trackmap[label_image][np.newaxis, :, :]
+    statusmap = lut_statusmap[label_image][np.newaxis, :, :]
+    allmergemap = lut_allmergemap[label_image][np.newaxis, :, :]
+    allsplitmap = lut_allsplitmap[label_image][np.newaxis, :, :]
+    trackmap_include_ms = lut_trackmap_include_ms[label_image][np.newaxis, :, :]
+    trackmap_merge = lut_trackmap_merge[label_image][np.newaxis, :, :]
+    trackmap_split = lut_trackmap_split[label_image][np.newaxis, :, :]
 
 
     # Handle special variables for specific feature_type
@@ -256,8 +240,28 @@ def map_feature(
         }
         pcptrackmap = xr.DataArray(pcptrackmap, coords=coords, dims=dims_keep, attrs=pcptrackmap_attrs)
 
-    # Create a copy of the input dataset
-    ds_out = ds_in.copy(deep=True)
+    if newvars_only == 1:
+        # Only keep the coordinates, input variables are referenced by the cloudid file name
+        ds_out = xr.Dataset(coords=ds_in.coords, attrs=ds_in.attrs)
+        ds_out.attrs["cloudid_file"] = os.path.basename(cloudid_filename)
+        # Keep the field needed to calculate the movement speed
+        if (track_field_for_speed is not None) and (track_field_for_speed in ds_in.data_vars):
+            ds_out[track_field_for_speed] = ds_in[track_field_for_speed]
+        # Choose the smallest integer type that holds the track numbers and fill value
+        maxvalue = max(ntracks if ntracks is not None else np.iinfo(np.int32).max, abs(fillval))
+        map_dtype = np.int16 if maxvalue <= np.iinfo(np.int16).max else np.int32
+        trackmap = trackmap.astype(map_dtype)
+        allmergemap = allmergemap.astype(map_dtype)
+        allsplitmap = allsplitmap.astype(map_dtype)
+        statusmap = statusmap.astype(map_dtype)
+        trackmap_include_ms = trackmap_include_ms.astype(map_dtype)
+        trackmap_merge = trackmap_merge.astype(map_dtype)
+        trackmap_split = trackmap_split.astype(map_dtype)
+        if feature_type == "tb_pf":
+            pcptrackmap = pcptrackmap.astype(map_dtype)
+    else:
+        # Create a copy of the input dataset
+        ds_out = ds_in.copy(deep=True)
 
     # Assign new variables to output dataset
     ds_out = ds_out.assign(tracknumber=trackmap)
@@ -290,6 +294,9 @@ def map_feature(
 
     # Set encoding/compression for all variables
     comp = dict(zlib=True)
+    if newvars_only == 1:
+        # Chunk the track maps by tiles of the grid
+        comp["chunksizes"] = (1, min(ny, chunksize), min(nx, chunksize))
     encoding = {var: comp for var in ds_out.data_vars}
     # Write to netCDF file
     ds_out.to_netcdf(
@@ -301,4 +308,35 @@ def map_feature(
     )
     logger.info(f"{tracksmap_outfile}")
 
-    return tracksmap_outfile
\ No newline at end of file
+    return tracksmap_outfile
+
+
+def set_label_lookup(lut, labels, values, label_npix):
+    """
+    Set values for feature labels in a lookup table.
+
+    Labels are assigned in order, so a repeated label gets the last value.
+
+    Args:
+        lut: np.array
+            Lookup table indexed by feature number. Updated in place.
+        labels: np.array
+            Feature numbers.
+        values: np.array
+            Values for each feature number.
+        label_npix: np.array
+            Number of pixels for each feature number in the feature number image.
+
+    Returns:
+        found: np.array
+            True for labels that have pixels in the feature number image.
+    """
+    labels = np.asarray(labels)
+    values = np.asarray(values)
+    found = (labels >= 0) & (labels < len(label_npix))
+    found[found] = label_npix[labels[found].astype(np.int64)] > 0
+    # Keep the last occurrence of each label
+    ilabels = labels[found].astype(np.int64)[::-1]
+    _, ilast = np.unique(ilabels, return_index=True)
+    lut[ilabels[ilast]] = values[found][::-1][ilast]
+    return found
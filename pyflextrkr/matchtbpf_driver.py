@@ -6,7 +6,7 @@ import time
 import logging
 import dask
 from dask.distributed import wait
-from pyflextrkr.ft_utilities import subset_files_timerange
+from pyflextrkr.ft_utilities import subset_files_timerange, write_stats_parquet
 from pyflextrkr.matchtbpf_func import matchtbpf_singlefile
 
 def match_tbpf_tracks(config):
@@ -35,6 +35,11 @@ def match_tbpf_tracks(config):
     pf_dimname = config["pf_dimname"]
     run_parallel = config["run_parallel"]
     fillval = config["fillval"]
+    # Write PF statistics in sparse format
+    pfstats_sparse = config.get("pfstats_sparse", 0)
+    sparse_dimname = "sparse_index"
+    tracks_idx_varname = f"{tracks_dimname}_indices"
+    times_idx_varname = f"{times_dimname}_indices"
     # Minimum time difference threshold [second] to match track stats and cloudid pixel files
     match_pixel_dt_thresh = config["match_pixel_dt_thresh"]
 
@@ -156,20 +161,36 @@ def match_tbpf_tracks(config):
             break
         counter += 1
 
-    # Loop over variable list to create the dictionary entry
-    pf_dict = {}
-    pf_dict_attrs = {}
-    for ivar in var_names:
-        pf_dict[ivar] = np.full((numtracks, maxtracklength, nmaxpf), np.nan, dtype=np.float32)
-        pf_dict_attrs[ivar] = var_attrs[ivar]
     # Update 2D variables
     var_names_2d = ["pf_npf",
                     "pf_landfrac",
                     "total_rain",
                     "total_heavyrain",
                     "rainrate_heavyrain"]
-    for ivar in var_names_2d:
-        pf_dict[ivar] = np.full((numtracks, maxtracklength), np.nan, dtype=np.float32)
+
+    # Sparse format: the PF variables of each matched (track, time) are stored along the sparse index,
+    # sorted by track then time, with the same tracks/times indices convention as the sparse trackstats
+    if pfstats_sparse == 1:
+        entry_track = np.concatenate(trackindices_all).astype(int)
+        entry_time = np.concatenate(timeindices_all).astype(int)
+        nentries = len(entry_track)
+        file_offsets = np.zeros(nfiles + 1, dtype=int)
+        file_offsets[1:] = np.cumsum([len(idx) for idx in trackindices_all])
+        # Position of each matched (track, time) in the sorted sparse index
+        entry_order = np.lexsort((entry_time, entry_track))
+        entry_position = np.empty(nentries, dtype=int)
+        entry_position[entry_order] = np.arange(nentries)
+
+    # Loop over variable list to create the dictionary entry
+    pf_dict = {}
+    pf_dict_attrs = {}
+    for ivar in var_names:
+        if pfstats_sparse == 1:
+            pf_shape = (nentries,) if ivar in var_names_2d else (nentries, nmaxpf)
+        else:
+            pf_shape = (numtracks, maxtracklength) if ivar in var_names_2d else (numtracks, maxtracklength, nmaxpf)
+        pf_dict[ivar] = np.full(pf_shape, np.nan, dtype=np.float32)
+        pf_dict_attrs[ivar] = var_attrs[ivar]
 
     # Collect results
     for ifile in range(0, nfiles):
@@ -179,6 +200,13 @@ def match_tbpf_tracks(config):
             # The first entry is the dictionary containing the variables
             iResult = final_result[ifile][0]
 
+            if pfstats_sparse == 1:
+                # Get sparse index for this file
+                ientry = entry_position[file_offsets[ifile]:file_offsets[ifile + 1]]
+                for ivar in var_names:
+                    pf_dict[ivar][ientry] = iResult[ivar]
+                continue
+
             # Get trackindices and timeindices for this file
             trackindices = trackindices_all[ifile]
             timeindices = timeindices_all[ifile]
@@ -193,13 +221,26 @@ def match_tbpf_tracks(config):
     # Define a dataset containing all PF variables
     varlist = {}
     # Define output variable dictionary
-    for key, value in pf_dict.items():
-        if value.ndim == 1:
-            varlist[key] = ([tracks_dimname], value, pf_dict_attrs[key])
-        if value.ndim == 2:
-            varlist[key] = ([tracks_dimname, times_dimname], value, pf_dict_attrs[key])
-        if value.ndim == 3:
-            varlist[key] = ([tracks_dimname, times_dimname, pf_dimname], value, pf_dict_attrs[key])
+    if pfstats_sparse == 1:
+        for key, value in pf_dict.items():
+            if value.ndim == 1:
+                varlist[key] = ([sparse_dimname], value, pf_dict_attrs[key])
+            if value.ndim == 2:
+                varlist[key] = ([sparse_dimname, pf_dimname], value, pf_dict_attrs[key])
+        varlist[tracks_idx_varname] = ([sparse_dimname], entry_track[entry_order], {
+            "long_name": "Tracks indices for constructing sparse array",
+        })
+        varlist[times_idx_varname] = ([sparse_dimname], entry_time[entry_order], {
+            "long_name": "Times indices for constructing sparse array",
+        })
+    else:
+        for key, value in pf_dict.items():
+            if value.ndim == 1:
+                varlist[key] = ([tracks_dimname], value, pf_dict_attrs[key])
+            if value.ndim == 2:
+                varlist[key] = ([tracks_dimname, times_dimname], value, pf_dict_attrs[key])
+            if value.ndim == 3:
+                varlist[key] = ([tracks_dimname, times_dimname, pf_dimname], value, pf_dict_attrs[key])
 
     # Define coordinate list
     coordlist = {
@@ -207,6 +248,8 @@ def match_tbpf_tracks(config):
         times_dimname: ([times_dimname], np.arange(0, maxtracklength)),
         pf_dimname: ([pf_dimname], np.arange(0, nmaxpf)),
     }
+    if pfstats_sparse == 1:
+        coordlist[sparse_dimname] = ([sparse_dimname], np.arange(0, nentries))
 
     # Define global attributes
     gattrlist = {
@@ -242,4 +285,8 @@ def match_tbpf_tracks(config):
                     format="NETCDF4", unlimited_dims=tracks_dimname, encoding=encoding)
     logger.info(f"{statistics_outfile}")
 
+    # Write columnar Parquet tables
+    if config.get("stats_parquet", 0) == 1:
+        write_stats_parquet(dsout, statistics_outfile, tracks_dimname, times_dimname, config)
+
     return statistics_outfile
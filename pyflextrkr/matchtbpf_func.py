@@ -3,11 +3,11 @@ import os.path
 import sys
 import logging
 import xarray as xr
-from scipy.ndimage import label
+from scipy.ndimage import label, find_objects
 from skimage.measure import regionprops
 from math import pi
-from scipy.stats import skew
 from pyflextrkr.ftfunctions import sort_renumber
+from pyflextrkr.ft_utilities import load_static_field
 
 def matchtbpf_singlefile(
     cloudid_filename,
@@ -51,11 +51,13 @@ def matchtbpf_singlefile(
     landfrac_thresh = config.get("landfrac_thresh", 0)
     fillval = config["fillval"]
     fillval_f = np.nan
+    static_cache_size = config.get("static_cache_size", 8)
 
-    # Read landmask file
+    # Read landmask file (cached in each worker process)
     if os.path.isfile(landmask_filename):
-        dslm = xr.open_dataset(landmask_filename)
-        landmask = dslm[landmask_varname].squeeze().data
+        landmask = load_static_field(
+            landmask_filename, landmask_varname, max_entries=static_cache_size,
+        ).squeeze().data
     else:
         landmask = None
 
@@ -82,6 +84,9 @@ def matchtbpf_singlefile(
         # Number of clouds
         nmatchcloud = len(ir_cloudnumber)
 
+        # Bounding box slices of all clouds in the frame
+        cloud_slices = find_objects(np.where(cloudnumbermap > 0, cloudnumbermap, 0).astype(int))
+
         if nmatchcloud > 0:
             pf_npf = np.full(nmatchcloud, fillval, dtype=np.int16)
             pf_landfrac = np.full(nmatchcloud, fillval_f, dtype=float)
@@ -115,54 +120,28 @@ def matchtbpf_singlefile(
                 basetime[imatchcloud] = cloudid_basetime
                 # precip_basetime[imatchcloud] = cloudid_basetime
 
-                #########################################################################
-                # Intialize matrices for only MCS data
-                filteredrainratemap = np.ones((ydim, xdim), dtype=float) * np.nan
-                logger.debug(
-                    ("filteredrainratemap allocation size: ", filteredrainratemap.shape)
-                )
-
                 ############################################################################
-                # Find matching cloud number
-                icloudlocationt, icloudlocationy, icloudlocationx = np.array(
-                    np.where(cloudnumbermap == ittcloudnumber)
-                )
-                ncloudpix = len(icloudlocationy)
-
-                if ncloudpix > 0:
+                # Find the bounding box of the cloud and its merge/split clouds
+                cloud_window = get_cloud_window(cloud_slices,
+                                                ittcloudnumber,
+                                                ittmergecloudnumber,
+                                                ittsplitcloudnumber,
+                                                xdim,
+                                                ydim)
+
+                if cloud_window is not None:
                     logger.debug("IR Clouds Present")
-                    # Add merge/split cloud pixel locations
-                    icloudlocationt, \
-                    icloudlocationx, \
-                    icloudlocationy = add_merge_split_cloud_locations(cloudnumbermap,
-                                                                      icloudlocationt,
-                                                                      icloudlocationx,
-                                                                      icloudlocationy,
-                                                                      ittmergecloudnumber,
-                                                                      ittsplitcloudnumber,
-                                                                      logger)
-
-                    ########################################################################
-                    # Fill matrices with MCS data
-                    logger.debug("Fill map with data")
-                    filteredrainratemap[icloudlocationy, icloudlocationx] = np.copy(
-                        rawrainratemap[
-                            icloudlocationt, icloudlocationy, icloudlocationx
-                        ]
-                    )
+                    maxx, maxy, minx, miny, cloud_members = cloud_window
 
                     ########################################################################
                     ## Isolate small region of cloud data around mcs at this time
-                    logger.debug("Calculate new shape statistics")
-
-                    # Get cloud boundary
-                    maxx, maxy, minx, miny = get_cloud_boundary(icloudlocationx,
-                                                                icloudlocationy,
-                                                                xdim,
-                                                                ydim)
-
-                    ## Isolate smaller region around cloud shield
-                    subrainratemap = np.copy(filteredrainratemap[miny:maxy, minx:maxx])
+                    logger.debug("Fill map with data")
+                    subcloudnumbermap = cloudnumbermap[:, miny:maxy, minx:maxx]
+                    subrawrainratemap = rawrainratemap[:, miny:maxy, minx:maxx]
+                    subrainratemap = np.full((maxy - miny, maxx - minx), np.nan, dtype=float)
+                    for itime in range(subcloudnumbermap.shape[0]):
+                        submask = np.isin(subcloudnumbermap[itime], cloud_members)
+                        subrainratemap[submask] = subrawrainratemap[itime][submask]
                     # sublon = lon[miny:maxy, minx:maxx]
                     # sublat = lat[miny:maxy, minx:maxx]
 
@@ -508,129 +487,89 @@ def calc_pf_stats(
     pfaccumrain = np.full(npf_save, fillval_f, dtype=float)
     pfaccumrainheavy = np.full(npf_save, fillval_f, dtype=float)
     logger.debug(
-        "Looping through each feature to calculate statistics"
+        "Calculating statistics for all features"
     )
     logger.debug(("Number of PFs " + str(numpf)))
-    ###############################################
-    # Loop through each PF
-    for ipf in range(1, npf_save + 1):
-
-        #######################################
-        # Find indices of the PF
-        iipfy, iipfx = np.array(
-            np.where(pfnumberlabelmap == ipf)
-        )
-        niipfpix = len(iipfy)
-
-        # Find indices of the PF with heavy rain
-        iipfy_heavy, iipfx_heavy = np.array(
-            np.where(
-                (pfnumberlabelmap == ipf)
-                & (subrainratemap > heavy_rainrate_thresh)
-            )
-        )
-        niipfpix_heavy = len(iipfy_heavy)
+    if npf_save == 0:
+        logger.debug("No PF to calculate")
+    else:
+        ###############################################
+        # Sort the PF pixels by PF number (pixels of each PF in row-major order)
+        pfnumber_flat = pfnumberlabelmap.ravel()
+        ipix = np.where((pfnumber_flat >= 1) & (pfnumber_flat <= npf_save))[0]
+        ipix = ipix[np.argsort(pfnumber_flat[ipix], kind="stable")]
+        iipfy, iipfx = np.unravel_index(ipix, pfnumberlabelmap.shape)
+        niipfpix = np.bincount(pfnumber_flat[ipix], minlength=npf_save + 1)[1:]
+        # Start index of each PF in the sorted pixels
+        pf_start = np.cumsum(niipfpix) - niipfpix
 
         # Double check to make sure PF pixel count is the same
-        if niipfpix == pf_npix[ipf - 1]:
-            ##########################################
-            # Compute PF statistics
-
-            # Basic statistics
-            pfnpix[ipf - 1] = np.copy(niipfpix)
-            pfid[ipf - 1] = np.copy(int(ipf))
-            pflon[ipf - 1] = np.nanmean(
-                lon[iipfy[:] + miny, iipfx[:] + minx]
-            )
-            pflat[ipf - 1] = np.nanmean(
-                lat[iipfy[:] + miny, iipfx[:] + minx]
-            )
-            # pflon[ipf - 1] = np.nanmean(sublon[iipfy[:], iipfx[:]])
-            # pflat[ipf - 1] = np.nanmean(sublat[iipfy[:], iipfx[:]])
-
-            pfrainrate[ipf - 1] = np.nanmean(
-                subrainratemap[iipfy[:], iipfx[:]]
-            )
-            pfmaxrainrate[ipf - 1] = np.nanmax(
-                subrainratemap[iipfy[:], iipfx[:]]
-            )
-            pfskewness[ipf - 1] = skew(
-                subrainratemap[iipfy[:], iipfx[:]]
-            )
-            pfaccumrain[ipf - 1] = np.nansum(
-                subrainratemap[iipfy[:], iipfx[:]]
-            )
-            if niipfpix_heavy > 0:
-                pfaccumrainheavy[ipf - 1] = np.nansum(
-                    subrainratemap[
-                        iipfy_heavy[:], iipfx_heavy[:]
-                    ]
-                )
-
-            # Generate a binary map of PF
-            iipfflagmap = np.zeros((subdimy, subdimx), dtype=int)
-            iipfflagmap[iipfy, iipfx] = 1
-
-            # Geometric statistics
-            tfilteredrainratemap = np.copy(subrainratemap)
-            tfilteredrainratemap[
-                np.isnan(tfilteredrainratemap)
-            ] = -9999
-            pfproperties = regionprops(
-                iipfflagmap,
-                intensity_image=tfilteredrainratemap,
-            )
-            pfeccentricity[ipf - 1] = pfproperties[0].eccentricity
-            pfmajoraxis[ipf - 1] = (
-                    pfproperties[0].major_axis_length * pixel_radius
-            )
+        if np.any(niipfpix != pf_npix[0:npf_save]):
+            sys.exit("Error: PF pixel count not matching!")
 
+        ##########################################
+        # Compute PF statistics
+
+        # Basic statistics
+        pfnpix[:] = niipfpix
+        pfid[:] = np.arange(1, npf_save + 1)
+        pixrainrate = subrainratemap[iipfy, iipfx]
+        pflon[:] = segment_nanmean(lon[iipfy + miny, iipfx + minx], pf_start)
+        pflat[:] = segment_nanmean(lat[iipfy + miny, iipfx + minx], pf_start)
+        pfrainrate[:] = segment_nanmean(pixrainrate, pf_start)
+        pfmaxrainrate[:] = np.fmax.reduceat(pixrainrate, pf_start)
+        pfskewness[:] = segment_skew(pixrainrate, pf_start, niipfpix)
+        pfaccumrain[:] = np.add.reduceat(np.nan_to_num(pixrainrate, nan=0), pf_start)
+        # PF with heavy rain
+        heavyrainrate = np.where(pixrainrate > heavy_rainrate_thresh, pixrainrate, 0)
+        niipfpix_heavy = np.add.reduceat((pixrainrate > heavy_rainrate_thresh).astype(int), pf_start)
+        pfaccumrainheavy[:] = np.where(niipfpix_heavy > 0, np.add.reduceat(heavyrainrate, pf_start), fillval_f)
+
+        # Geometric statistics for all PFs
+        tfilteredrainratemap = np.copy(subrainratemap)
+        tfilteredrainratemap[
+            np.isnan(tfilteredrainratemap)
+        ] = -9999
+        pflabelmap = np.where(pfnumberlabelmap <= npf_save, pfnumberlabelmap, 0).astype(int)
+        pfproperties = regionprops(
+            pflabelmap,
+            intensity_image=tfilteredrainratemap,
+        )
+        ycentroid = np.full(npf_save, 0, dtype=float)
+        xcentroid = np.full(npf_save, 0, dtype=float)
+        yweightedcentroid = np.full(npf_save, 0, dtype=float)
+        xweightedcentroid = np.full(npf_save, 0, dtype=float)
+        for iprop in pfproperties:
+            ipf = iprop.label - 1
+            pfeccentricity[ipf] = iprop.eccentricity
+            pfmajoraxis[ipf] = iprop.major_axis_length * pixel_radius
             # Need to treat minor axis length with an error except
             # since the python algorithm occasionally throws an error.
             try:
-                pfminoraxis[ipf - 1] = (
-                        pfproperties[0].minor_axis_length
-                        * pixel_radius
-                )
+                pfminoraxis[ipf] = iprop.minor_axis_length * pixel_radius
             except ValueError:
                 pass
-            if ~np.isnan(pfminoraxis[ipf - 1]) or \
-                    ~np.isnan(pfmajoraxis[ipf - 1]):
-                pfaspectratio[ipf - 1] = np.divide(
-                    pfmajoraxis[ipf - 1], pfminoraxis[ipf - 1]
-                )
-            pforientation[ipf - 1] = (
-                                         pfproperties[0].orientation
-                                     ) * (180 / float(pi))
-            pfperimeter[ipf - 1] = (
-                    pfproperties[0].perimeter * pixel_radius
-            )
-            [
-                ycentroid,
-                xcentroid,
-            ] = pfproperties[0].centroid
-            [
-                yweightedcentroid,
-                xweightedcentroid,
-            ] = pfproperties[0].weighted_centroid
-
-            # Shift the centroids by minx/miny
-            # since the the PF is a subset from the full image
-            # Round the centroid values as indices
-            ycentroid = int(np.round(ycentroid + miny))
-            xcentroid = int(np.round(xcentroid + minx))
-            yweightedcentroid = int(np.round(yweightedcentroid + miny))
-            xweightedcentroid = int(np.round(xweightedcentroid + minx))
-
-            # Apply the indices to get centroid lat/lon
-            pflon_centroid[ipf-1] = lon[ycentroid, xcentroid]
-            pflat_centroid[ipf-1] = lat[ycentroid, xcentroid]
-            pflon_weightedcentroid[ipf-1] = lon[yweightedcentroid, xweightedcentroid]
-            pflat_weightedcentroid[ipf-1] = lat[yweightedcentroid, xweightedcentroid]
-
-        else:
-            sys.exit("Error: PF pixel count not matching!")
-    logger.debug("Loop done")
+            pforientation[ipf] = iprop.orientation * (180 / float(pi))
+            pfperimeter[ipf] = iprop.perimeter * pixel_radius
+            ycentroid[ipf], xcentroid[ipf] = iprop.centroid
+            yweightedcentroid[ipf], xweightedcentroid[ipf] = iprop.weighted_centroid
+        iaspect = ~np.isnan(pfminoraxis) | ~np.isnan(pfmajoraxis)
+        pfaspectratio[iaspect] = np.divide(pfmajoraxis[iaspect], pfminoraxis[iaspect])
+
+        # Shift the centroids by minx/miny
+        # since the the PF is a subset from the full image
+        # Round the centroid values as indices
+        ycentroid = np.round(ycentroid + miny).astype(int)
+        xcentroid = np.round(xcentroid + minx).astype(int)
+        yweightedcentroid = np.round(yweightedcentroid + miny).astype(int)
+        xweightedcentroid = np.round(xweightedcentroid + minx).astype(int)
+
+        # Apply the indices to get centroid lat/lon
+        pflon_centroid[:] = lon[ycentroid, xcentroid]
+        pflat_centroid[:] = lat[ycentroid, xcentroid]
+        pflon_weightedcentroid[:] = lon[yweightedcentroid, xweightedcentroid]
+        pflat_weightedcentroid[:] = lat[yweightedcentroid, xweightedcentroid]
+    logger.debug("PF statistics done")
 
     # Put all variables in dictionary for output
     pf_stats_dict = {
@@ -656,6 +595,54 @@ def calc_pf_stats(
     return pf_stats_dict
 
 
+def segment_nanmean(values, seg_start):
+    """
+    Calculate the mean of each segment of an array, ignoring NaN.
+
+    Args:
+        values: numpy array
+            Values sorted by segment.
+        seg_start: numpy array
+            Start index of each segment (segments must not be empty).
+
+    Returns:
+        seg_mean: numpy array
+            Mean of each segment, NaN if all values in a segment are NaN.
+    """
+    isvalid = ~np.isnan(values)
+    seg_sum = np.add.reduceat(np.where(isvalid, values, 0), seg_start)
+    seg_count = np.add.reduceat(isvalid.astype(int), seg_start)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        seg_mean = np.where(seg_count > 0, seg_sum / seg_count, np.nan)
+    return seg_mean
+
+
+def segment_skew(values, seg_start, seg_count):
+    """
+    Calculate the skewness of each segment of an array, same as scipy.stats.skew (bias=True).
+
+    Args:
+        values: numpy array
+            Values sorted by segment.
+        seg_start: numpy array
+            Start index of each segment (segments must not be empty).
+        seg_count: numpy array
+            Number of values in each segment.
+
+    Returns:
+        seg_skew: numpy array
+            Skewness of each segment, NaN if the values in a segment are all equal.
+    """
+    seg_mean = np.add.reduceat(values, seg_start) / seg_count
+    deviation = values - np.repeat(seg_mean, seg_count)
+    m2 = np.add.reduceat(deviation ** 2, seg_start) / seg_count
+    m3 = np.add.reduceat(deviation ** 3, seg_start) / seg_count
+    with np.errstate(all="ignore"):
+        zero = m2 <= (np.finfo(m2.dtype).eps * seg_mean) ** 2
+        seg_skew = np.where(zero, np.nan, m3 / m2 ** 1.5)
+    return seg_skew
+
+
 def get_cloud_boundary(icloudlocationx, icloudlocationy, xdim, ydim):
     """
     Get the boundary indices of a cloud feature.
@@ -699,81 +686,48 @@ def get_cloud_boundary(icloudlocationx, icloudlocationy, xdim, ydim):
     return maxx, maxy, minx, miny
 
 
-def add_merge_split_cloud_locations(cloudnumbermap, icloudlocationt, icloudlocationx, icloudlocationy,
-                                    ittmergecloudnumber, ittsplitcloudnumber, logger):
+def get_cloud_window(cloud_slices, cloudnumber, mergecloudnumber, splitcloudnumber, xdim, ydim):
     """
-    Add pixel location indices of merge and split clouds to the current cloud indices.
+    Get the boundary indices of a cloud feature and its merging/splitting clouds from the cloud bounding boxes.
 
     Args:
-        cloudnumbermap:
-        icloudlocationt:
-        icloudlocationx:
-        icloudlocationy:
-        ittmergecloudnumber:
-        ittsplitcloudnumber:
-        logger:
+        cloud_slices: list
+            Bounding box slices of each cloud number (t, y, x), from scipy.ndimage.find_objects.
+        cloudnumber: int
+            Cloud number.
+        mergecloudnumber: numpy array
+            Cloud numbers of merging clouds.
+        splitcloudnumber: numpy array
+            Cloud numbers of splitting clouds.
+        xdim: int
+            Full pixel image dimension in x-direction.
+        ydim: int
+            Full pixel image dimension in y-direction.
 
     Returns:
-        icloudlocationt: t-indices
-        icloudlocationx: x-indices
-        icloudlocationy: y-indices
+        cloud_window: tuple
+            (maxx, maxy, minx, miny, cloud_members), None if the cloud has no pixels.
+            cloud_members are the cloud numbers with pixels in the window.
     """
-    ######################################################################
-    # Check if any small clouds merge
-    logger.debug("Finding mergers")
-    idmergecloudnumber = np.array(np.where(ittmergecloudnumber > 0))[0,:]
-    nmergecloud = len(idmergecloudnumber)
-    if nmergecloud > 0:
-        # Loop over each merging cloud
-        for imc in idmergecloudnumber:
-            # Find location of the merging cloud
-            (
-                imergelocationt,
-                imergelocationy,
-                imergelocationx,
-            ) = np.array(
-                np.where(cloudnumbermap == ittmergecloudnumber[imc])
-            )
-            nmergepix = len(imergelocationy)
-
-            # Add merge pixes to mcs pixels
-            if nmergepix > 0:
-                icloudlocationt = np.hstack(
-                    (icloudlocationt, imergelocationt)
-                )
-                icloudlocationy = np.hstack(
-                    (icloudlocationy, imergelocationy)
-                )
-                icloudlocationx = np.hstack(
-                    (icloudlocationx, imergelocationx)
-                )
-    ######################################################################
-    # Check if any small clouds split
-    logger.debug("Finding splits")
-    idsplitcloudnumber = np.array(np.where(ittsplitcloudnumber > 0))[0,:]
-    nsplitcloud = len(idsplitcloudnumber)
-    if nsplitcloud > 0:
-        # Loop over each merging cloud
-        for imc in idsplitcloudnumber:
-            # Find location of the merging cloud
-            (
-                isplitlocationt,
-                isplitlocationy,
-                isplitlocationx,
-            ) = np.array(
-                np.where(cloudnumbermap == ittsplitcloudnumber[imc])
-            )
-            nsplitpix = len(isplitlocationy)
-
-            # Add split pixels to mcs pixels
-            if nsplitpix > 0:
-                icloudlocationt = np.hstack(
-                    (icloudlocationt, isplitlocationt)
-                )
-                icloudlocationy = np.hstack(
-                    (icloudlocationy, isplitlocationy)
-                )
-                icloudlocationx = np.hstack(
-                    (icloudlocationx, isplitlocationx)
-                )
-    return icloudlocationt, icloudlocationx, icloudlocationy
\ No newline at end of file
+    def get_slice(number):
+        if (number > 0) & (number <= len(cloud_slices)):
+            return cloud_slices[int(number) - 1]
+        return None
+
+    # The cloud itself must be present
+    if get_slice(cloudnumber) is None:
+        return None
+    # Add merge and split clouds that are present
+    members = np.concatenate((
+        [cloudnumber],
+        np.asarray(mergecloudnumber)[np.asarray(mergecloudnumber) > 0],
+        np.asarray(splitcloudnumber)[np.asarray(splitcloudnumber) > 0],
+    ))
+    member_slices = [get_slice(number) for number in members]
+    cloud_members = np.array([number for number, islice in zip(members, member_slices) if islice is not None])
+    member_slices = [islice for islice in member_slices if islice is not None]
+    # Pixel index ranges of all the clouds
+    icloudlocationy = np.array([[islice[-2].start, islice[-2].stop - 1] for islice in member_slices]).ravel()
+    icloudlocationx = np.array([[islice[-1].start, islice[-1].stop - 1] for islice in member_slices]).ravel()
+    maxx, maxy, minx, miny = get_cloud_boundary(icloudlocationx, icloudlocationy, xdim, ydim)
+    return maxx, maxy, minx, miny, cloud_members
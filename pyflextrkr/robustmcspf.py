@@ -5,6 +5,7 @@ import sys
 import time
 import warnings
 import logging
+from pyflextrkr.ft_utilities import write_stats_parquet, pfstats_to_dense, subset_pfstats_tracks
 
 def define_robust_mcs_pf(config):
     """
@@ -27,12 +28,10 @@ def define_robust_mcs_pf(config):
     mcs_pf_majoraxis_thresh = config["mcs_pf_majoraxis_thresh"]
     mcs_pf_durationthresh = config["mcs_pf_durationthresh"]
     mcs_pf_majoraxis_for_lifetime = config["mcs_pf_majoraxis_for_lifetime"]
-    mcs_pf_gap = config["mcs_pf_gap"]
     coefs_pf_area = config["coefs_pf_area"]
     coefs_pf_rr = config["coefs_pf_rr"]
     coefs_pf_skew = config["coefs_pf_skew"]
     coefs_pf_heavyratio = config["coefs_pf_heavyratio"]
-    max_pf_majoraxis_thresh = config["max_pf_majoraxis_thresh"]
     tracks_dimname = config["tracks_dimname"]
     times_dimname = config["times_dimname"]
     pf_dimname = config["pf_dimname"]
@@ -52,14 +51,13 @@ def define_robust_mcs_pf(config):
     ds_pf = xr.open_dataset(mcspfstats_file,
                             mask_and_scale=False,
                             decode_times=False,)
-    ntracks = ds_pf.dims[tracks_dimname]
-    ntimes = ds_pf.dims[times_dimname]
 
     ir_trackduration = ds_pf["track_duration"].data
-    pf_area = ds_pf["pf_area"].data
-    pf_majoraxis = ds_pf["pf_majoraxis"].data
-    pf_rainrate = ds_pf["pf_rainrate"].data
-    pf_skewness = ds_pf["pf_skewness"].data
+    # PF statistics can be dense (tracks, times, nmaxpf) or sparse (sparse_index, nmaxpf)
+    pf_area = pfstats_to_dense(ds_pf["pf_area"], ds_pf, tracks_dimname, times_dimname)
+    pf_majoraxis = pfstats_to_dense(ds_pf["pf_majoraxis"], ds_pf, tracks_dimname, times_dimname)
+    pf_rainrate = pfstats_to_dense(ds_pf["pf_rainrate"], ds_pf, tracks_dimname, times_dimname)
+    pf_skewness = pfstats_to_dense(ds_pf["pf_skewness"], ds_pf, tracks_dimname, times_dimname)
     # pf_accumrain = ds_pf['pf_accumrain'].data
     # pf_accumrainheavy = ds_pf['pf_accumrainheavy'].data
     time_res = float(ds_pf.attrs["time_resolution_hour"])
@@ -74,139 +72,21 @@ def define_robust_mcs_pf(config):
 
     # Calculate accumulate rain by summing over all PFs
     # This is the same approach as in the IDL version of the code
-    pf_volrain_all = ds_pf["pf_accumrain"].sum(dim=pf_dimname).data
-    pf_volrain_heavy = ds_pf["pf_accumrainheavy"].sum(dim=pf_dimname).data
+    pf_volrain_all = pfstats_to_dense(ds_pf["pf_accumrain"].sum(dim=pf_dimname), ds_pf,
+                                      tracks_dimname, times_dimname, fillval=0)
+    pf_volrain_heavy = pfstats_to_dense(ds_pf["pf_accumrainheavy"].sum(dim=pf_dimname), ds_pf,
+                                        tracks_dimname, times_dimname, fillval=0)
     # TODO: Technically should use "total_rain", "total_heavyrain" variables in the file
     # !!Test the impact of this later!!
     # pf_volrain_all = ds_pf["total_rain"]
     # pf_volrain_heavy = ds_pf["total_heavyrain"]
 
     ##################################################
-    # Initialize matrices
-    trackid_mcs = []
-    trackid_nonmcs = []
-
-    # pf_mcstype = np.full(ntracks, fillval, dtype=int)
-    pf_mcsstatus = np.full((ntracks, ntimes), fillval, dtype=int)
-
-    ###################################################
-    # Loop through each track
-    for nt in range(0, ntracks):
-        logger.debug(("Track # " + str(nt)))
-
-        ############################################
-        # Isolate data from this track
-        ilength = np.copy(ir_trackduration[nt]).astype(int)
-
-        # Get the largest precipitation (1st entry in 3rd dimension)
-        ipf_majoraxis = np.copy(pf_majoraxis[nt, 0:ilength, 0])
-        ipf_area = np.copy(pf_area[nt, 0:ilength, 0])
-        ipf_rainrate = np.copy(pf_rainrate[nt, 0:ilength, 0])
-        ipf_skewness = np.copy(pf_skewness[nt, 0:ilength, 0])
-        ipf_volrainall = np.copy(pf_volrain_all[nt, 0:ilength])
-        ifp_volrainheavy = np.copy(pf_volrain_heavy[nt, 0:ilength])
-
-        ######################################################
-        # Apply PF major axis length criteria
-        ipfmcs = np.array(
-            np.where(
-                (ipf_majoraxis >= mcs_pf_majoraxis_thresh)
-                & (ipf_majoraxis <= max_pf_majoraxis_thresh)
-            )[0]
-        )
-        nipfmcs = len(ipfmcs)
-
-        if nipfmcs > 0:
-            # Apply duration threshold to entire time period
-            if nipfmcs * time_res > mcs_pf_durationthresh:
-
-                # Find continuous duration indices
-                groups = np.split(
-                    ipfmcs, np.where(np.diff(ipfmcs) > mcs_pf_gap)[0] + 1
-                )
-                nbreaks = len(groups)
-
-                # Loop over each sub-period "group"
-                for igroup in range(0, nbreaks):
-
-                    ############################################################
-                    # Determine if each group satisfies duration threshold
-                    igroup_indices = np.array(np.copy(groups[igroup][:]))
-                    nigroup = len(igroup_indices)
-
-                    # Duration length should be group's last index - first index + 1
-                    igroup_duration = np.multiply(
-                        (groups[igroup][-1] - groups[igroup][0] + 1), time_res
-                    )
-
-                    # Compute PF fit values using the coefficients
-                    mcs_pfarea = coefs_pf_area[0] + coefs_pf_area[1] * igroup_duration
-                    mcs_rrskew = coefs_pf_skew[0] + coefs_pf_skew[1] * igroup_duration
-                    mcs_rravg = coefs_pf_rr[0] + coefs_pf_rr[1] * igroup_duration
-                    mcs_heavyratio = (
-                        coefs_pf_heavyratio[0] + coefs_pf_heavyratio[1] * igroup_duration
-                    )
-
-                    # Group satisfies duration threshold
-                    if igroup_duration >= mcs_pf_durationthresh:
-
-                        # Get PF variables for this group
-                        igroup_pfmajoraxis = np.copy(ipf_majoraxis[igroup_indices])
-
-                        igroup_pfarea = np.copy(ipf_area[igroup_indices])
-                        igroup_pfrate = np.copy(ipf_rainrate[igroup_indices])
-                        igroup_pfskew = np.copy(ipf_skewness[igroup_indices])
-                        igroup_volrainall = np.copy(ipf_volrainall[igroup_indices])
-                        igroup_volrainheavy = np.copy(ifp_volrainheavy[igroup_indices])
-
-                        # Count number of times when PF exceeds MCS criteria
-                        ct_pftimes = np.count_nonzero(
-                            (igroup_pfarea > mcs_pfarea)
-                            & (igroup_pfrate > mcs_rravg)
-                            & (igroup_pfskew > mcs_rrskew)
-                        )
-                        dur_pf = float(ct_pftimes) * time_res
-
-                        # Calculate volumetric heavy rain ratio during this sub-period
-                        heavyrain_ratio = (
-                            100
-                            * np.nansum(igroup_volrainheavy)
-                            / np.nansum(igroup_volrainall)
-                        )
-
-                        # Duration of PF satisfying MCS criteria >= pf_mcs_dur [hour] and
-                        # heavy rain ratio during the sub-period >= mcs_heavyratio
-                        if (dur_pf >= mcs_pf_durationthresh) & (
-                            heavyrain_ratio > mcs_heavyratio
-                        ):
-                            # Label this period as an mcs
-                            pf_mcsstatus[nt, igroup_indices] = 1
-                            logger.debug("MCS")
-                        else:
-                            trackid_nonmcs = np.append(trackid_nonmcs, int(nt))
-                        # import pdb; pdb.set_trace()
-
-                        ## Determine type of mcs (squall or non-squall)
-                        # isquall = np.array(np.where(igroup_ccaspectratio > aspectratiothresh))[0, :]
-                        # nisquall = len(isquall)
-
-                        # if nisquall > 0:
-                        #    # Label as squall
-                        #    pf_mcstype[nt] = 1
-                        #    pf_cctype[nt, igroup_indices[isquall]] = 1
-                        # else:
-                        #    # Label as non-squall
-                        #    pf_mcstype[nt] = 2
-                        #    pf_cctype[nt, igroup_indices[isquall]] = 2
-                    else:
-                        logger.debug("Not MCS")
-
-            # Group does not satistfy duration threshold
-            else:
-                trackid_nonmcs = np.append(trackid_nonmcs, int(nt))
-                logger.debug("Not MCS")
-        else:
-            logger.debug("Not MCS")
+    # Apply PF criteria to all tracks
+    pf_mcsstatus = get_pf_mcs_status(
+        ir_trackduration, pf_majoraxis, pf_area, pf_rainrate, pf_skewness,
+        pf_volrain_all, pf_volrain_heavy, time_res, fillval, config,
+    )
 
     # Find track indices that are robust MCS
     TEMP_mcsstatus = np.copy(pf_mcsstatus).astype(float)
@@ -350,13 +230,9 @@ def define_robust_mcs_pf(config):
     # #                 cycle_index[ilongmcs[ilm], :] = np.copy(ilm_index)
 
     # Subset robust MCS tracks from PF dataset
-    # Note: the tracks_dimname cannot be used here as Xarray does not seem to have
-    # a method to select data with a string variable
-    dsout = ds_pf.sel(tracks=trackid_mcs)
-    # Replace tracks index
+    dsout = subset_pfstats_tracks(ds_pf, trackid_mcs, tracks_dimname, times_dimname)
     tracks_coord = np.arange(0, nmcs)
     times_coord = ds_pf[times_dimname]
-    dsout[tracks_dimname] = tracks_coord
 
     # Convert new variables to DataArrays
     pf_lifetime = xr.DataArray(
@@ -412,6 +288,10 @@ def define_robust_mcs_pf(config):
                     format="NETCDF4", unlimited_dims=tracks_dimname, encoding=encoding)
     logger.info(f"{statistics_outfile}")
 
+    # Write columnar Parquet tables
+    if config.get("stats_parquet", 0) == 1:
+        write_stats_parquet(dsout, statistics_outfile, tracks_dimname, times_dimname, config)
+
     # # Write to Zarr format
     # zarr_outpath = f"{stats_path}robust.zarr_{startdate}_{enddate}/"
     # # Delete directory if it already exists
@@ -421,4 +301,263 @@ def define_robust_mcs_pf(config):
     # dsout.to_zarr(store=zarr_outpath, consolidated=True)
     # logger.info(f"Robust MCS Zarr: {zarr_outpath}")
 
-    return statistics_outfile
\ No newline at end of file
+    return statistics_outfile
+
+
+def get_pf_mcs_periods(
+        trackduration,
+        pf_majoraxis,
+        time_res,
+        mcs_pf_majoraxis_thresh,
+        max_pf_majoraxis_thresh,
+        mcs_pf_durationthresh,
+        mcs_pf_gap,
+):
+    """
+    Find continuous periods of all tracks when the PF major axis length criteria are met.
+
+    Args:
+        trackduration: numpy array
+            Track duration [tracks].
+        pf_majoraxis: numpy array
+            Major axis length of the largest PF [tracks, times].
+        time_res: float
+            Time resolution [hour].
+        mcs_pf_majoraxis_thresh: float
+            Minimum PF major axis length.
+        max_pf_majoraxis_thresh: float
+            Maximum PF major axis length.
+        mcs_pf_durationthresh: float
+            PF duration threshold [hour].
+        mcs_pf_gap: int
+            Maximum time index gap within a continuous period.
+
+    Returns:
+        ptrack: numpy array
+            Track index of each time within the periods.
+        ptidx: numpy array
+            Time index of each time within the periods.
+        pstart: numpy array
+            Start position of each period in ptrack/ptidx.
+        pduration: numpy array
+            Duration of each period [hour].
+    """
+    ntimes = pf_majoraxis.shape[1]
+    # Only use times within the track duration
+    intrack = np.arange(ntimes)[None, :] < trackduration.astype(int)[:, None]
+    # Apply PF major axis length criteria
+    ipfmcs = intrack & \
+             (pf_majoraxis >= mcs_pf_majoraxis_thresh) & \
+             (pf_majoraxis <= max_pf_majoraxis_thresh)
+    # Apply duration threshold to entire time period
+    nipfmcs = np.count_nonzero(ipfmcs, axis=1)
+    ipfmcs &= (nipfmcs * time_res > mcs_pf_durationthresh)[:, None]
+    ptrack, ptidx = np.nonzero(ipfmcs)
+
+    # Find continuous periods, a new period starts at a new track or after a time gap
+    period_start = np.ones(len(ptrack), dtype=bool)
+    period_start[1:] = (ptrack[1:] != ptrack[:-1]) | (np.diff(ptidx) > mcs_pf_gap)
+    period_end = np.ones(len(ptrack), dtype=bool)
+    period_end[:-1] = period_start[1:]
+    pstart = np.nonzero(period_start)[0]
+    # Duration length should be period's last index - first index + 1
+    pduration = np.multiply((ptidx[period_end] - ptidx[period_start] + 1), time_res)
+    return ptrack, ptidx, pstart, pduration
+
+
+def get_pf_mcs_status(
+        ir_trackduration,
+        pf_majoraxis,
+        pf_area,
+        pf_rainrate,
+        pf_skewness,
+        pf_volrain_all,
+        pf_volrain_heavy,
+        time_res,
+        fillval,
+        config,
+):
+    """
+    Get robust MCS status by applying PF criteria to all tracks at once.
+
+    Args:
+        ir_trackduration: numpy array
+            Track duration [tracks].
+        pf_majoraxis: numpy array
+            PF major axis length [tracks, times, nmaxpf].
+        pf_area: numpy array
+            PF area [tracks, times, nmaxpf].
+        pf_rainrate: numpy array
+            PF mean rain rate [tracks, times, nmaxpf].
+        pf_skewness: numpy array
+            PF rain rate skewness [tracks, times, nmaxpf].
+        pf_volrain_all: numpy array
+            Total volumetric rain [tracks, times].
+        pf_volrain_heavy: numpy array
+            Heavy volumetric rain [tracks, times].
+        time_res: float
+            Time resolution [hour].
+        fillval: int
+            Fill value.
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        pf_mcsstatus: numpy array
+            PF MCS status [tracks, times], 1 during periods satisfying the criteria.
+    """
+    mcs_pf_durationthresh = config["mcs_pf_durationthresh"]
+    coefs_pf_area = config["coefs_pf_area"]
+    coefs_pf_rr = config["coefs_pf_rr"]
+    coefs_pf_skew = config["coefs_pf_skew"]
+    coefs_pf_heavyratio = config["coefs_pf_heavyratio"]
+
+    ntracks, ntimes = pf_majoraxis.shape[0:2]
+    pf_mcsstatus = np.full((ntracks, ntimes), fillval, dtype=int)
+
+    # Get continuous periods from the largest PF (1st entry in 3rd dimension)
+    ptrack, ptidx, pstart, pduration = get_pf_mcs_periods(
+        ir_trackduration, pf_majoraxis[:, :, 0], time_res,
+        config["mcs_pf_majoraxis_thresh"], config["max_pf_majoraxis_thresh"],
+        mcs_pf_durationthresh, config["mcs_pf_gap"],
+    )
+    if len(ptrack) == 0:
+        return pf_mcsstatus
+    period_id = np.repeat(np.arange(len(pstart)), np.diff(np.append(pstart, len(ptrack))))
+
+    # Compute PF fit values using the coefficients
+    mcs_pfarea = coefs_pf_area[0] + coefs_pf_area[1] * pduration
+    mcs_rrskew = coefs_pf_skew[0] + coefs_pf_skew[1] * pduration
+    mcs_rravg = coefs_pf_rr[0] + coefs_pf_rr[1] * pduration
+    mcs_heavyratio = coefs_pf_heavyratio[0] + coefs_pf_heavyratio[1] * pduration
+
+    # Count number of times when PF exceeds MCS criteria in each period
+    ipf_exceed = (pf_area[ptrack, ptidx, 0] > mcs_pfarea[period_id]) & \
+                 (pf_rainrate[ptrack, ptidx, 0] > mcs_rravg[period_id]) & \
+                 (pf_skewness[ptrack, ptidx, 0] > mcs_rrskew[period_id])
+    ct_pftimes = np.add.reduceat(ipf_exceed.astype(int), pstart)
+    dur_pf = ct_pftimes * time_res
+
+    # Calculate volumetric heavy rain ratio during each period
+    volrainall = pf_volrain_all[ptrack, ptidx]
+    volrainheavy = pf_volrain_heavy[ptrack, ptidx]
+    volrainall = np.add.reduceat(np.where(np.isnan(volrainall), 0, volrainall), pstart)
+    volrainheavy = np.add.reduceat(np.where(np.isnan(volrainheavy), 0, volrainheavy), pstart)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        heavyrain_ratio = 100 * volrainheavy / volrainall
+
+    # Period satisfies duration threshold,
+    # duration of PF satisfying MCS criteria >= pf_mcs_dur [hour] and
+    # heavy rain ratio during the period >= mcs_heavyratio
+    ismcs = (pduration >= mcs_pf_durationthresh) & \
+            (dur_pf >= mcs_pf_durationthresh) & \
+            (heavyrain_ratio > mcs_heavyratio)
+    # Label these periods as MCS
+    ismcs = ismcs[period_id]
+    pf_mcsstatus[ptrack[ismcs], ptidx[ismcs]] = 1
+    return pf_mcsstatus
+
+
+def get_pf_mcs_status_loop(
+        ir_trackduration,
+        pf_majoraxis,
+        pf_area,
+        pf_rainrate,
+        pf_skewness,
+        pf_volrain_all,
+        pf_volrain_heavy,
+        time_res,
+        fillval,
+        config,
+):
+    """
+    Get robust MCS status by looping over each track.
+    This is the reference implementation of get_pf_mcs_status, which is used by define_robust_mcs_pf.
+
+    Args:
+        Same as get_pf_mcs_status.
+
+    Returns:
+        pf_mcsstatus: numpy array
+            PF MCS status [tracks, times], 1 during periods satisfying the criteria.
+    """
+    mcs_pf_majoraxis_thresh = config["mcs_pf_majoraxis_thresh"]
+    mcs_pf_durationthresh = config["mcs_pf_durationthresh"]
+    mcs_pf_gap = config["mcs_pf_gap"]
+    coefs_pf_area = config["coefs_pf_area"]
+    coefs_pf_rr = config["coefs_pf_rr"]
+    coefs_pf_skew = config["coefs_pf_skew"]
+    coefs_pf_heavyratio = config["coefs_pf_heavyratio"]
+    max_pf_majoraxis_thresh = config["max_pf_majoraxis_thresh"]
+
+    ntracks, ntimes = pf_majoraxis.shape[0:2]
+    pf_mcsstatus = np.full((ntracks, ntimes), fillval, dtype=int)
+
+    # Loop through each track
+    for nt in range(0, ntracks):
+        # Isolate data from this track
+        ilength = np.copy(ir_trackduration[nt]).astype(int)
+
+        # Get the largest precipitation (1st entry in 3rd dimension)
+        ipf_majoraxis = np.copy(pf_majoraxis[nt, 0:ilength, 0])
+        ipf_area = np.copy(pf_area[nt, 0:ilength, 0])
+        ipf_rainrate = np.copy(pf_rainrate[nt, 0:ilength, 0])
+        ipf_skewness = np.copy(pf_skewness[nt, 0:ilength, 0])
+        ipf_volrainall = np.copy(pf_volrain_all[nt, 0:ilength])
+        ifp_volrainheavy = np.copy(pf_volrain_heavy[nt, 0:ilength])
+
+        # Apply PF major axis length criteria
+        ipfmcs = np.array(
+            np.where(
+                (ipf_majoraxis >= mcs_pf_majoraxis_thresh)
+                & (ipf_majoraxis <= max_pf_majoraxis_thresh)
+            )[0]
+        )
+        nipfmcs = len(ipfmcs)
+
+        # Apply duration threshold to entire time period
+        if (nipfmcs > 0) and (nipfmcs * time_res > mcs_pf_durationthresh):
+            # Find continuous duration indices
+            groups = np.split(
+                ipfmcs, np.where(np.diff(ipfmcs) > mcs_pf_gap)[0] + 1
+            )
+            # Loop over each sub-period "group"
+            for igroup_indices in groups:
+                # Duration length should be group's last index - first index + 1
+                igroup_duration = np.multiply(
+                    (igroup_indices[-1] - igroup_indices[0] + 1), time_res
+                )
+
+                # Compute PF fit values using the coefficients
+                mcs_pfarea = coefs_pf_area[0] + coefs_pf_area[1] * igroup_duration
+                mcs_rrskew = coefs_pf_skew[0] + coefs_pf_skew[1] * igroup_duration
+                mcs_rravg = coefs_pf_rr[0] + coefs_pf_rr[1] * igroup_duration
+                mcs_heavyratio = (
+                    coefs_pf_heavyratio[0] + coefs_pf_heavyratio[1] * igroup_duration
+                )
+
+                # Group satisfies duration threshold
+                if igroup_duration >= mcs_pf_durationthresh:
+                    # Count number of times when PF exceeds MCS criteria
+                    ct_pftimes = np.count_nonzero(
+                        (ipf_area[igroup_indices] > mcs_pfarea)
+                        & (ipf_rainrate[igroup_indices] > mcs_rravg)
+                        & (ipf_skewness[igroup_indices] > mcs_rrskew)
+                    )
+                    dur_pf = float(ct_pftimes) * time_res
+
+                    # Calculate volumetric heavy rain ratio during this sub-period
+                    heavyrain_ratio = (
+                        100
+                        * np.nansum(ifp_volrainheavy[igroup_indices])
+                        / np.nansum(ipf_volrainall[igroup_indices])
+                    )
+
+                    # Duration of PF satisfying MCS criteria >= pf_mcs_dur [hour] and
+                    # heavy rain ratio during the sub-period >= mcs_heavyratio
+                    if (dur_pf >= mcs_pf_durationthresh) & (
+                        heavyrain_ratio > mcs_heavyratio
+                    ):
+                        # Label this period as an mcs
+                        pf_mcsstatus[nt, igroup_indices] = 1
+    return pf_mcsstatus
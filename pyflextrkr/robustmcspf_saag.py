@@ -5,6 +5,8 @@ import sys
 import time
 import warnings
 import logging
+from pyflextrkr.ft_utilities import write_stats_parquet, pfstats_to_dense, subset_pfstats_tracks
+from pyflextrkr.robustmcspf import get_pf_mcs_periods
 
 def define_robust_mcs_pf(config):
     """
@@ -28,19 +30,14 @@ def define_robust_mcs_pf(config):
     mcs_pf_majoraxis_thresh = config["mcs_pf_majoraxis_thresh"]
     mcs_pf_durationthresh = config["mcs_pf_durationthresh"]
     mcs_pf_majoraxis_for_lifetime = config["mcs_pf_majoraxis_for_lifetime"]
-    mcs_pf_gap = config["mcs_pf_gap"]
     coefs_pf_area = config["coefs_pf_area"]
     coefs_pf_rr = config["coefs_pf_rr"]
     coefs_pf_skew = config["coefs_pf_skew"]
     coefs_pf_heavyratio = config["coefs_pf_heavyratio"]
-    max_pf_majoraxis_thresh = config["max_pf_majoraxis_thresh"]
     tracks_dimname = config["tracks_dimname"]
     times_dimname = config["times_dimname"]
     pf_dimname = config["pf_dimname"]
     pixel_radius = config["pixel_radius"]
-    mcs_min_rainvol_thresh = config["mcs_min_rainvol_thresh"]
-    heavy_rainrate_thresh = config["heavy_rainrate_thresh"]
-    mcs_volrain_durationthresh = config["mcs_volrain_durationthresh"]
 
     np.set_printoptions(threshold=np.inf)
     logger = logging.getLogger(__name__)
@@ -57,113 +54,25 @@ def define_robust_mcs_pf(config):
     ds_pf = xr.open_dataset(mcspfstats_file,
                             mask_and_scale=False,
                             decode_times=False,)
-    ntracks = ds_pf.dims[tracks_dimname]
-    ntimes = ds_pf.dims[times_dimname]
 
     ir_trackduration = ds_pf["track_duration"].data
-    pf_area = ds_pf["pf_area"].data
-    pf_majoraxis = ds_pf["pf_majoraxis"].data
-    pf_maxrainrate = ds_pf["pf_maxrainrate"].max(dim=pf_dimname).data
+    # PF statistics can be dense (tracks, times, nmaxpf) or sparse (sparse_index, nmaxpf)
+    pf_area = pfstats_to_dense(ds_pf["pf_area"], ds_pf, tracks_dimname, times_dimname)
+    pf_majoraxis = pfstats_to_dense(ds_pf["pf_majoraxis"], ds_pf, tracks_dimname, times_dimname)
+    pf_maxrainrate = pfstats_to_dense(ds_pf["pf_maxrainrate"].max(dim=pf_dimname), ds_pf,
+                                      tracks_dimname, times_dimname)
     time_res = float(ds_pf.attrs["time_resolution_hour"])
     fillval = ds_pf["mcs_status"].attrs["_FillValue"]
 
     # SAAG: total rain volume (sum of rain amount [mm/h] * pixel area [km^2])
-    pf_volrain_all = ds_pf["total_rain"].data * pixel_radius**2
+    pf_volrain_all = pfstats_to_dense(ds_pf["total_rain"], ds_pf, tracks_dimname, times_dimname) * pixel_radius**2
 
 
     ##################################################
-    # Initialize matrices
-    trackid_mcs = []
-    trackid_nonmcs = []
-
-    pf_mcsstatus = np.full((ntracks, ntimes), fillval, dtype=int)
-
-    ###################################################
-    # Loop through each track
-    for nt in range(0, ntracks):
-        logger.debug(("Track # " + str(nt)))
-
-        ############################################
-        # Isolate data from this track
-        ilength = np.copy(ir_trackduration[nt]).astype(int)
-
-        # Get the largest precipitation (1st entry in 3rd dimension)
-        ipf_majoraxis = np.copy(pf_majoraxis[nt, 0:ilength, 0])
-        # SAAG simplified variables
-        ipf_maxrainrate = np.copy(pf_maxrainrate[nt, 0:ilength])
-        ipf_volrainall = np.copy(pf_volrain_all[nt, 0:ilength])
-
-        ######################################################
-        # Apply PF major axis length criteria
-        ipfmcs = np.array(
-            np.where(
-                (ipf_majoraxis >= mcs_pf_majoraxis_thresh)
-                & (ipf_majoraxis <= max_pf_majoraxis_thresh)
-            )[0]
-        )
-        nipfmcs = len(ipfmcs)
-
-        if nipfmcs > 0:
-            # Apply duration threshold to entire time period
-            if nipfmcs * time_res > mcs_pf_durationthresh:
-
-                # Find continuous duration indices
-                groups = np.split(
-                    ipfmcs, np.where(np.diff(ipfmcs) > mcs_pf_gap)[0] + 1
-                )
-                nbreaks = len(groups)
-
-                # Loop over each sub-period "group"
-                for igroup in range(0, nbreaks):
-
-                    ############################################################
-                    # Determine if each group satisfies duration threshold
-                    igroup_indices = np.array(np.copy(groups[igroup][:]))
-                    nigroup = len(igroup_indices)
-
-                    # Duration length should be group's last index - first index + 1
-                    igroup_duration = np.multiply(
-                        (groups[igroup][-1] - groups[igroup][0] + 1), time_res
-                    )
-
-                    # Group satisfies duration threshold
-                    if igroup_duration >= mcs_pf_durationthresh:
-
-                        # Get PF variables for this group                        
-                        # SAAG:
-                        # Peak rain rate (10 mm/h) > 4 hours
-                        # Minimum rainfall volume 
-                        igroup_maxrainrate = np.copy(ipf_maxrainrate[igroup_indices])
-                        igroup_volrainall = np.copy(ipf_volrainall[igroup_indices])
-
-                        # Count number of times max rain rate > threshold
-                        ct_maxrrtimes = np.count_nonzero(igroup_maxrainrate > heavy_rainrate_thresh)
-                        # Count number of times volume rain > threshold
-                        ct_volrain = np.count_nonzero(igroup_volrainall > mcs_min_rainvol_thresh)
-                        # Convert counts to duration [hour]
-                        dur_maxrr = float(ct_maxrrtimes) * time_res
-                        dur_volrain = float(ct_volrain) * time_res
-
-                        # Duration of max rain rate >= pf_mcs_dur [hour] and
-                        # Duration of volume rain >= mcs_volrain_durationthresh
-                        if (dur_maxrr >= mcs_pf_durationthresh) & (
-                            dur_volrain >= mcs_volrain_durationthresh
-                        ):
-                            # Label this period as an mcs
-                            pf_mcsstatus[nt, igroup_indices] = 1
-                            logger.debug("MCS")
-                        else:
-                            trackid_nonmcs = np.append(trackid_nonmcs, int(nt))
-
-                    else:
-                        logger.debug("Not MCS")
-
-            # Group does not satistfy duration threshold
-            else:
-                trackid_nonmcs = np.append(trackid_nonmcs, int(nt))
-                logger.debug("Not MCS")
-        else:
-            logger.debug("Not MCS")
+    # Apply PF criteria to all tracks
+    pf_mcsstatus = get_pf_mcs_status(
+        ir_trackduration, pf_majoraxis, pf_maxrainrate, pf_volrain_all, time_res, fillval, config,
+    )
 
     # Find track indices that are robust MCS
     TEMP_mcsstatus = np.copy(pf_mcsstatus).astype(float)
@@ -206,13 +115,9 @@ def define_robust_mcs_pf(config):
     ########################################################
 
     # Subset robust MCS tracks from PF dataset
-    # Note: the tracks_dimname cannot be used here as Xarray does not seem to have
-    # a method to select data with a string variable
-    dsout = ds_pf.sel(tracks=trackid_mcs)
-    # Replace tracks index
+    dsout = subset_pfstats_tracks(ds_pf, trackid_mcs, tracks_dimname, times_dimname)
     tracks_coord = np.arange(0, nmcs)
     times_coord = ds_pf[times_dimname]
-    dsout[tracks_dimname] = tracks_coord
 
     # Convert new variables to DataArrays
     pf_lifetime = xr.DataArray(
@@ -268,6 +173,10 @@ def define_robust_mcs_pf(config):
                     format="NETCDF4", unlimited_dims=tracks_dimname, encoding=encoding)
     logger.info(f"{statistics_outfile}")
 
+    # Write columnar Parquet tables
+    if config.get("stats_parquet", 0) == 1:
+        write_stats_parquet(dsout, statistics_outfile, tracks_dimname, times_dimname, config)
+
     # # Write to Zarr format
     # zarr_outpath = f"{stats_path}robust.zarr_{startdate}_{enddate}/"
     # # Delete directory if it already exists
@@ -277,4 +186,165 @@ def define_robust_mcs_pf(config):
     # dsout.to_zarr(store=zarr_outpath, consolidated=True)
     # logger.info(f"Robust MCS Zarr: {zarr_outpath}")
 
-    return statistics_outfile
\ No newline at end of file
+    return statistics_outfile
+
+
+def get_pf_mcs_status(
+        ir_trackduration,
+        pf_majoraxis,
+        pf_maxrainrate,
+        pf_volrain_all,
+        time_res,
+        fillval,
+        config,
+):
+    """
+    Get robust MCS status by applying the SAAG PF criteria to all tracks at once.
+
+    Args:
+        ir_trackduration: numpy array
+            Track duration [tracks].
+        pf_majoraxis: numpy array
+            PF major axis length [tracks, times, nmaxpf].
+        pf_maxrainrate: numpy array
+            Max rain rate of all PFs [tracks, times].
+        pf_volrain_all: numpy array
+            Total rain volume [tracks, times].
+        time_res: float
+            Time resolution [hour].
+        fillval: int
+            Fill value.
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        pf_mcsstatus: numpy array
+            PF MCS status [tracks, times], 1 during periods satisfying the criteria.
+    """
+    mcs_pf_durationthresh = config["mcs_pf_durationthresh"]
+    mcs_min_rainvol_thresh = config["mcs_min_rainvol_thresh"]
+    heavy_rainrate_thresh = config["heavy_rainrate_thresh"]
+    mcs_volrain_durationthresh = config["mcs_volrain_durationthresh"]
+
+    ntracks, ntimes = pf_majoraxis.shape[0:2]
+    pf_mcsstatus = np.full((ntracks, ntimes), fillval, dtype=int)
+
+    # Get continuous periods from the largest PF (1st entry in 3rd dimension)
+    ptrack, ptidx, pstart, pduration = get_pf_mcs_periods(
+        ir_trackduration, pf_majoraxis[:, :, 0], time_res,
+        config["mcs_pf_majoraxis_thresh"], config["max_pf_majoraxis_thresh"],
+        mcs_pf_durationthresh, config["mcs_pf_gap"],
+    )
+    if len(ptrack) == 0:
+        return pf_mcsstatus
+    period_id = np.repeat(np.arange(len(pstart)), np.diff(np.append(pstart, len(ptrack))))
+
+    # SAAG:
+    # Peak rain rate (10 mm/h) > 4 hours
+    # Minimum rainfall volume
+    # Count number of times max rain rate > threshold in each period
+    ct_maxrrtimes = np.add.reduceat(
+        (pf_maxrainrate[ptrack, ptidx] > heavy_rainrate_thresh).astype(int), pstart
+    )
+    # Count number of times volume rain > threshold in each period
+    ct_volrain = np.add.reduceat(
+        (pf_volrain_all[ptrack, ptidx] > mcs_min_rainvol_thresh).astype(int), pstart
+    )
+    # Convert counts to duration [hour]
+    dur_maxrr = ct_maxrrtimes * time_res
+    dur_volrain = ct_volrain * time_res
+
+    # Period satisfies duration threshold,
+    # duration of max rain rate >= pf_mcs_dur [hour] and
+    # duration of volume rain >= mcs_volrain_durationthresh
+    ismcs = (pduration >= mcs_pf_durationthresh) & \
+            (dur_maxrr >= mcs_pf_durationthresh) & \
+            (dur_volrain >= mcs_volrain_durationthresh)
+    # Label these periods as MCS
+    ismcs = ismcs[period_id]
+    pf_mcsstatus[ptrack[ismcs], ptidx[ismcs]] = 1
+    return pf_mcsstatus
+
+
+def get_pf_mcs_status_loop(
+        ir_trackduration,
+        pf_majoraxis,
+        pf_maxrainrate,
+        pf_volrain_all,
+        time_res,
+        fillval,
+        config,
+):
+    """
+    Get robust MCS status by looping over each track.
+    This is the reference implementation of get_pf_mcs_status, which is used by define_robust_mcs_pf.
+
+    Args:
+        Same as get_pf_mcs_status.
+
+    Returns:
+        pf_mcsstatus: numpy array
+            PF MCS status [tracks, times], 1 during periods satisfying the criteria.
+    """
+    mcs_pf_majoraxis_thresh = config["mcs_pf_majoraxis_thresh"]
+    mcs_pf_durationthresh = config["mcs_pf_durationthresh"]
+    mcs_pf_gap = config["mcs_pf_gap"]
+    max_pf_majoraxis_thresh = config["max_pf_majoraxis_thresh"]
+    mcs_min_rainvol_thresh = config["mcs_min_rainvol_thresh"]
+    heavy_rainrate_thresh = config["heavy_rainrate_thresh"]
+    mcs_volrain_durationthresh = config["mcs_volrain_durationthresh"]
+
+    ntracks, ntimes = pf_majoraxis.shape[0:2]
+    pf_mcsstatus = np.full((ntracks, ntimes), fillval, dtype=int)
+
+    # Loop through each track
+    for nt in range(0, ntracks):
+        # Isolate data from this track
+        ilength = np.copy(ir_trackduration[nt]).astype(int)
+
+        # Get the largest precipitation (1st entry in 3rd dimension)
+        ipf_majoraxis = np.copy(pf_majoraxis[nt, 0:ilength, 0])
+        # SAAG simplified variables
+        ipf_maxrainrate = np.copy(pf_maxrainrate[nt, 0:ilength])
+        ipf_volrainall = np.copy(pf_volrain_all[nt, 0:ilength])
+
+        # Apply PF major axis length criteria
+        ipfmcs = np.array(
+            np.where(
+                (ipf_majoraxis >= mcs_pf_majoraxis_thresh)
+                & (ipf_majoraxis <= max_pf_majoraxis_thresh)
+            )[0]
+        )
+        nipfmcs = len(ipfmcs)
+
+        # Apply duration threshold to entire time period
+        if (nipfmcs > 0) and (nipfmcs * time_res > mcs_pf_durationthresh):
+            # Find continuous duration indices
+            groups = np.split(
+                ipfmcs, np.where(np.diff(ipfmcs) > mcs_pf_gap)[0] + 1
+            )
+            # Loop over each sub-period "group"
+            for igroup_indices in groups:
+                # Duration length should be group's last index - first index + 1
+                igroup_duration = np.multiply(
+                    (igroup_indices[-1] - igroup_indices[0] + 1), time_res
+                )
+
+                # Group satisfies duration threshold
+                if igroup_duration >= mcs_pf_durationthresh:
+                    # Count number of times max rain rate > threshold
+                    ct_maxrrtimes = np.count_nonzero(ipf_maxrainrate[igroup_indices] > heavy_rainrate_thresh)
+                    # Count number of times volume rain > threshold
+                    ct_volrain = np.count_nonzero(ipf_volrainall[igroup_indices] > mcs_min_rainvol_thresh)
+                    # Convert counts to duration [hour]
+                    dur_maxrr = float(ct_maxrrtimes) * time_res
+                    dur_volrain = float(ct_volrain) * time_res
+
+                    # Duration of max rain rate >= pf_mcs_dur [hour] and
+                    # Duration of volume rain >= mcs_volrain_durationthresh
+                    if (dur_maxrr >= mcs_pf_durationthresh) & (
+                        dur_volrain >= mcs_volrain_durationthresh
+                    ):
+                        # Label this period as an mcs
+                        pf_mcsstatus[nt, igroup_indices] = 1
+    return pf_mcsstatus
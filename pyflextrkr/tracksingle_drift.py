@@ -1,17 +1,18 @@
 import numpy as np
 import os
-import sys
 import xarray as xr
 import pandas as pd
 import time
 import scipy.ndimage as ndi
 import logging
+from pyflextrkr.tracksingle_func import link_features_overlap, read_cloudid_labels
 
 def trackclouds(
     cloudid_filepairs,
     cloudid_basetimepairs,
     config,
     drift_data=None,
+    cloudid_datapairs=None,
 ):
     """
     Track clouds in successive pairs of cloudid files.
@@ -25,10 +26,15 @@ def trackclouds(
             Dictionary containing config parameters
         drift_data: tuple, optional. Default: None.
             Drift data (datetime_string, xdrift, ydrift)
+        cloudid_datapairs: tuple, optional. Default: None.
+            Already loaded cloudid data pairs from read_cloudid_labels.
+            If None, the cloudid files are read.
 
     Returns:
         track_outfile: string
             Track file name.
+        link_info: dictionary
+            Link information for the link index (see write_link_index), None if the pair is not linked.
     """
 
     logger = logging.getLogger(__name__)
@@ -43,10 +49,12 @@ def trackclouds(
     dataoutpath = config["tracking_outpath"]
     feature_varname = config.get("feature_varname", "feature_number")
     nfeature_varname = config.get("nfeature_varname", "nfeatures")
+    featuresize_varname = config.get("featuresize_varname", "npix_feature")
     timegap = config["timegap"]
     nmaxlinks = config["nmaxlinks"]
     othresh = config["othresh"]
     fillval = config["fillval"]
+    overlap_method = config.get("overlap_method", "contingency")
     if drift_data is not None:
         datetime_drift, xdrift, ydrift = drift_data[0], drift_data[1], drift_data[2]
 
@@ -85,32 +93,27 @@ def trackclouds(
         # Load cloudid file from before, called reference file
         logger.debug(reference_filedatetime)
 
-        # Open file
-        reference_data = xr.open_dataset(
-            reference_file, mask_and_scale=False, decode_times=False, chunks=-1,
-        )
-        reference_convcold_cloudnumber = reference_data[feature_varname].load().data
-        nreference = reference_data[nfeature_varname].load().data
-        reference_data.close()
+        # Read file, or use the already loaded data
+        if cloudid_datapairs is None:
+            reference_cloudid = read_cloudid_labels(
+                reference_file, feature_varname, nfeature_varname, featuresize_varname,
+            )
+        else:
+            reference_cloudid = cloudid_datapairs[0]
+        reference_convcold_cloudnumber, nreference, reference_basetime_data, reference_npix = reference_cloudid
 
         ##########################################################
         # Load next cloudid file, called new file
         logger.debug(f"new_filedattime: {new_filedatetime}")
 
-        # Open file
-        new_data = xr.open_dataset(
-            new_file, mask_and_scale=False, decode_times=False, chunks=-1,
-        )
-        new_convcold_cloudnumber = new_data[feature_varname].load().data
-        nnew = new_data[nfeature_varname].load().data
-        new_data.close()
-
-        # Convert float type to int, missing value to 0
-        # This should not be needed when setting mask_and_scale=False
-        reference_convcold_cloudnumber[np.isnan(reference_convcold_cloudnumber)] = 0
-        reference_convcold_cloudnumber = reference_convcold_cloudnumber.astype("int")
-        new_convcold_cloudnumber[np.isnan(new_convcold_cloudnumber)] = 0
-        new_convcold_cloudnumber = new_convcold_cloudnumber.astype("int")
+        # Read file, or use the already loaded data
+        if cloudid_datapairs is None:
+            new_cloudid = read_cloudid_labels(
+                new_file, feature_varname, nfeature_varname, featuresize_varname,
+            )
+        else:
+            new_cloudid = cloudid_datapairs[1]
+        new_convcold_cloudnumber, nnew, new_basetime_data, new_npix = new_cloudid
 
         if drift_data is not None:
             # Compare drift datetime with reference datetime
@@ -136,123 +139,21 @@ def trackclouds(
         nreference = nreference + 1
         nnew = nnew + 1
 
-        #######################################################
-        # Initialize matrices
-        reference_forward_index = (
-            np.ones((1, int(nreference), int(nmaxlinks)), dtype=int) * fillval
-        )
-        reference_forward_size = (
-            np.ones((1, int(nreference), int(nmaxlinks)), dtype=int) * fillval
-        )
-        new_backward_index = (
-            np.ones((1, int(nnew), int(nmaxlinks)), dtype=int) * fillval
-        )
-        new_backward_size = np.ones((1, int(nnew), int(nmaxlinks)), dtype=int) * fillval
-
-        ######################################################
-        # Loop through each cloud / feature in reference time and look for overlaping clouds / features in the new file
-        for refindex in np.arange(1, nreference + 1):
-            # Locate where the cloud in the reference file overlaps with any cloud in the new file
-            forward_matchindices = np.where(
-                (reference_convcold_cloudnumber == refindex)
-                & (new_convcold_cloudnumber != 0)
-            )
-
-            # Get the convcold_cloudnumber of the clouds in the new file that overlap the cloud in the reference file
-            forward_newindex = new_convcold_cloudnumber[forward_matchindices]
-            unique_forwardnewindex = np.unique(forward_newindex)
-
-            # Calculate size of reference cloud in terms of number of pixels
-            sizeref = len(
-                np.extract(
-                    reference_convcold_cloudnumber == refindex,
-                    reference_convcold_cloudnumber,
-                )
-            )
-
-            # Loop through the overlapping clouds in the new file, determining if they statisfy the overlap requirement
-            forward_nmatch = 0  # Initialize overlap counter
-            for matchindex in unique_forwardnewindex:
-                sizematch = len(
-                    np.extract(forward_newindex == matchindex, forward_newindex)
-                )
-
-                if sizematch / float(sizeref) > othresh:
-                    if forward_nmatch > nmaxlinks:
-                        logger.debug(
-                            ("reference: " + reference_file)
-                        )
-                        logger.debug(("new: " + new_file))
-                        sys.exit(
-                            "More than "
-                            + str(int(nmaxlinks))
-                            + " clouds in new file match with reference cloud?!"
-                        )
-                    else:
-                        reference_forward_index[
-                            0, int(refindex) - 1, forward_nmatch
-                        ] = matchindex
-                        reference_forward_size[
-                            0, int(refindex) - 1, forward_nmatch
-                        ] = len(
-                            np.extract(
-                                new_convcold_cloudnumber == matchindex,
-                                new_convcold_cloudnumber,
-                            )
-                        )
-
-                        forward_nmatch = forward_nmatch + 1
-
         ######################################################
-        # Loop through each cloud / feature at new time and look for overlaping clouds / features in the reference file
-        for newindex in np.arange(1, nnew + 1):
-            # Locate where the cloud in the new file overlaps with any cloud in the reference file
-            backward_matchindices = np.where(
-                (new_convcold_cloudnumber == newindex)
-                & (reference_convcold_cloudnumber != 0)
-            )
-
-            # Get the convcold_cloudnumber of the clouds in the reference file that overlap the cloud in the new file
-            backward_refindex = reference_convcold_cloudnumber[backward_matchindices]
-            unique_backwardrefindex = np.unique(backward_refindex)
-
-            # Calculate size of reference cloud in terms of number of pixels
-            sizenew = len(
-                np.extract(
-                    new_convcold_cloudnumber == newindex, new_convcold_cloudnumber
-                )
-            )
-
-            # Loop through the overlapping clouds in the new file, determining if they statisfy the overlap requirement
-            backward_nmatch = 0  # Initialize overlap counter
-            for matchindex in unique_backwardrefindex:
-                sizematch = len(
-                    np.extract(backward_refindex == matchindex, backward_refindex)
-                )
-
-                if sizematch / float(sizenew) > othresh:
-                    if backward_nmatch > nmaxlinks:
-                        logger.debug(
-                            ("reference: " + reference_file)
-                        )
-                        logger.debug(("new: " + new_file))
-                        sys.exit(
-                            "More than "
-                            + str(int(nmaxlinks))
-                            + " clouds in reference file match with new cloud?!"
-                        )
-                    else:
-                        new_backward_index[
-                            0, int(newindex) - 1, backward_nmatch
-                        ] = matchindex
-                        new_backward_size[0, int(newindex) - 1, backward_nmatch] = len(
-                            np.extract(
-                                reference_convcold_cloudnumber == matchindex,
-                                reference_convcold_cloudnumber,
-                            )
-                        )
-
-                        backward_nmatch = backward_nmatch + 1
+        # Link overlapping clouds / features between the reference and new files
+        reference_forward_index, \
+        reference_forward_size, \
+        new_backward_index, \
+        new_backward_size = link_features_overlap(
+            reference_convcold_cloudnumber,
+            new_convcold_cloudnumber,
+            nreference,
+            nnew,
+            nmaxlinks,
+            othresh,
+            fillval,
+            overlap_method=overlap_method,
+        )
 
         #########################################################
         # Save forward and backward indices and linked sizes in netcdf file
@@ -271,14 +172,14 @@ def trackclouds(
             "basetime_new": (
                 ["time"],
                 np.array(
-                    [pd.to_datetime(new_data["base_time"].data, unit="s")],
+                    [pd.to_datetime(new_basetime_data, unit="s")],
                     dtype="datetime64[s]",
                 )[0],
             ),
             "basetime_ref": (
                 ["time"],
                 np.array(
-                    [pd.to_datetime(reference_data["base_time"].data, unit="s")],
+                    [pd.to_datetime(reference_basetime_data, unit="s")],
                     dtype="datetime64[s]",
                 )[0],
             ),
@@ -414,4 +315,87 @@ def trackclouds(
             },
         )
         logger.info(track_outfile)
-    return track_outfile
\ No newline at end of file
+
+        # Link information for the link index
+        link_info = {
+            "track_file": track_outfile,
+            "ref_file": reference_file,
+            "new_file": new_file,
+            "ref_date": reference_filedatetime,
+            "new_date": new_filedatetime,
+            "basetime_ref": output_data["basetime_ref"].data.astype("datetime64[s]").astype(np.int64).item(),
+            "basetime_new": output_data["basetime_new"].data.astype("datetime64[s]").astype(np.int64).item(),
+            "nclouds_ref": nreference,
+            "nclouds_new": nnew,
+            "npix_ref": reference_npix,
+            "npix_new": new_npix,
+        }
+    else:
+        link_info = None
+    return track_outfile, link_info
+
+def trackclouds_window(
+    cloudid_files,
+    cloudid_basetimes,
+    config,
+    drift_data=None,
+):
+    """
+    Track clouds in a contiguous chunk of cloudid files using a sliding two-frame window.
+
+    Each cloudid file in the chunk is read once and kept in memory
+    to be used as the reference file for the next pair.
+
+    Arguments:
+        cloudid_files: list
+            Contiguous cloudid filenames
+        cloudid_basetimes: list
+            Cloudid basetimes
+        config: dictionary
+            Dictionary containing config parameters
+        drift_data: list, optional. Default: None.
+            Drift data (datetime_string, xdrift, ydrift) for each pair of files
+
+    Returns:
+        track_outputs: list
+            Track file name and link information for each pair (see trackclouds).
+    """
+    feature_varname = config.get("feature_varname", "feature_number")
+    nfeature_varname = config.get("nfeature_varname", "nfeatures")
+    featuresize_varname = config.get("featuresize_varname", "npix_feature")
+    timegap = config["timegap"]
+
+    track_outputs = []
+    # Loaded data for the previous file in the window
+    previous_cloudid = None
+    for ifile in range(0, len(cloudid_files) - 1):
+        cloudid_filepairs = (cloudid_files[ifile], cloudid_files[ifile + 1])
+        cloudid_basetimepairs = (cloudid_basetimes[ifile], cloudid_basetimes[ifile + 1])
+
+        # Only read files for pairs that are tracked
+        hour_diff = (np.subtract(cloudid_basetimepairs[1], cloudid_basetimepairs[0])) / float(3600)
+        if hour_diff < timegap and hour_diff > 0:
+            if previous_cloudid is None:
+                previous_cloudid = read_cloudid_labels(
+                    cloudid_filepairs[0], feature_varname, nfeature_varname, featuresize_varname,
+                )
+            current_cloudid = read_cloudid_labels(
+                cloudid_filepairs[1], feature_varname, nfeature_varname, featuresize_varname,
+            )
+            cloudid_datapairs = (previous_cloudid, current_cloudid)
+        else:
+            current_cloudid = None
+            cloudid_datapairs = None
+
+        track_output = trackclouds(
+            cloudid_filepairs,
+            cloudid_basetimepairs,
+            config,
+            drift_data=drift_data[ifile] if drift_data is not None else None,
+            cloudid_datapairs=cloudid_datapairs,
+        )
+        track_outputs.append(track_output)
+        # Slide the window
+        previous_cloudid = current_cloudid
+
+    return track_outputs
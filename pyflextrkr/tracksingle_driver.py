@@ -1,9 +1,11 @@
 import sys
 import logging
+import numpy as np
 import dask
 from dask.distributed import wait
 from pyflextrkr.ft_utilities import subset_files_timerange, match_drift_times
-from pyflextrkr.tracksingle_drift import trackclouds
+from pyflextrkr.tracksingle_drift import trackclouds, trackclouds_window
+from pyflextrkr.tracksingle_func import write_link_index
 
 def tracksingle_driver(config):
     """
@@ -15,6 +17,7 @@ def tracksingle_driver(config):
 
     Returns:
         Track data are written to netCDF files.
+        The link information of all pairs is written to a link index file.
     """
 
     logger = logging.getLogger(__name__)
@@ -26,6 +29,14 @@ def tracksingle_driver(config):
     end_basetime = config["end_basetime"]
     run_parallel = config["run_parallel"]
     driftfile = config.get("driftfile", None)
+    # Sliding window mode: each cloudid file in a chunk is read once
+    tracksingle_window = config.get("tracksingle_window", 0)
+    nprocesses = config.get("nprocesses", 1)
+    tracksingle_nchunks = config.get("tracksingle_nchunks", nprocesses)
+    linkindex_filebase = config.get("linkindex_filebase", "linkindex_")
+    startdate = config["startdate"]
+    enddate = config["enddate"]
+    linkindex_outfile = f"{tracking_outpath}{linkindex_filebase}{startdate}_{enddate}.nc"
 
     # Identify files to process
     cloudidfiles, \
@@ -51,26 +62,66 @@ def tracksingle_driver(config):
     # Call function
     logger.debug('Looping over pairs of single files to track')
 
+    # Sliding window version
+    if tracksingle_window == 1:
+        # Set number of chunks, serial run uses 1 chunk
+        nchunks = tracksingle_nchunks if run_parallel >= 1 else 1
+        nchunks = max(min(nchunks, cloudidfilestep - 1), 1)
+        # Split the pairs into contiguous chunks, adjacent chunks share the boundary file
+        chunk_pairs = np.array_split(np.arange(0, cloudidfilestep - 1), nchunks)
+        logger.info(f'Sliding window mode, number of chunks: {nchunks}')
+
+        results = []
+        for ipairs in chunk_pairs:
+            if len(ipairs) == 0:
+                continue
+            ifile_start, ifile_end = ipairs[0], ipairs[-1] + 2
+            chunk_files = cloudidfiles[ifile_start:ifile_end]
+            chunk_basetimes = cloudidfiles_basetime[ifile_start:ifile_end]
+            chunk_drift = drift_data[ipairs[0]:ipairs[-1] + 1] if driftfile is not None else None
+            if run_parallel == 0:
+                result = trackclouds_window(chunk_files, chunk_basetimes, config, drift_data=chunk_drift)
+                results.append(result)
+            elif run_parallel >= 1:
+                result = dask.delayed(trackclouds_window)(
+                    chunk_files, chunk_basetimes, config, drift_data=chunk_drift,
+                )
+                results.append(result)
+            else:
+                sys.exit('Valid parallelization flag not provided.')
+        if run_parallel >= 1:
+            results = dask.compute(*results)
+            wait(results)
+
+        # Write link index
+        link_info = [track_output[1] for result in results for track_output in result]
+        write_link_index(link_info, linkindex_outfile)
+
+        logger.info('Done with tracking sequential pairs of idfeature files')
+        return
+
     # Create pairs of input filenames and times
     cloudid_filepairs = list(zip(cloudidfiles[0:-1], cloudidfiles[1::]))
     cloudid_basetimepairs = list(zip(cloudidfiles_basetime[0:-1], cloudidfiles_basetime[1::]))
 
     # Serial version
     if run_parallel == 0:
+        results = []
         for ifile in range(0, cloudidfilestep - 1):
             if driftfile is not None:
-                trackclouds(
+                result = trackclouds(
                     cloudid_filepairs[ifile],
                     cloudid_basetimepairs[ifile],
                     config,
                     drift_data=drift_data[ifile]
                 )
             else:
-                trackclouds(
+                result = trackclouds(
                     cloudid_filepairs[ifile],
                     cloudid_basetimepairs[ifile],
                     config
                 )
+            results.append(result)
 
     # Parallel version
     elif run_parallel >= 1:
@@ -90,10 +141,14 @@ def tracksingle_driver(config):
                     config,
                 )
             results.append(result)
-        final_result = dask.compute(*results)
-        wait(final_result)
+        results = dask.compute(*results)
+        wait(results)
     else:
         sys.exit('Valid parallelization flag not provided.')
 
+    # Write link index
+    link_info = [result[1] for result in results]
+    write_link_index(link_info, linkindex_outfile)
+
     logger.info('Done with tracking sequential pairs of idfeature files')
     return
\ No newline at end of file
@@ -0,0 +1,525 @@
+import os
+import sys
+import time
+import logging
+import numpy as np
+import xarray as xr
+from netCDF4 import Dataset
+
+def read_cloudid_labels(
+    filename,
+    feature_varname,
+    nfeature_varname,
+    featuresize_varname="npix_feature",
+):
+    """
+    Read labeled feature number and number of features from a cloudid file.
+
+    Args:
+        filename: string
+            Cloudid file name.
+        feature_varname: string
+            Labeled feature number variable name.
+        nfeature_varname: string
+            Number of features variable name.
+        featuresize_varname: string, optional, default='npix_feature'
+            Feature size variable name.
+
+    Returns:
+        feature_number: np.ndarray(int)
+            Labeled feature number array, missing value set to 0.
+        nfeatures: int
+            Number of features.
+        base_time: np.ndarray
+            Epoch time of the cloudid file.
+        npix_feature: np.ndarray(int)
+            Number of pixels for each feature, counted from the labels if not in the file.
+    """
+    # Open file
+    ds = xr.open_dataset(
+        filename, mask_and_scale=False, decode_times=False, chunks=-1,
+    )
+    feature_number = ds[feature_varname].load().data
+    nfeatures = int(ds[nfeature_varname].load().data.item())
+    base_time = ds["base_time"].load().data
+    if featuresize_varname in ds:
+        npix_feature = ds[featuresize_varname].load().data
+    else:
+        npix_feature = None
+    ds.close()
+
+    # Convert float type to int, missing value to 0
+    # This should not be needed when setting mask_and_scale=False
+    feature_number[np.isnan(feature_number)] = 0
+    feature_number = feature_number.astype("int")
+
+    # Count the number of pixels for each feature if the feature size is not in the file
+    if npix_feature is None:
+        npix_feature = np.bincount(
+            feature_number[feature_number > 0].ravel(), minlength=nfeatures + 1,
+        )[1:nfeatures + 1]
+    return (
+        feature_number,
+        nfeatures,
+        base_time,
+        npix_feature,
+    )
+
+
+def link_features_overlap(
+    reference_number,
+    new_number,
+    nreference,
+    nnew,
+    nmaxlinks,
+    othresh,
+    fillval,
+    overlap_method="contingency",
+):
+    """
+    Link features in two labeled images by their spatial overlap.
+
+    Args:
+        reference_number: np.ndarray(int)
+            Labeled feature number array at the reference time (0 = no feature).
+        new_number: np.ndarray(int)
+            Labeled feature number array at the new time (0 = no feature).
+        nreference: int
+            Number of rows for the reference links (number of reference features + 1).
+        nnew: int
+            Number of rows for the new links (number of new features + 1).
+        nmaxlinks: int
+            Maximum number of features that any single feature can be linked to.
+        othresh: float
+            Overlap fraction threshold.
+        fillval: int
+            Missing value for the link arrays.
+        overlap_method: string, optional, default='contingency'
+            'contingency': count overlaps for all feature pairs in one pass.
+            'loop': loop over each feature (original method).
+
+    Returns:
+        reference_forward_index: np.ndarray(int)
+            New feature numbers linked to each reference feature, shape (1, nreference, nmaxlinks).
+        reference_forward_size: np.ndarray(int)
+            Number of pixels of the linked new features, shape (1, nreference, nmaxlinks).
+        new_backward_index: np.ndarray(int)
+            Reference feature numbers linked to each new feature, shape (1, nnew, nmaxlinks).
+        new_backward_size: np.ndarray(int)
+            Number of pixels of the linked reference features, shape (1, nnew, nmaxlinks).
+    """
+    # Number of features may be stored as a 1-element array in the cloudid file
+    nreference = int(np.asarray(nreference).item())
+    nnew = int(np.asarray(nnew).item())
+
+    if overlap_method == "contingency":
+        return link_features_contingency(
+            reference_number, new_number, nreference, nnew, nmaxlinks, othresh, fillval,
+        )
+    elif overlap_method == "loop":
+        return link_features_loop(
+            reference_number, new_number, nreference, nnew, nmaxlinks, othresh, fillval,
+        )
+    else:
+        sys.exit(f"Unknown overlap_method: {overlap_method}")
+
+
+def link_features_contingency(
+    reference_number,
+    new_number,
+    nreference,
+    nnew,
+    nmaxlinks,
+    othresh,
+    fillval,
+):
+    """
+    Link features using a sparse contingency table of pixel overlaps.
+
+    The overlap counts for all (reference, new) feature pairs are obtained from
+    a single pass over the paired label images, so the cost scales with the
+    number of pixels instead of the number of features times the number of pixels.
+    Results are identical to link_features_loop.
+
+    Args:
+        See link_features_overlap.
+
+    Returns:
+        See link_features_overlap.
+    """
+    nmaxlinks = int(nmaxlinks)
+
+    # Initialize matrices
+    reference_forward_index = np.full((1, nreference, nmaxlinks), fillval, dtype=int)
+    reference_forward_size = np.full((1, nreference, nmaxlinks), fillval, dtype=int)
+    new_backward_index = np.full((1, nnew, nmaxlinks), fillval, dtype=int)
+    new_backward_size = np.full((1, nnew, nmaxlinks), fillval, dtype=int)
+
+    reference_1d = reference_number.ravel()
+    new_1d = new_number.ravel()
+
+    # Number of pixels for each feature
+    reference_npix = np.bincount(reference_1d, minlength=nreference + 1)
+    new_npix = np.bincount(new_1d, minlength=nnew + 1)
+
+    # Contingency table: number of overlapping pixels for each feature pair
+    overlap = (reference_1d > 0) & (new_1d > 0)
+    ncol = len(new_npix)
+    pair_key = reference_1d[overlap].astype(np.int64) * ncol + new_1d[overlap]
+    pair_key, pair_npix = np.unique(pair_key, return_counts=True)
+    # Pairs are sorted by reference number, then by new number
+    pair_ref = pair_key // ncol
+    pair_new = pair_key % ncol
+
+    # Forward links: reference feature -> new features
+    ilink = np.where(
+        (pair_ref <= nreference) & (pair_npix / reference_npix[pair_ref] > othresh)
+    )[0]
+    _fill_links(
+        pair_ref[ilink], pair_new[ilink], new_npix,
+        reference_forward_index, reference_forward_size, nmaxlinks,
+        "new", "reference",
+    )
+
+    # Backward links: new feature -> reference features
+    order = np.lexsort((pair_ref, pair_new))
+    pair_ref = pair_ref[order]
+    pair_new = pair_new[order]
+    pair_npix = pair_npix[order]
+    ilink = np.where(
+        (pair_new <= nnew) & (pair_npix / new_npix[pair_new] > othresh)
+    )[0]
+    _fill_links(
+        pair_new[ilink], pair_ref[ilink], reference_npix,
+        new_backward_index, new_backward_size, nmaxlinks,
+        "reference", "new",
+    )
+
+    return (
+        reference_forward_index,
+        reference_forward_size,
+        new_backward_index,
+        new_backward_size,
+    )
+
+
+def _fill_links(
+    row_number,
+    link_number,
+    link_npix,
+    link_index,
+    link_size,
+    nmaxlinks,
+    link_name,
+    row_name,
+):
+    """
+    Put sorted (row, link) feature pairs into the link index and size arrays.
+
+    Args:
+        row_number: np.ndarray(int)
+            Feature numbers of the rows, sorted.
+        link_number: np.ndarray(int)
+            Feature numbers linked to each row, sorted within each row.
+        link_npix: np.ndarray(int)
+            Number of pixels for each linked feature number.
+        link_index: np.ndarray(int)
+            Link index array to fill, shape (1, nrows, nmaxlinks).
+        link_size: np.ndarray(int)
+            Link size array to fill, shape (1, nrows, nmaxlinks).
+        nmaxlinks: int
+            Maximum number of links.
+        link_name: string
+            Name of the linked file for the error message.
+        row_name: string
+            Name of the row file for the error message.
+
+    Returns:
+        None.
+    """
+    # Position of each link within its row
+    link_position = np.arange(len(row_number)) - np.searchsorted(row_number, row_number, side="left")
+    if np.any(link_position >= nmaxlinks):
+        sys.exit(
+            "More than "
+            + str(int(nmaxlinks))
+            + f" clouds in {link_name} file match with {row_name} cloud?!"
+        )
+    link_index[0, row_number - 1, link_position] = link_number
+    link_size[0, row_number - 1, link_position] = link_npix[link_number]
+    return
+
+
+def link_features_loop(
+    reference_number,
+    new_number,
+    nreference,
+    nnew,
+    nmaxlinks,
+    othresh,
+    fillval,
+):
+    """
+    Link features by looping over each feature in the reference and new images.
+
+    Args:
+        See link_features_overlap.
+
+    Returns:
+        See link_features_overlap.
+    """
+    #######################################################
+    # Initialize matrices
+    reference_forward_index = (
+        np.ones((1, int(nreference), int(nmaxlinks)), dtype=int) * fillval
+    )
+    reference_forward_size = (
+        np.ones((1, int(nreference), int(nmaxlinks)), dtype=int) * fillval
+    )
+    new_backward_index = (
+        np.ones((1, int(nnew), int(nmaxlinks)), dtype=int) * fillval
+    )
+    new_backward_size = np.ones((1, int(nnew), int(nmaxlinks)), dtype=int) * fillval
+
+    ######################################################
+    # Loop through each cloud / feature in reference time and look for overlaping clouds / features in the new file
+    for refindex in np.arange(1, nreference + 1):
+        # Locate where the cloud in the reference file overlaps with any cloud in the new file
+        forward_matchindices = np.where(
+            (reference_number == refindex)
+            & (new_number != 0)
+        )
+
+        # Get the convcold_cloudnumber of the clouds in the new file that overlap the cloud in the reference file
+        forward_newindex = new_number[forward_matchindices]
+        unique_forwardnewindex = np.unique(forward_newindex)
+
+        # Calculate size of reference cloud in terms of number of pixels
+        sizeref = len(
+            np.extract(
+                reference_number == refindex,
+                reference_number,
+            )
+        )
+
+        # Loop through the overlapping clouds in the new file, determining if they statisfy the overlap requirement
+        forward_nmatch = 0  # Initialize overlap counter
+        for matchindex in unique_forwardnewindex:
+            sizematch = len(
+                np.extract(forward_newindex == matchindex, forward_newindex)
+            )
+
+            if sizematch / float(sizeref) > othresh:
+                if forward_nmatch >= nmaxlinks:
+                    sys.exit(
+                        "More than "
+                        + str(int(nmaxlinks))
+                        + " clouds in new file match with reference cloud?!"
+                    )
+                else:
+                    reference_forward_index[
+                        0, int(refindex) - 1, forward_nmatch
+                    ] = matchindex
+                    reference_forward_size[
+                        0, int(refindex) - 1, forward_nmatch
+                    ] = len(
+                        np.extract(
+                            new_number == matchindex,
+                            new_number,
+                        )
+                    )
+
+                    forward_nmatch = forward_nmatch + 1
+
+    ######################################################
+    # Loop through each cloud / feature at new time and look for overlaping clouds / features in the reference file
+    for newindex in np.arange(1, nnew + 1):
+        # Locate where the cloud in the new file overlaps with any cloud in the reference file
+        backward_matchindices = np.where(
+            (new_number == newindex)
+            & (reference_number != 0)
+        )
+
+        # Get the convcold_cloudnumber of the clouds in the reference file that overlap the cloud in the new file
+        backward_refindex = reference_number[backward_matchindices]
+        unique_backwardrefindex = np.unique(backward_refindex)
+
+        # Calculate size of reference cloud in terms of number of pixels
+        sizenew = len(
+            np.extract(
+                new_number == newindex, new_number
+            )
+        )
+
+        # Loop through the overlapping clouds in the new file, determining if they statisfy the overlap requirement
+        backward_nmatch = 0  # Initialize overlap counter
+        for matchindex in unique_backwardrefindex:
+            sizematch = len(
+                np.extract(backward_refindex == matchindex, backward_refindex)
+            )
+
+            if sizematch / float(sizenew) > othresh:
+                if backward_nmatch >= nmaxlinks:
+                    sys.exit(
+                        "More than "
+                        + str(int(nmaxlinks))
+                        + " clouds in reference file match with new cloud?!"
+                    )
+                else:
+                    new_backward_index[
+                        0, int(newindex) - 1, backward_nmatch
+                    ] = matchindex
+                    new_backward_size[0, int(newindex) - 1, backward_nmatch] = len(
+                        np.extract(
+                            reference_number == matchindex,
+                            reference_number,
+                        )
+                    )
+
+                    backward_nmatch = backward_nmatch + 1
+
+    return (
+        reference_forward_index,
+        reference_forward_size,
+        new_backward_index,
+        new_backward_size,
+    )
+
+
+def write_link_index(
+    link_info,
+    index_outfile,
+):
+    """
+    Write a consolidated link index file for all single track files in a run.
+
+    The index holds the times, number of clouds, cloudid file names and
+    number of pixels for each feature needed to assign track numbers,
+    so that the cloudid files do not need to be opened again.
+
+    Args:
+        link_info: list
+            Dictionaries of link information returned by trackclouds, None for pairs not linked.
+        index_outfile: string
+            Link index output file name.
+
+    Returns:
+        index_outfile: string
+            Link index output file name, None if no pairs are linked.
+    """
+    logger = logging.getLogger(__name__)
+
+    link_info = [info for info in link_info if info is not None]
+    if len(link_info) == 0:
+        return None
+    # Sort by track file time
+    link_info = sorted(link_info, key=lambda info: info["basetime_new"])
+
+    # Unique cloudid files, features of each cloudid file are stored contiguously
+    cloudid_files = []
+    cloudid_nfeatures = []
+    npix_list = []
+    cloudid_dict = {}
+    ref_cloudid = np.zeros(len(link_info), dtype=int)
+    new_cloudid = np.zeros(len(link_info), dtype=int)
+    for itrack, info in enumerate(link_info):
+        for ftype, cloudid_index in zip(["ref", "new"], [ref_cloudid, new_cloudid]):
+            filename = info[f"{ftype}_file"]
+            if filename not in cloudid_dict:
+                cloudid_dict[filename] = len(cloudid_files)
+                cloudid_files.append(filename)
+                npix = np.asarray(info[f"npix_{ftype}"]).ravel()
+                cloudid_nfeatures.append(len(npix))
+                npix_list.append(npix)
+            cloudid_index[itrack] = cloudid_dict[filename]
+    cloudid_nfeatures = np.array(cloudid_nfeatures, dtype=int)
+    cloudid_npix_start = np.cumsum(cloudid_nfeatures) - cloudid_nfeatures
+    npix = np.concatenate(npix_list).astype(int)
+
+    varlist = {
+        "track_file": (["tracks"], np.array([os.path.basename(info["track_file"]) for info in link_info])),
+        "ref_date": (["tracks"], np.array([info["ref_date"] for info in link_info])),
+        "new_date": (["tracks"], np.array([info["new_date"] for info in link_info])),
+        "basetime_ref": (["tracks"], np.array([info["basetime_ref"] for info in link_info], dtype=np.int64)),
+        "basetime_new": (["tracks"], np.array([info["basetime_new"] for info in link_info], dtype=np.int64)),
+        "nclouds_ref": (["tracks"], np.array([info["nclouds_ref"] for info in link_info], dtype=int)),
+        "nclouds_new": (["tracks"], np.array([info["nclouds_new"] for info in link_info], dtype=int)),
+        "ref_cloudid": (["tracks"], ref_cloudid),
+        "new_cloudid": (["tracks"], new_cloudid),
+        "cloudid_file": (["cloudids"], np.array(cloudid_files)),
+        "cloudid_nfeatures": (["cloudids"], cloudid_nfeatures),
+        "cloudid_npix_start": (["cloudids"], cloudid_npix_start),
+        "npix": (["features"], npix),
+    }
+    gattrlist = {
+        "title": "Link index of single track files",
+        "Institution": "Pacific Northwest National Laboratoy",
+        "Contact": "Zhe Feng, zhe.feng@pnnl.gov",
+        "Created_on": time.ctime(time.time()),
+    }
+    output_data = xr.Dataset(varlist, attrs=gattrlist)
+    output_data["ref_cloudid"].attrs["long_name"] = "index of the reference cloudid file"
+    output_data["new_cloudid"].attrs["long_name"] = "index of the new cloudid file"
+    output_data["basetime_ref"].attrs["units"] = "seconds since 1970-01-01"
+    output_data["basetime_new"].attrs["units"] = "seconds since 1970-01-01"
+    output_data["nclouds_ref"].attrs["long_name"] = "number of cloud in reference file (number of features + 1)"
+    output_data["nclouds_new"].attrs["long_name"] = "number of cloud in new file (number of features + 1)"
+    output_data["cloudid_npix_start"].attrs["long_name"] = "start index of the cloudid file features in npix"
+    output_data["npix"].attrs["long_name"] = "number of pixels for each feature"
+
+    # Check if file already exists. If exists, delete
+    if os.path.isfile(index_outfile):
+        os.remove(index_outfile)
+    output_data.to_netcdf(path=index_outfile, mode="w", format="NETCDF4")
+    logger.info(f"Link index: {index_outfile}")
+    return index_outfile
+
+
+def read_link_index(
+    index_file,
+):
+    """
+    Read a consolidated link index file.
+
+    Args:
+        index_file: string
+            Link index file name.
+
+    Returns:
+        link_index: dictionary
+            Link information for each single track file, keyed by the track file base name.
+            Each entry has the same values as stored in the single track and cloudid files
+            (nclouds_ref, nclouds_new, basetime_ref, basetime_new, ref_file, new_file,
+            ref_date, new_date, npix_ref, npix_new).
+    """
+    ds = Dataset(index_file, "r")
+    npix = ds["npix"][:]
+    npix_start = ds["cloudid_npix_start"][:]
+    nfeatures = ds["cloudid_nfeatures"][:]
+    cloudid_file = ds["cloudid_file"][:]
+    track_file = ds["track_file"][:]
+    ref_cloudid = ds["ref_cloudid"][:]
+    new_cloudid = ds["new_cloudid"][:]
+    link_vars = {
+        varname: ds[varname][:]
+        for varname in ["basetime_ref", "basetime_new", "nclouds_ref", "nclouds_new", "ref_date", "new_date"]
+    }
+    ds.close()
+
+    link_index = {}
+    for itrack in range(len(track_file)):
+        iref = ref_cloudid[itrack]
+        inew = new_cloudid[itrack]
+        link_index[track_file[itrack]] = {
+            "basetime_ref": link_vars["basetime_ref"][itrack:itrack + 1],
+            "basetime_new": link_vars["basetime_new"][itrack:itrack + 1],
+            "nclouds_ref": int(link_vars["nclouds_ref"][itrack]),
+            "nclouds_new": int(link_vars["nclouds_new"][itrack]),
+            "ref_date": link_vars["ref_date"][itrack],
+            "new_date": link_vars["new_date"][itrack],
+            "ref_file": cloudid_file[iref],
+            "new_file": cloudid_file[inew],
+            "npix_ref": npix[npix_start[iref]:npix_start[iref] + nfeatures[iref]],
+            "npix_new": npix[npix_start[inew]:npix_start[inew] + nfeatures[inew]],
+        }
+    return link_index
@@ -3,13 +3,16 @@ import xarray as xr
 from scipy.sparse import csr_matrix
 import os
 import sys
+import shutil
 import time
 import copy
 import gc
 import logging
 import dask
-from dask.distributed import wait
-from pyflextrkr.trackstats_func import calc_stats_singlefile, adjust_mergesplit_numbers, get_track_startend_status
+from dask.distributed import as_completed, get_client
+from pyflextrkr.ft_utilities import write_stats_parquet
+from pyflextrkr.trackstats_func import calc_stats_singlefile, adjust_mergesplit_numbers, get_track_startend_status, \
+    get_trackstats_indices
 
 def trackstats_driver(config):
     """
@@ -43,11 +46,18 @@ def trackstats_driver(config):
     times_dimname = config["times_dimname"]
     remove_shorttracks = config["remove_shorttracks"]
     trackstats_dense_netcdf = config["trackstats_dense_netcdf"]
+    trackstats_spill = config.get("trackstats_spill", 0)
     fillval_f = np.nan
 
     # Set output filename
     trackstats_outfile = f"{stats_path}{trackstats_filebase}{startdate}_{enddate}.nc"
     trackstats_sparse_outfile = f"{stats_path}{trackstats_sparse_filebase}{startdate}_{enddate}.nc"
+    # Directory for on-disk buffers of the statistics variables
+    if trackstats_spill == 1:
+        spill_dir = f"{stats_path}trackstats_spill_{startdate}_{enddate}/"
+        os.makedirs(spill_dir, exist_ok=True)
+    else:
+        spill_dir = None
 
     # Load track data
     logger.debug("Loading tracknumbers data")
@@ -66,14 +76,49 @@ def trackstats_driver(config):
     trackstatus = ds["track_status"].squeeze()
     ds.close()
 
+    max_trackduration = int(max(duration_range))
+    numtracks = int(numtracks.values[0])
+
+    #########################################################################################
+    # Get the number of tracks in each file, and the sparse array indices of each track feature
+    logger.debug("Getting track indices in each file")
+    file_offsets, \
+    row_idx, \
+    col_idx, \
+    track_duration = get_trackstats_indices(tracknumbers.values, numtracks)
+
+    #########################################################################################
+    # Check data max duration against config set up
+    # Provide warning message and exit if 'duration_range' is too short
+    data_max_trackduration = np.nanmax(track_duration)
+    if data_max_trackduration > max_trackduration:
+        logger.critical(f"WARNING: Max track duration in data ({data_max_trackduration}) " +
+                        f"exceeds 'duration_range' ({duration_range}) in the config file!")
+        logger.critical(f"This would cause missing statistics in long-lived tracks!")
+        logger.critical(f"Increase 'duration_range' in the config file.")
+        logger.critical(f"Tracking will now exit.")
+        sys.exit()
+
+    # Create a dictionary with variable name as key, and output arrays as values
+    # The statistics variables are added with preallocated flat arrays when the first result arrives
+    out_dict = {
+        "track_duration": track_duration,
+    }
+    # Create a matching dictionary for variable attributes
+    out_dict_attrs = {
+        "track_duration": {
+            "long_name": "Duration of each track",
+            "units": "unitless",
+            "comments": "Multiply by time_resolution_hour to convert to physical units",
+        },
+    }
+
     #########################################################################################
     # loop over files. Calculate statistics and organize matrices by tracknumber and cloud
     logger.info(f"Total number of files to process: {nfiles}")
     logger.debug("Looping over pixel files and calculating feature statistics")
     t0_files = time.time()
 
-    results = []
-
     # Serial
     if run_parallel == 0:
         for nf in range(0, nfiles):
@@ -86,13 +131,11 @@ def trackstats_driver(config):
                 trackreset[nf, :],
                 config,
             )
-            results.append(result)
-
-        # Serial
-        final_result = results
+            collect_stats_singlefile(result, nf, file_offsets, out_dict, out_dict_attrs, spill_dir=spill_dir)
 
     # Parallel
     elif run_parallel >= 1:
+        results = []
         for nf in range(0, nfiles):
             result = dask.delayed(calc_stats_singlefile)(
                 tracknumbers[nf, :],
@@ -105,109 +148,43 @@ def trackstats_driver(config):
             )
             results.append(result)
 
-        # Trigger dask computation
-        final_result = dask.compute(*results)
-        wait(final_result)
+        # Trigger dask computation, collect each result as soon as it is done
+        client = get_client()
+        futures = client.compute(results)
+        future_index = {future.key: nf for nf, future in enumerate(futures)}
+        del results
+        for future, result in as_completed(futures, with_results=True):
+            collect_stats_singlefile(result, future_index[future.key], file_offsets,
+                                     out_dict, out_dict_attrs, spill_dir=spill_dir)
+            future.release()
+        del futures
 
     else:
         sys.exit('Valid parallelization flag not provided.')
 
-
     #########################################################################################
-    # Create arrays to store output
     logger.debug("Collecting track statistics")
-
-    max_trackduration = int(max(duration_range))
-    numtracks = int(numtracks)
-
-    # Make a variable list and get attributes from one of the returned dictionaries
-    # Loop over each return results till one that is not None
-    counter = 0
-    while counter < nfiles:
-        if final_result[counter] is not None:
-            var_names = list(final_result[counter][0].keys())
-            # Get variable attributes
-            var_attrs = final_result[counter][1]
-            break
-        counter += 1
-    # Drop variables from the list
-    var_names.remove("uniquetracknumbers")
-    var_names.remove("numtracks")
-
+    # Statistics variable list
+    var_names = [ivar for ivar in out_dict.keys() if ivar != "track_duration"]
     # Sparse array indices
     tracks_idx_varname = f"{tracks_dimname}_indices"
     times_idx_varname = f"{times_dimname}_indices"
-    # Create a dictionary with variable name as key, and output arrays as values
-    out_dict = {
-        "track_duration": np.zeros(numtracks, dtype=np.int32),
-    }
-    # Create a matching dictionary for variable attributes
-    out_dict_attrs = {
-        "track_duration": {
-            "long_name": "Duration of each track",
-            "units": "unitless",
-            "comments": "Multiply by time_resolution_hour to convert to physical units",
-        },
-    }
     # Variables that should be int type
     var_names_int = ["cloudnumber",
                      "track_status",
                      "track_interruptions",
                      "merge_tracknumbers",
                      "split_tracknumbers"]
-    # Loop over variable list to create the dictionary entry
-    for ivar in var_names:
-        out_dict[ivar] = np.array([])
-        out_dict_attrs[ivar] = var_attrs[ivar]
-
-    # Initialize row/col indices arrays
-    row_idx = np.array([])
-    col_idx = np.array([])
-
-    # Collect results
-    for nf in range(0, nfiles):
-        # Get the return results for this pixel file
-        # The result is a tuple: (out_dict, out_dict_attrs)
-        # The first entry is the dictionary containing the variables
-        iResult = final_result[nf][0]
-        if iResult is not None:
-            # unique tracknumbers in the current file
-            tracknumbertmp = iResult["uniquetracknumbers"] - 1
-            # number of tracks in the current file
-            numtrackstmp = iResult["numtracks"]
-
-            # Record the current length of the track by adding 1
-            out_dict["track_duration"][tracknumbertmp] = (
-                    out_dict["track_duration"][tracknumbertmp] + 1
-            )
 
-            # Find track lengths that are within max_trackduration
-            # Only record these to avoid array index out of bounds
-            # itracklength = out_tracklength[tracknumbertmp]
-            itracklength = out_dict["track_duration"][tracknumbertmp]
-            ridx = itracklength <= max_trackduration
-            # Loop over each variable and assign values to output dictionary
-            for ivar in var_names:
-                # Concatenate arrays for 2D variables
-                out_dict[ivar] = np.concatenate(
-                    (out_dict[ivar], iResult[ivar])
-                )
-            # row, column indices for sparse matrix
-            # row:tracks, col:times
-            row_idx = np.concatenate((row_idx, tracknumbertmp[ridx])).astype(int)
-            col_idx = np.concatenate((col_idx, itracklength[ridx] - 1)).astype(int)
-
-    #########################################################################################
-    # Check data max duration against config set up
-    # Provide warning message and exit if 'duration_range' is too short
-    data_max_trackduration = np.nanmax(out_dict["track_duration"])
-    if data_max_trackduration > max_trackduration:
-        logger.critical(f"WARNING: Max track duration in data ({data_max_trackduration}) " +
-                        f"exceeds 'duration_range' ({duration_range}) in the config file!")
-        logger.critical(f"This would cause missing statistics in long-lived tracks!")
-        logger.critical(f"Increase 'duration_range' in the config file.")
-        logger.critical(f"Tracking will now exit.")
-        sys.exit()
+    # Streaming mode: only variables needed for start/end status and merge/split are converted to sparse arrays,
+    # the other variables stay in the on-disk buffers until they are written to the output file
+    spill_dict = {}
+    if spill_dir is not None:
+        var_names_spill = [ivar for ivar in var_names if (ivar not in var_names_int) & (ivar != "base_time")]
+        for ivar in var_names_spill:
+            out_dict[ivar].flush()
+            spill_dict[ivar] = out_dict.pop(ivar)
+        var_names = [ivar for ivar in var_names if ivar not in var_names_spill]
 
     # Convert 2D variables to sparse arrays
     row_col_ind = (row_idx, col_idx)
@@ -318,6 +295,14 @@ def trackstats_driver(config):
     out_dict, out_dict_attrs = get_track_startend_status(
         out_dict, out_dict_attrs, fillval, max_trackduration)
 
+    #########################################################################################
+    # Order of the flat on-disk buffers that matches the sparse arrays of the kept tracks
+    if spill_dir is not None:
+        sparse_order = np.lexsort((col_idx, row_idx))
+        sparse_order = sparse_order[np.isin(row_idx[sparse_order], trackidx_keep)]
+    else:
+        sparse_order = None
+
     #########################################################################################
     # Prepare to write output file
     # Add tracks/times indices to output dictionary
@@ -332,19 +317,93 @@ def trackstats_driver(config):
 
     # Write dense arrays output file
     if trackstats_dense_netcdf == 1:
+        # Dense arrays need all variables in memory
+        if spill_dir is not None:
+            logger.warning("trackstats_spill=1: all variables are loaded to write the dense trackstats file.")
+            for ivar, values in spill_dict.items():
+                out_dict[ivar] = csr_matrix(
+                    (values[sparse_order].astype(np.float32), (row_out, col_out)),
+                    shape=shape_2d, dtype=np.float32,
+                )
         write_trackstats_dense(config, fillval, fillval_f,
                                max_trackduration, numtracks, out_dict, out_dict_attrs, times_dimname,
                                times_idx_varname, tracks_dimname, tracks_idx_varname, trackstats_outfile)
 
     # Write sparse arrays output file
     write_trackstats_sparse(config, numtracks, out_dict_attrs, out_dict, row_out, tracks_dimname,
-                            trackstats_sparse_outfile)
+                            trackstats_sparse_outfile, spill_dict=spill_dict, sparse_order=sparse_order)
+
+    # Write columnar Parquet tables from the sparse trackstats file
+    if config.get("stats_parquet", 0) == 1:
+        ds_sparse = xr.open_dataset(trackstats_sparse_outfile, mask_and_scale=False, decode_times=False)
+        write_stats_parquet(ds_sparse, trackstats_sparse_outfile, tracks_dimname, times_dimname, config)
+        ds_sparse.close()
+
+    # Remove the on-disk buffers
+    if spill_dir is not None:
+        del spill_dict
+        shutil.rmtree(spill_dir, ignore_errors=True)
 
     return trackstats_outfile
 
 
+def collect_stats_singlefile(result, nf, file_offsets, out_dict, out_dict_attrs, spill_dir=None):
+    """
+    Put the track statistics from a single pixel file into the flat output arrays.
+
+    The flat arrays are allocated for all files when the first result with tracks is collected.
+    If spill_dir is provided, the flat arrays are memory-mapped .npy files in that directory,
+    so the collected statistics are kept on disk instead of in memory.
+
+    Args:
+        result: tuple
+            Return results from calc_stats_singlefile: (out_dict, out_dict_attrs).
+        nf: int
+            File index.
+        file_offsets: np.array
+            Start index of each file in the flat arrays, from get_trackstats_indices.
+        out_dict: dictionary
+            Output variables dictionary. Updated in place.
+        out_dict_attrs: dictionary
+            Output variable attributes dictionary. Updated in place.
+        spill_dir: string, default=None
+            Directory for the memory-mapped flat arrays.
+
+    Returns:
+        None.
+    """
+    iResult, iResult_attrs = result
+    if iResult is None:
+        return
+
+    # Variables in the flat arrays
+    var_names = [ivar for ivar in iResult.keys() if ivar not in ["uniquetracknumbers", "numtracks"]]
+    # Allocate the flat arrays for all files
+    if var_names[0] not in out_dict:
+        for ivar in var_names:
+            dtype = np.asarray(iResult[ivar]).dtype
+            if spill_dir is None:
+                out_dict[ivar] = np.empty(file_offsets[-1], dtype=dtype)
+            else:
+                out_dict[ivar] = np.lib.format.open_memmap(
+                    f"{spill_dir}{ivar}.npy", mode="w+", dtype=dtype, shape=(file_offsets[-1],),
+                )
+            out_dict_attrs[ivar] = iResult_attrs[ivar]
+
+    # Number of tracks must match the track numbers file
+    istart, iend = file_offsets[nf], file_offsets[nf + 1]
+    if iResult["numtracks"] != (iend - istart):
+        logger = logging.getLogger(__name__)
+        logger.critical(f"Number of tracks in file index {nf} ({iResult['numtracks']}) " +
+                        f"does not match the track numbers ({iend - istart}).")
+        sys.exit("Code exits in trackstats_driver.py")
+    for ivar in var_names:
+        out_dict[ivar][istart:iend] = iResult[ivar]
+    return
+
+
 def write_trackstats_sparse(config, numtracks, out_dict_attrs, out_dict, row_out, tracks_dimname,
-                            trackstats_sparse_outfile):
+                            trackstats_sparse_outfile, spill_dict=None, sparse_order=None):
     """
     Write sparse array format track statistics to netCDF file.
 
@@ -363,6 +422,10 @@ def write_trackstats_sparse(config, numtracks, out_dict_attrs, out_dict, row_out
             Tracks dimension name.
         trackstats_sparse_outfile: string
             Output trackstats netCDF filename.
+        spill_dict: dictionary, default=None
+            Flat on-disk buffers of variables not in out_dict, appended one at a time.
+        sparse_order: np.array, default=None
+            Indices of the flat on-disk buffers in sparse array order.
 
     Returns:
         None.
@@ -418,6 +481,17 @@ def write_trackstats_sparse(config, numtracks, out_dict_attrs, out_dict, row_out
                     format='NETCDF4',
                     unlimited_dims=tracks_dimname,
                     encoding=encoding)
+
+    # Append variables from the on-disk buffers, reading one variable at a time
+    if spill_dict:
+        for key, values in spill_dict.items():
+            if key in out_dict:
+                continue
+            dsvar = xr.Dataset({
+                key: ([sparse_dimname], values[sparse_order].astype(np.float32), out_dict_attrs[key]),
+            })
+            dsvar.to_netcdf(path=trackstats_sparse_outfile, mode='a', encoding={key: comp})
+            del dsvar
     logger.info(trackstats_sparse_outfile)
     return
 
@@ -3,7 +3,7 @@ from netCDF4 import chartostring
 import xarray as xr
 import sys
 import logging
-import warnings
+from pyflextrkr.ft_utilities import load_static_field
 
 def calc_stats_singlefile(
         tracknumbers,
@@ -47,6 +47,7 @@ def calc_stats_singlefile(
     terrain_file = config.get("terrain_file", None)
     rangemask_varname = config.get("rangemask_varname", 'None')
     feature_varname = config.get("feature_varname", "feature_number")
+    static_cache_size = config.get("static_cache_size", 8)
 
     # Only process file if that file contains a track
     if np.nanmax(tracknumbers) > 0:
@@ -87,11 +88,12 @@ def calc_stats_singlefile(
             file_echotop40 = ds["echotop40"].squeeze().values / 1000.
             file_echotop50 = ds["echotop50"].squeeze().values / 1000.
 
-            # Range mask file
+            # Range mask file (cached in each worker process)
             if terrain_file is not None:
-                dster = xr.open_dataset(terrain_file, decode_cf=False, mask_and_scale=False)
-                rangemask = dster[rangemask_varname].values.astype('int8')
-                dster.close()
+                rangemask = load_static_field(
+                    terrain_file, rangemask_varname, max_entries=static_cache_size,
+                    decode_cf=False, mask_and_scale=False,
+                ).values.astype('int8')
 
         if feature_type == "tb_pf":
             file_tb = ds["tb"].squeeze().values
@@ -148,181 +150,99 @@ def calc_stats_singlefile(
             out_cold_area = np.full(numtracks, fillval_f, dtype=np.float32)
 
 
-        # Pre-sort cloudnumber to get location indices
-        fcn_gt_0 = file_corecold_cloudnumber > 0
-        corecold_cloudnumber_mask = file_corecold_cloudnumber * fcn_gt_0
-        cloudnumber1d_uniq, cloudnumber1d_counts, \
-        ast_corecoldarea, cumcounts_corecoldarea = pre_sort_cloudnumber(corecold_cloudnumber_mask)
+        # Map the unique tracknumbers in this frame to cloudnumbers
+        # (first cloud with the track number)
+        tracknumbers = np.asarray(tracknumbers)
+        trackstatus = np.asarray(trackstatus)
+        trackmerge = np.asarray(trackmerge)
+        tracksplit = np.asarray(tracksplit)
+        trackreset = np.asarray(trackreset)
+        ivalid = np.where(np.isfinite(tracknumbers) & (tracknumbers > 0))[0]
+        _, ifirst = np.unique(tracknumbers[ivalid], return_index=True)
+        cloudindex = ivalid[ifirst]
+        cloudnumber_map = cloudindex + 1
+
+        # Label images for the labeled reductions, background = 0
+        corecold_label = label_image(file_corecold_cloudnumber)
+        nlabels = max(np.max(corecold_label), np.max(cloudnumber_map))
+
+        # Corecold (cell) statistics for all clouds
+        corecold_npix = labeled_npix(corecold_label, nlabels)[cloudnumber_map]
+        iarea = np.where(corecold_npix > 0)[0]
+        icloud = cloudnumber_map[iarea]
+        out_area[iarea] = corecold_npix[iarea] * pixel_radius ** 2
+        out_meanlat[iarea] = labeled_nanmean(corecold_label, latitude, nlabels)[icloud]
+        out_meanlon[iarea] = labeled_nanmean(corecold_label, longitude, nlabels)[icloud]
+
+        # Calculate feature specific statistics
+        # Satellite Tb
+        if feature_type == "tb_pf":
+            # Cold core and cold anvil labels
+            core_label = corecold_label * (file_cloudtype == 1).ravel()
+            cold_label = corecold_label * (file_cloudtype == 2).ravel()
+            core_npix = labeled_npix(core_label, nlabels)[icloud]
+            cold_npix = labeled_npix(cold_label, nlabels)[icloud]
+            corecold_order = labeled_order(corecold_label, nlabels)
+
+            out_core_area[iarea] = core_npix * pixel_radius ** 2
+            out_cold_area[iarea] = cold_npix * pixel_radius ** 2
+            out_corecold_mintb[iarea] = labeled_nanreduce(file_tb, corecold_order, np.fmin)[icloud]
+            out_corecold_meantb[iarea] = labeled_nanmean(corecold_label, file_tb, nlabels)[icloud]
+            icore = core_npix > 0
+            out_core_meantb[iarea[icore]] = labeled_nanmean(core_label, file_tb, nlabels)[icloud[icore]]
 
+        # Radar cells
         if feature_type == "radar_cells":
-            # Pre-sort core number to get location indices
-            core_cloudnumber_mask = file_corecold_cloudnumber * file_conv_core
-            corenumber1d_uniq, corenumber1d_counts, \
-            ast_corearea, cumcounts_corearea = pre_sort_cloudnumber(core_cloudnumber_mask)
-
-            # Pre-sort dilated cell number to get location indices
-            dilated_cloudnumber_mask = ds[feature_varname].squeeze().values
-            dilatednumber1d_uniq, dilatednumber1d_counts, \
-            ast_dilatedcellarea, cumcounts_dilatedcellarea = pre_sort_cloudnumber(dilated_cloudnumber_mask)
-
-        if feature_type == "tb_pf":
-            # Pre-sort core number to get location indices
-            core_cloudnumber_mask = file_corecold_cloudnumber * (file_cloudtype == 1)
-            corenumber1d_uniq, corenumber1d_counts, \
-            ast_corearea, cumcounts_corearea = pre_sort_cloudnumber(core_cloudnumber_mask)
-
-            # Pre-sort cold anvil number to get location indices
-            cold_cloudnumber_mask = file_corecold_cloudnumber * (file_cloudtype == 2)
-            coldnumber1d_uniq, coldnumber1d_counts, \
-            ast_coldarea, cumcounts_coldarea = pre_sort_cloudnumber(cold_cloudnumber_mask)
-
-            # import matplotlib.pyplot as plt
-            # Zm = np.ma.masked_where(cold_cloudnumber_mask == 0, cold_cloudnumber_mask)
-            # import pdb;
-            # pdb.set_trace()
-            # plt.pcolormesh(Zm)
-
-
-        # Loop over unique tracknumbers
-        for itrack in range(numtracks):
-            # Map the tracknumbers in this frame to cloudnumbers
-            cloudnumber_map = np.where(tracknumbers == uniquetracknumbers[itrack])[0] + 1
-            cloudindex = cloudnumber_map - 1
-
-            # # Get the cloudmask for the current track (this is the slow method!)
-            # mask_corecold = file_corecold_cloudnumber == cloudnumber_map
-            # mask_cloud = file_cloudnumber == cloudnumber_map
-
-            # Get corecold cloud pixel location indices
-            corecold_npix, corecold_indices = get_loc_indices(
-                cloudnumber1d_uniq, cloudnumber1d_counts,
-                ast_corecoldarea, cumcounts_corecoldarea,
-                cloudnumber_map, nx, ny,
-            )
+            # Core and dilated cell labels
+            core_label = label_image(file_corecold_cloudnumber * file_conv_core)
+            dilated_label = label_image(ds[feature_varname].squeeze().values)
+            nlabels_dilated = max(np.max(dilated_label), nlabels)
+            core_npix = labeled_npix(core_label, nlabels)[icloud]
+            corecold_order = labeled_order(corecold_label, nlabels)
+
+            # Pixel x, y coordinates
+            y_2d = np.broadcast_to(y_coords.values[:, None], (ny, nx))
+            x_2d = np.broadcast_to(x_coords.values[None, :], (ny, nx))
+
+            # Core center location
+            out_core_meanlat[iarea] = labeled_nanmean(core_label, latitude, nlabels)[icloud]
+            out_core_meanlon[iarea] = labeled_nanmean(core_label, longitude, nlabels)[icloud]
+            out_core_mean_y[iarea] = labeled_nanmean(core_label, y_2d, nlabels)[icloud]
+            out_core_mean_x[iarea] = labeled_nanmean(core_label, x_2d, nlabels)[icloud]
+
+            # Cell center location (same as corecold location)
+            out_cell_meanlat[iarea] = out_meanlat[iarea]
+            out_cell_meanlon[iarea] = out_meanlon[iarea]
+            out_cell_mean_y[iarea] = labeled_nanmean(corecold_label, y_2d, nlabels)[icloud]
+            out_cell_mean_x[iarea] = labeled_nanmean(corecold_label, x_2d, nlabels)[icloud]
+
+            out_core_area[iarea] = core_npix * pixel_radius ** 2
+            out_cell_area[iarea] = corecold_npix[iarea] * pixel_radius ** 2
+
+            out_cell_max_dbz[iarea] = labeled_nanreduce(file_dbz, corecold_order, np.fmax)[icloud]
+            out_cell_maxETH10dbz[iarea] = labeled_nanreduce(file_echotop10, corecold_order, np.fmax)[icloud]
+            out_cell_maxETH20dbz[iarea] = labeled_nanreduce(file_echotop20, corecold_order, np.fmax)[icloud]
+            out_cell_maxETH30dbz[iarea] = labeled_nanreduce(file_echotop30, corecold_order, np.fmax)[icloud]
+            out_cell_maxETH40dbz[iarea] = labeled_nanreduce(file_echotop40, corecold_order, np.fmax)[icloud]
+            out_cell_maxETH50dbz[iarea] = labeled_nanreduce(file_echotop50, corecold_order, np.fmax)[icloud]
 
-            if corecold_npix > 0:
-                out_area[itrack] = corecold_npix * pixel_radius ** 2
-                corecold_lat = latitude[corecold_indices[0], corecold_indices[1]]
-                corecold_lon = longitude[corecold_indices[0], corecold_indices[1]]
-                out_meanlon[itrack] = np.nanmean(corecold_lon)
-                out_meanlat[itrack] = np.nanmean(corecold_lat)
-
-                # Calculate feature specific statistics
-                # Satellite Tb
-                if feature_type == "tb_pf":
-                    # Get cold core pixel location indices
-                    core_npix, core_indices = get_loc_indices(
-                        corenumber1d_uniq, corenumber1d_counts,
-                        ast_corearea, cumcounts_corearea,
-                        cloudnumber_map, nx, ny,
-                    )
-
-                    # Get cold anvil pixel location indices
-                    cold_npix, cold_indices = get_loc_indices(
-                        coldnumber1d_uniq, coldnumber1d_counts,
-                        ast_coldarea, cumcounts_coldarea,
-                        cloudnumber_map, nx, ny,
-                    )
-
-                    out_core_area[itrack] = core_npix * pixel_radius ** 2
-                    out_cold_area[itrack] = cold_npix * pixel_radius ** 2
-                    out_corecold_mintb[itrack] = np.nanmin(file_tb[corecold_indices[0], corecold_indices[1]])
-                    out_corecold_meantb[itrack] = np.nanmean(file_tb[corecold_indices[0], corecold_indices[1]])
-                    if core_npix > 0:
-                        out_core_meantb[itrack] = np.nanmean(file_tb[core_indices[0], core_indices[1]])
-
-                    # iy_min, iy_max = np.min(corecold_indices[0]), np.max(corecold_indices[0])
-                    # ix_min, ix_max = np.min(corecold_indices[1]), np.max(corecold_indices[1])
-                    # import pdb; pdb.set_trace()
-
-                # Calculate feature specific statistics
-                # Radar cells
-                if feature_type == "radar_cells":
-                    # Get core pixel location indices
-                    core_npix, core_indices = get_loc_indices(
-                        corenumber1d_uniq, corenumber1d_counts,
-                        ast_corearea, cumcounts_corearea,
-                        cloudnumber_map, nx, ny,
-                    )
-
-                    # Get dilated cell pixel location indices
-                    dilatedcell_npix, dilatedcell_indices = get_loc_indices(
-                        dilatednumber1d_uniq, dilatednumber1d_counts,
-                        ast_dilatedcellarea, cumcounts_dilatedcellarea,
-                        cloudnumber_map, nx, ny,
-                    )
-
-                    # Location of core
-                    core_lat = latitude[core_indices[0], core_indices[1]]
-                    core_lon = longitude[core_indices[0], core_indices[1]]
-                    core_y = y_coords[core_indices[0]]
-                    core_x = x_coords[core_indices[1]]
-
-                    # Location of cell (same as corecold location)
-                    cell_lat = corecold_lat
-                    cell_lon = corecold_lon
-                    cell_y = y_coords[corecold_indices[0]]
-                    cell_x = x_coords[corecold_indices[1]]
-
-                    # Core center location
-                    out_core_meanlat[itrack] = np.nanmean(core_lat)
-                    out_core_meanlon[itrack] = np.nanmean(core_lon)
-                    out_core_mean_y[itrack] = np.nanmean(core_y)
-                    out_core_mean_x[itrack] = np.nanmean(core_x)
-
-                    # Cell center location
-                    out_cell_meanlat[itrack] = np.nanmean(cell_lat)
-                    out_cell_meanlon[itrack] = np.nanmean(cell_lon)
-                    out_cell_mean_y[itrack] = np.nanmean(cell_y)
-                    out_cell_mean_x[itrack] = np.nanmean(cell_x)
-
-                    out_core_area[itrack] = core_npix * pixel_radius ** 2
-                    out_cell_area[itrack] = corecold_npix * pixel_radius ** 2
-
-                    out_cell_max_dbz[itrack] = np.nanmax(
-                        file_dbz[corecold_indices[0], corecold_indices[1]]
-                    )
-
-                    # Ignore "All-NaN slice encountered" error in ETH variables
-                    with warnings.catch_warnings():
-                        warnings.simplefilter("ignore", category=RuntimeWarning)
-
-                        out_cell_maxETH10dbz[itrack] = np.nanmax(
-                            file_echotop10[corecold_indices[0], corecold_indices[1]]
-                        )
-                        out_cell_maxETH20dbz[itrack] = np.nanmax(
-                            file_echotop20[corecold_indices[0], corecold_indices[1]]
-                        )
-                        out_cell_maxETH30dbz[itrack] = np.nanmax(
-                            file_echotop30[corecold_indices[0], corecold_indices[1]]
-                        )
-                        out_cell_maxETH40dbz[itrack] = np.nanmax(
-                            file_echotop40[corecold_indices[0], corecold_indices[1]]
-                        )
-                        out_cell_maxETH50dbz[itrack] = np.nanmax(
-                            file_echotop50[corecold_indices[0], corecold_indices[1]]
-                        )
-
-                    if terrain_file is not None:
-                        # The min range mask value within the dilated cell area
-                        # 1: cell completely within range mask
-                        # 0: some portion of the cell outside range mask
-                        out_cell_rangeflag[itrack] = np.min(
-                            rangemask[dilatedcell_indices[0], dilatedcell_indices[1]])
-
-            out_basetime[itrack] = file_basetime
-            out_cloudnumber[itrack] = cloudnumber_map
-            # out_cloudidfile[itrack][:] = fname
-            # out_area[itrack] = np.count_nonzero(mask_corecold) * pixel_radius ** 2
-            # out_meanlat[itrack] = np.nanmean(latitude[mask_corecold])
-            # out_meanlon[itrack] = np.nanmean(longitude[mask_corecold])
-            # out_cell_max_dbz[itrack] = np.nanmax(file_dbz[mask_corecold])
-
-            # Save track status, merge/split information
-            out_status[itrack] = trackstatus[cloudindex]
-            out_mergenumber[itrack] = trackmerge[cloudindex]
-            out_splitnumber[itrack] = tracksplit[cloudindex]
-            out_trackinterruptions[itrack] = trackreset[cloudindex]
+            if terrain_file is not None:
+                # The min range mask value within the dilated cell area
+                # 1: cell completely within range mask
+                # 0: some portion of the cell outside range mask
+                dilated_order = labeled_order(dilated_label, nlabels_dilated)
+                cell_rangeflag = labeled_nanreduce(rangemask, dilated_order, np.fmin)[icloud]
+                irange = np.isfinite(cell_rangeflag)
+                out_cell_rangeflag[iarea[irange]] = cell_rangeflag[irange]
+
+        out_basetime[:] = file_basetime.values
+        out_cloudnumber[:] = cloudnumber_map
+
+        # Save track status, merge/split information
+        out_status[:] = trackstatus[cloudindex]
+        out_mergenumber[:] = trackmerge[cloudindex]
+        out_splitnumber[:] = tracksplit[cloudindex]
+        out_trackinterruptions[:] = trackreset[cloudindex]
 
         # Track status explanation
         track_status_explanation = (
@@ -707,6 +627,107 @@ def define_extra_radar_cells(fillval, fillval_f, out_cell_area, out_cell_maxETH1
     return out_dict_attrs_extra, out_dict_extra
 
 
+def label_image(cloudnumber):
+    """
+    Convert a cloudnumber image to a flattened non-negative integer label array.
+
+    Args:
+        cloudnumber: numpy array
+            Cloudnumber 2D image array from pixel file.
+
+    Returns:
+        label1d: numpy array
+            Flattened cloudnumber, non-cloud (<= 0 or NaN) set to 0.
+    """
+    cloudnumber = np.asarray(cloudnumber).ravel()
+    return np.where(cloudnumber > 0, cloudnumber, 0).astype(np.intp)
+
+
+def labeled_npix(label1d, nlabels):
+    """
+    Count the number of pixels for each label.
+
+    Args:
+        label1d: numpy array
+            Flattened label array from label_image.
+        nlabels: int
+            Maximum label number.
+
+    Returns:
+        npix: numpy array
+            Number of pixels for label 0 to nlabels.
+    """
+    return np.bincount(label1d, minlength=nlabels + 1)
+
+
+def labeled_nanmean(label1d, values, nlabels):
+    """
+    Calculate the mean of non-NaN pixel values for each label in one pass over the image.
+
+    Args:
+        label1d: numpy array
+            Flattened label array from label_image.
+        values: numpy array
+            Pixel values, same size as the label image.
+        nlabels: int
+            Maximum label number.
+
+    Returns:
+        mean: numpy array
+            Mean value for label 0 to nlabels, NaN if the label has no valid pixels.
+    """
+    values = np.asarray(values, dtype=np.float64).ravel()
+    valid = np.isfinite(values)
+    npix = np.bincount(label1d[valid], minlength=nlabels + 1)
+    total = np.bincount(label1d[valid], weights=values[valid], minlength=nlabels + 1)
+    mean = np.full(nlabels + 1, np.nan, dtype=np.float64)
+    np.divide(total, npix, out=mean, where=npix > 0)
+    return mean
+
+
+def labeled_order(label1d, nlabels):
+    """
+    Sort pixels by label for segmented reductions.
+
+    Args:
+        label1d: numpy array
+            Flattened label array from label_image.
+        nlabels: int
+            Maximum label number.
+
+    Returns:
+        order: tuple
+            (pixel indices sorted by label, number of pixels for label 0 to nlabels).
+    """
+    return (np.argsort(label1d, kind="stable"), labeled_npix(label1d, nlabels))
+
+
+def labeled_nanreduce(values, order, func):
+    """
+    Reduce non-NaN pixel values for each label over the sorted pixel order.
+
+    Args:
+        values: numpy array
+            Pixel values, same size as the label image.
+        order: tuple
+            Sorted pixel order from labeled_order.
+        func: numpy ufunc
+            NaN-ignoring reduction function (e.g., np.fmin, np.fmax).
+
+    Returns:
+        result: numpy array
+            Reduced value for label 0 to nlabels, NaN if the label has no valid pixels.
+    """
+    pixel_order, npix = order
+    result = np.full(len(npix), np.nan, dtype=np.float64)
+    ilabel = np.where(npix > 0)[0]
+    if len(ilabel) > 0:
+        start = np.cumsum(npix)[ilabel] - npix[ilabel]
+        sorted_values = np.asarray(values, dtype=np.float64).ravel()[pixel_order]
+        result[ilabel] = func.reduceat(sorted_values, start)
+    return result
+
+
 def get_loc_indices(
         cloudnumber1d_uniq,
         cloudnumber1d_counts,
@@ -802,6 +823,57 @@ def pre_sort_cloudnumber(cloudnumber_mask):
             cumcounts_cloudarea)
 
 
+def get_trackstats_indices(
+        tracknumbers,
+        numtracks,
+):
+    """
+    Get the sparse array indices of each track feature from the track numbers of all files.
+
+    The features of each file are ordered by unique track number,
+    the same order as the uniquetracknumbers returned by calc_stats_singlefile.
+
+    Args:
+        tracknumbers: numpy array
+            Cloud track numbers, shape (nfiles, nclouds).
+        numtracks: int
+            Number of tracks.
+
+    Returns:
+        file_offsets: numpy array
+            Start index of each file in the flat feature arrays, length nfiles + 1.
+        tracks_idx: numpy array
+            Track index (track number - 1) of each feature.
+        times_idx: numpy array
+            Time index of each feature within its track.
+        track_duration: numpy array
+            Duration of each track.
+    """
+    tracknumbers = np.asarray(tracknumbers)
+    nfiles = tracknumbers.shape[0]
+    # Unique (file, track) pairs, sorted by file then by track number
+    ifile, icloud = np.where(np.isfinite(tracknumbers) & (tracknumbers > 0))
+    pair_key = ifile.astype(np.int64) * (numtracks + 1) + tracknumbers[ifile, icloud].astype(np.int64)
+    pair_key = np.unique(pair_key)
+    pair_file = pair_key // (numtracks + 1)
+    tracks_idx = (pair_key % (numtracks + 1)) - 1
+
+    # Number of features in each file
+    file_offsets = np.zeros(nfiles + 1, dtype=np.int64)
+    file_offsets[1:] = np.cumsum(np.bincount(pair_file, minlength=nfiles))
+
+    # Track duration and time index of each feature (order of appearance in the files)
+    track_duration = np.bincount(tracks_idx, minlength=numtracks).astype(np.int32)
+    order = np.argsort(tracks_idx, kind="stable")
+    track_start = np.cumsum(track_duration) - track_duration
+    times_idx = np.empty(len(tracks_idx), dtype=np.int64)
+    times_idx[order] = np.arange(len(tracks_idx)) - track_start[tracks_idx[order]]
+    return (file_offsets,
+            tracks_idx,
+            times_idx,
+            track_duration)
+
+
 def adjust_mergesplit_numbers(
         out_mergenumber,
         out_splitnumber,
@@ -923,105 +995,60 @@ def get_track_startend_status(
     out_endmerge_timeindex = np.full(numtracks, fillval, dtype=np.int32)
     out_endmerge_cloudnumber = np.full(numtracks, fillval, dtype=np.int32)
 
-    # Loop over each track
-    for itrack in range(0, numtracks):
-
-        # Make sure the track length is < max_trackduration
-        # so array access would not be out of bounds
-        if (out_tracklength[itrack] > 0) & \
-                (out_tracklength[itrack] < max_trackduration):
-
-            # Get the end basetime
-            out_endbasetime[itrack] = out_dict["base_time"][
-                itrack, out_tracklength[itrack] - 1
-            ]
-            # Get the status at the last time step of the track
-            out_endstatus[itrack] = np.copy(
-                out_dict["track_status"][itrack, out_tracklength[itrack] - 1]
-            )
-            out_endmerge_tracknumber[itrack] = np.copy(
-                out_dict["merge_tracknumbers"][
-                    itrack, out_tracklength[itrack] - 1
-                ]
+    # Make sure the track length is < max_trackduration
+    # so array access would not be out of bounds
+    itrack = np.where((out_tracklength > 0) & (out_tracklength < max_trackduration))[0]
+    iend = out_tracklength[itrack] - 1
+
+    # Get the end basetime, status and merge tracknumber at the last time step of the track
+    out_endbasetime[itrack] = csr_values(out_dict["base_time"], itrack, iend)
+    out_endstatus[itrack] = csr_values(out_dict["track_status"], itrack, iend)
+    out_endmerge_tracknumber[itrack] = csr_values(out_dict["merge_tracknumbers"], itrack, iend)
+
+    # Table of all track times to match the times of the tracks it merges with or splits from
+    basetime_table = sort_track_basetime(out_dict["base_time"], out_tracklength)
+
+    # If end merge tracknumber exists, this track ends by merge
+    imerge = itrack[out_endmerge_tracknumber[itrack] >= 0]
+    if len(imerge) > 0:
+        # Get the track number if merges with, -1 convert to track index
+        imerge_idx = (out_endmerge_tracknumber[imerge] - 1) % numtracks
+        # Find the closest time matching the time when merging occurs
+        # If the time difference is < min_dt_thresh, consider it the same
+        match_timeidx = match_track_basetime(
+            basetime_table, imerge_idx, out_endbasetime[imerge], min_dt_thresh,
+        )
+        inomatch = np.where(match_timeidx < 0)[0]
+        if len(inomatch) > 0:
+            logger.debug(
+                f"Error: track {imerge[inomatch[0]]} has no matching time in the track it merges with!"
             )
-
-            # If end merge tracknumber exists, this track ends by merge
-            if out_endmerge_tracknumber[itrack] >= 0:
-                # Get the track number if merges with, -1 convert to track index
-                imerge_idx = out_endmerge_tracknumber[itrack] - 1
-                # Get all the basetime for the track it merges with
-                ibasetime = out_dict["base_time"][
-                            imerge_idx, 0: out_tracklength[imerge_idx]
-                            ].data
-
-                # Find the closest time matching the time when merging occurs
-                # If the time difference is < min_dt_thresh, consider it the same
-                dt = np.abs(ibasetime - out_endbasetime[itrack])
-                if np.nanmin(dt) < min_dt_thresh:
-                    match_timeidx = np.nanargmin(dt)
-                    #  The time to connect to the track it merges with should be 1 time step after
-                    if ((match_timeidx + 1) >= 0) & (
-                            (match_timeidx + 1) < max_trackduration
-                    ):
-                        out_endmerge_timeindex[itrack] = match_timeidx + 1
-                        out_endmerge_cloudnumber[
-                            itrack
-                        ] = out_dict["cloudnumber"][imerge_idx, match_timeidx + 1]
-                    else:
-                        logger.debug(f"Merge time occur after track ends??")
-                else:
-                    # import pdb; pdb.set_trace()
-                    logger.debug(
-                        f"Error: track {itrack} has no matching time in the track it merges with!"
-                    )
-                    # import pdb; pdb.set_trace()
-                    sys.exit(itrack)
-
-            # If start split tracknumber exists, this track starts from a split
-            if out_startsplit_tracknumber[itrack] >= 0:
-                # Get the tracknumber it splits from, -1 to convert to track index
-                isplit_idx = out_startsplit_tracknumber[itrack] - 1
-                # Get all the basetime for the track it splits from
-                ibasetime = out_dict["base_time"][
-                            isplit_idx, 0: out_tracklength[isplit_idx]
-                            ].data
-
-                # Find the time index matching the time when splitting occurs
-                # match_timeidx = np.where(ibasetime == out_startbasetime[itrack])[0]
-
-                # Find the closest time matching the time when merging occurs
-                # If the time difference is < min_dt_thresh, consider it the same
-                dt = np.abs(ibasetime - out_startbasetime[itrack])
-                if np.nanmin(dt) < min_dt_thresh:
-                    match_timeidx = np.nanargmin(dt)
-
-                    # Modified by Zhixiao: If there is no overlap time between split and reference tracks,
-                    # we test whether the reference cell end time is a time step earlier than the split cell initiation.
-                    # We take this as a resonable split, because the referecence cell can merge with other cells
-                    # after the split moment.
-                    # if len(match_timeidx) == 0:
-                    #     # Zhixiao
-                    #     match_timeidx = np.where(ibasetime == ibasetime[len(ibasetime) - 1])[0]
-                    #     if len(match_timeidx) == 1:
-                    #         match_timeidx = match_timeidx + 1
-                    #         logger.debug(
-                    #             f"Note: Track {itrack} splits from transient parent cloud."
-                    #         )
-
-                    # if len(match_timeidx) == 1:
-                    # The time to connect to the track it splits from should be 1 time step prior
-                    if (match_timeidx - 1) >= 0:
-                        out_startsplit_timeindex[itrack] = match_timeidx - 1
-                        out_startsplit_cloudnumber[
-                            itrack
-                        ] = out_dict["cloudnumber"][isplit_idx, match_timeidx - 1]
-                    else:
-                        logger.debug(f"Split time occur before track starts??")
-                    # else:
-                    #     logger.debug(
-                    #         f"Error: track {itrack} has no matching time in the track it splits from!"
-                    #     )
-                    #     sys.exit(itrack)
+            sys.exit(imerge[inomatch[0]])
+        #  The time to connect to the track it merges with should be 1 time step after
+        ivalid = (match_timeidx + 1) < max_trackduration
+        if np.any(~ivalid):
+            logger.debug(f"Merge time occur after track ends??")
+        imerge, imerge_idx, match_timeidx = imerge[ivalid], imerge_idx[ivalid], match_timeidx[ivalid]
+        out_endmerge_timeindex[imerge] = match_timeidx + 1
+        out_endmerge_cloudnumber[imerge] = csr_values(out_dict["cloudnumber"], imerge_idx, match_timeidx + 1)
+
+    # If start split tracknumber exists, this track starts from a split
+    isplit = itrack[out_startsplit_tracknumber[itrack] >= 0]
+    if len(isplit) > 0:
+        # Get the tracknumber it splits from, -1 to convert to track index
+        isplit_idx = (out_startsplit_tracknumber[isplit] - 1) % numtracks
+        # Find the closest time matching the time when splitting occurs
+        # If the time difference is < min_dt_thresh, consider it the same
+        match_timeidx = match_track_basetime(
+            basetime_table, isplit_idx, out_startbasetime[isplit], min_dt_thresh,
+        )
+        # The time to connect to the track it splits from should be 1 time step prior
+        ivalid = (match_timeidx - 1) >= 0
+        if np.any((match_timeidx == 0)):
+            logger.debug(f"Split time occur before track starts??")
+        isplit, isplit_idx, match_timeidx = isplit[ivalid], isplit_idx[ivalid], match_timeidx[ivalid]
+        out_startsplit_timeindex[isplit] = match_timeidx - 1
+        out_startsplit_cloudnumber[isplit] = csr_values(out_dict["cloudnumber"], isplit_idx, match_timeidx - 1)
 
     # Add new variables to the dictionary
     out_dict["start_status"] = out_startstatus
@@ -1090,4 +1117,131 @@ def get_track_startend_status(
         "units": "unitless",
         "_FillValue": fillval,
     }
-    return (out_dict, out_dict_attrs)
\ No newline at end of file
+    return (out_dict, out_dict_attrs)
+
+
+def csr_values(sparse_array, rows, cols):
+    """
+    Get values from a sparse array at given row and column indices.
+
+    Args:
+        sparse_array: scipy.sparse.csr_matrix
+            Sparse array.
+        rows: numpy array
+            Row indices.
+        cols: numpy array
+            Column indices.
+
+    Returns:
+        values: numpy array
+            Values at (rows, cols), 0 for elements that are not stored.
+    """
+    if len(rows) == 0:
+        return np.array([], dtype=sparse_array.dtype)
+    return np.asarray(sparse_array[rows, cols]).ravel()
+
+
+def sort_track_basetime(base_time, tracklength):
+    """
+    Sort the base time of all tracks for matching times between tracks.
+
+    Args:
+        base_time: scipy.sparse.csr_matrix
+            Base time of each track and time.
+        tracklength: numpy array
+            Duration of each track.
+
+    Returns:
+        basetime_table: dictionary
+            Dictionary containing the track index, base time, time index and sort key of
+            each valid track time, sorted by track index and then by base time.
+    """
+    base_time = base_time.tocsr()
+    numtracks = base_time.shape[0]
+    # Track index and time index of each stored element
+    rows = np.repeat(np.arange(numtracks), np.diff(base_time.indptr))
+    cols = base_time.indices
+    values = base_time.data
+    # Time index within the track: position ordered by time index
+    order = np.lexsort((cols, rows))
+    rows, cols, values = rows[order], cols[order], values[order]
+    row_start = np.searchsorted(rows, np.arange(numtracks), side="left")
+    timeidx = np.arange(len(rows)) - row_start[rows]
+    # Only times within the track duration with valid base time
+    ivalid = (cols < tracklength[rows]) & np.isfinite(values)
+    rows, values, timeidx = rows[ivalid], values[ivalid], timeidx[ivalid]
+
+    # Sort by track index, base time, then time index
+    order = np.lexsort((timeidx, values, rows))
+    rows, values, timeidx = rows[order], values[order], timeidx[order]
+    # Integer rank of base time values, so that (track, base time) becomes a single sortable key
+    time_uniq = np.unique(values)
+    key = rows.astype(np.int64) * (len(time_uniq) + 1) + np.searchsorted(time_uniq, values)
+    # First element of each run of equal keys (same track and base time)
+    run_first = np.searchsorted(key, key, side="left")
+    basetime_table = {
+        "rows": rows,
+        "values": values,
+        "timeidx": timeidx,
+        "time_uniq": time_uniq,
+        "key": key,
+        "run_first": run_first,
+    }
+    return basetime_table
+
+
+def match_track_basetime(basetime_table, track_idx, basetime, min_dt_thresh):
+    """
+    Find the time index of the closest time in given tracks, as a single sorted join.
+
+    The result is the same as np.nanargmin(np.abs(track_basetime - basetime)) for each track,
+    where the closest time must be within min_dt_thresh.
+
+    Args:
+        basetime_table: dictionary
+            Sorted track base time table from sort_track_basetime.
+        track_idx: numpy array
+            Track index to search in.
+        basetime: numpy array
+            Base time to match for each track index.
+        min_dt_thresh: float
+            Minimum time difference [seconds] allowed to match base time.
+
+    Returns:
+        match_timeidx: numpy array
+            Matched time index, -1 if no time is within min_dt_thresh.
+    """
+    rows = basetime_table["rows"]
+    values = basetime_table["values"]
+    timeidx = basetime_table["timeidx"]
+    key = basetime_table["key"]
+    run_first = basetime_table["run_first"]
+    ntimes = len(basetime_table["time_uniq"]) + 1
+
+    match_timeidx = np.full(len(track_idx), -1, dtype=np.int64)
+    # Position of the query time in the sorted table
+    query_key = track_idx.astype(np.int64) * ntimes + np.searchsorted(basetime_table["time_uniq"], basetime)
+    ipos = np.searchsorted(key, query_key, side="left")
+
+    # Candidates on the right (first element >= query time) and left (first element of the previous run)
+    dt = np.full((2, len(track_idx)), np.inf)
+    candidate = np.zeros((2, len(track_idx)), dtype=np.int64)
+    iright = np.where(ipos < len(key))[0]
+    iright = iright[rows[ipos[iright]] == track_idx[iright]]
+    candidate[0, iright] = ipos[iright]
+    dt[0, iright] = np.abs(values[ipos[iright]] - basetime[iright])
+    ileft = np.where(ipos > 0)[0]
+    ileft = ileft[rows[ipos[ileft] - 1] == track_idx[ileft]]
+    candidate[1, ileft] = run_first[ipos[ileft] - 1]
+    dt[1, ileft] = np.abs(values[candidate[1, ileft]] - basetime[ileft])
+
+    # Closest candidate, the earlier time index if the time differences are equal
+    cand_timeidx = np.where(dt < np.inf, timeidx[candidate], np.iinfo(np.int64).max)
+    ibest = np.where(
+        (dt[1] < dt[0]) | ((dt[1] == dt[0]) & (cand_timeidx[1] < cand_timeidx[0])), 1, 0,
+    )
+    icol = np.arange(len(track_idx))
+    best_dt = dt[ibest, icol]
+    imatch = best_dt < min_dt_thresh
+    match_timeidx[imatch] = cand_timeidx[ibest, icol][imatch]
+    return match_timeidx
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+import xarray as xr
+from pyflextrkr.echotop_func import calc_cloud_boundary, echotop_heights
+
+nz, ny, nx = 30, 25, 35
+
+
+def echotop_height_columns(dbz, height, dbz_thresh, gap, min_thick):
+    """
+    Reference first layer echo-top height, looping over each column with calc_cloud_boundary.
+    """
+    echotop = np.full((ny, nx), np.nan, dtype=np.float32)
+    cmask = dbz > dbz_thresh
+    yidx, xidx = np.where(cmask.max(axis=0) == 1)
+    for il in range(0, len(xidx)):
+        idxcld = np.array(np.where(cmask[:, yidx[il], xidx[il]] == 1)[0])
+        iheight = height if height.ndim == 1 else height[:, yidx[il], xidx[il]]
+        cb, ct = calc_cloud_boundary(iheight, idxcld, gap, min_thick)
+        echotop[yidx[il], xidx[il]] = ct[0]
+    return echotop
+
+
+@pytest.mark.parametrize("gap", [0, 1, 2, 4])
+@pytest.mark.parametrize("height_ndim", [1, 3])
+def test_echotop_heights(gap, height_ndim):
+    """
+    Vectorized echo-top heights should be the same as the per-column loop.
+    """
+    rng = np.random.default_rng(gap)
+    # Layered reflectivity with random gaps and missing values
+    dbz = rng.uniform(-10, 60, (nz, ny, nx)) - np.linspace(0, 40, nz)[:, None, None]
+    dbz[rng.uniform(size=dbz.shape) < 0.2] = np.nan
+    # Columns without echoes
+    dbz[:, 0:3, :] = -20
+    dbz3d = xr.DataArray(dbz[None, :, :, :], dims=("time", "z", "lat", "lon"))
+    height = np.cumsum(rng.uniform(200, 600, nz))
+    if height_ndim == 3:
+        height = height[:, None, None] + rng.uniform(0, 100, (nz, ny, nx))
+    dbz_threshs = [0, 10, 20, 30, 40]
+
+    echotops = echotop_heights(dbz3d, height, "z", (ny, nx), dbz_threshs, gap, 0)
+    assert len(echotops) == len(dbz_threshs)
+    for dbz_thresh, echotop in zip(dbz_threshs, echotops):
+        echotop_ref = echotop_height_columns(dbz, height, dbz_thresh, gap, 0)
+        assert echotop.dtype == echotop_ref.dtype
+        np.testing.assert_array_equal(echotop, echotop_ref, err_msg=f"dbz_thresh={dbz_thresh}")
+    assert np.all(np.isnan(echotops[0][0:3, :]))
@@ -0,0 +1,101 @@
+import calendar
+import datetime
+import glob
+import os
+import numpy as np
+import pytest
+import xarray as xr
+from scipy.ndimage import label
+from pyflextrkr.tracksingle_driver import tracksingle_driver
+from pyflextrkr.gettracks import gettracknumbers
+
+ny, nx = 40, 60
+# Cloudid file hours, files between 10 and 13 hours are missing
+file_hours = list(range(0, 10)) + list(range(14, 24))
+
+
+def make_cloudid_files(tracking_path):
+    """
+    Write cloudid files with moving, merging and splitting features.
+    """
+    rng = np.random.default_rng(42)
+    nblobs = 8
+    yc = rng.uniform(5, ny - 5, nblobs)
+    xc = rng.uniform(5, nx - 5, nblobs)
+    vy = rng.uniform(-1.5, 1.5, nblobs)
+    vx = rng.uniform(-1.5, 1.5, nblobs)
+    radius = rng.uniform(2, 5, nblobs)
+    yy, xx = np.mgrid[0:ny, 0:nx]
+    for hour in file_hours:
+        file_time = datetime.datetime(2020, 1, 1, hour, 0)
+        base_time = calendar.timegm(file_time.timetuple())
+        mask = np.zeros((ny, nx), dtype=bool)
+        for iblob in range(nblobs):
+            mask |= (yy - (yc[iblob] + vy[iblob] * hour)) ** 2 + \
+                    (xx - (xc[iblob] + vx[iblob] * hour)) ** 2 < (radius[iblob] + np.sin(hour + iblob)) ** 2
+        feature_number, nfeatures = label(mask)
+        npix_feature = np.bincount(feature_number.ravel(), minlength=nfeatures + 1)[1:]
+        ds = xr.Dataset(
+            {
+                "feature_number": (["time", "lat", "lon"], feature_number[np.newaxis, :, :]),
+                "nfeatures": (["time"], [nfeatures]),
+                "npix_feature": (["features"], npix_feature),
+                "base_time": (["time"], [base_time]),
+            },
+            coords={"time": [base_time], "lat": np.arange(ny), "lon": np.arange(nx)},
+        )
+        ds.to_netcdf(f"{tracking_path}cloudid_{file_time.strftime('%Y%m%d_%H%M')}.nc")
+
+
+def make_config(tracking_path, stats_path):
+    """
+    Make a config for single track and track number steps.
+    """
+    return {
+        "tracking_outpath": tracking_path,
+        "stats_outpath": stats_path,
+        "cloudid_filebase": "cloudid_",
+        "singletrack_filebase": "track_",
+        "tracknumbers_filebase": "tracknumbers_",
+        "startdate": "20200101.0000",
+        "enddate": "20200101.2300",
+        "start_basetime": calendar.timegm(datetime.datetime(2020, 1, 1, 0, 0).timetuple()),
+        "end_basetime": calendar.timegm(datetime.datetime(2020, 1, 1, 23, 0).timetuple()),
+        "run_parallel": 0,
+        "timegap": 3.1,
+        "nmaxlinks": 10,
+        "othresh": 0.3,
+        "fillval": -9999,
+        "maxnclouds": 50,
+    }
+
+
+@pytest.mark.parametrize("use_link_index", [True, False])
+def test_gettracks_nblocks_gap(tmp_path, use_link_index):
+    """
+    Track numbers should not depend on the number of time blocks, with a time gap in the data.
+    """
+    tracking_path = f"{tmp_path}/tracking/"
+    stats_path = f"{tmp_path}/stats/"
+    (tmp_path / "tracking").mkdir()
+    (tmp_path / "stats").mkdir()
+    make_cloudid_files(tracking_path)
+    config = make_config(tracking_path, stats_path)
+    tracksingle_driver(config)
+    linkindex_files = glob.glob(f"{tracking_path}linkindex_*.nc")
+    assert len(linkindex_files) == 1
+    if not use_link_index:
+        os.remove(linkindex_files[0])
+
+    ds_list = []
+    for nblocks in range(1, 17):
+        config["gettracks_nblocks"] = nblocks
+        tracknumbers_file = gettracknumbers(config)
+        ds_list.append(xr.load_dataset(tracknumbers_file, decode_times=False))
+
+    ds_serial = ds_list[0]
+    for nblocks, ds in enumerate(ds_list, start=1):
+        for key in ds_serial.data_vars:
+            np.testing.assert_array_equal(
+                ds[key].values, ds_serial[key].values, err_msg=f"{key}, gettracks_nblocks={nblocks}",
+            )
@@ -0,0 +1,45 @@
+import numpy as np
+import xarray as xr
+from pyflextrkr.matchtbpf_driver import match_tbpf_tracks
+from pyflextrkr.mapfeature_driver import mapfeature_driver
+from pyflextrkr.movement_speed import movement_of_feature_fft
+from test_mapfeature_pfstats_sparse import make_cloudid_files, make_mcs_tbstats, make_config, ntracks
+
+
+def test_mapfeature_newvars_only_movement_speed(tmp_path):
+    """
+    Pixel files with only the track maps should keep the field used by the movement speed,
+    and give the same movement as the pixel files with all variables.
+    """
+    (tmp_path / "tracking").mkdir()
+    (tmp_path / "stats").mkdir()
+    config = make_config(tmp_path, 0)
+    config["track_field_for_speed"] = "precipitation"
+    config["track_number_for_speed"] = "pcptracknumber"
+    config["min_size_thresh_for_speed"] = 1
+    files_basetime = make_cloudid_files(config["tracking_outpath"])
+    make_mcs_tbstats(config["stats_outpath"], files_basetime)
+    match_tbpf_tracks(config)
+
+    movement = {}
+    for newvars_only in [0, 1]:
+        config["pixeltracking_newvars_only"] = newvars_only
+        config["pixeltracking_outpath"] = f"{tmp_path}/pixel_newvars{newvars_only}/"
+        mapfeature_driver(config, trackstats_filebase=config["mcspfstats_filebase"])
+        pixel_files = sorted((tmp_path / f"pixel_newvars{newvars_only}").glob("mcstrack_*.nc"))
+        movement[newvars_only] = movement_of_feature_fft((str(pixel_files[0]), str(pixel_files[1])), ntracks, config)
+
+        if newvars_only == 1:
+            ds = xr.open_dataset(pixel_files[0], decode_times=False)
+            assert "feature_number" not in ds
+            ds_cloudid = xr.open_dataset(f"{config['tracking_outpath']}{ds.attrs['cloudid_file']}", decode_times=False)
+            np.testing.assert_array_equal(ds["precipitation"].values, ds_cloudid["precipitation"].values)
+            ds.close()
+            ds_cloudid.close()
+
+    for value_all, value_new in zip(movement[0], movement[1]):
+        np.testing.assert_array_equal(value_new, value_all)
+    # Features move 1 pixel in x per file
+    x_lag = movement[1][1][np.isfinite(movement[1][1])]
+    assert len(x_lag) > 0
+    np.testing.assert_array_equal(np.abs(x_lag), 1)
@@ -0,0 +1,161 @@
+import calendar
+import datetime
+import numpy as np
+import xarray as xr
+from pyflextrkr.matchtbpf_driver import match_tbpf_tracks
+from pyflextrkr.mapfeature_driver import mapfeature_driver
+
+ntracks = 3
+ntimes = 4
+nfiles = 4
+nmaxlinks = 3
+ny, nx = 20, 30
+fillval = -9999
+
+
+def make_cloudid_files(tracking_path):
+    """
+    Write cloudid files with one rectangular feature per track.
+
+    Returns:
+        files_basetime: np.array
+            Base time of each cloudid file.
+    """
+    start_time = datetime.datetime(2020, 1, 1, 0, 0)
+    files_basetime = np.zeros(nfiles, dtype=int)
+    lat = np.arange(ny, dtype=float)
+    lon = np.arange(nx, dtype=float)
+    lon2d, lat2d = np.meshgrid(lon, lat)
+    for ifile in range(nfiles):
+        file_time = start_time + datetime.timedelta(hours=ifile)
+        files_basetime[ifile] = calendar.timegm(file_time.timetuple())
+        feature_number = np.zeros((1, ny, nx), dtype=int)
+        precipitation = np.zeros((1, ny, nx), dtype=np.float32)
+        for icloud in range(ntracks):
+            feature_number[0, 5 * icloud:5 * icloud + 4, ifile:ifile + 8] = icloud + 1
+            precipitation[0, 5 * icloud + 1:5 * icloud + 3, ifile + 2:ifile + 6] = 5.0
+        ds = xr.Dataset(
+            {
+                "feature_number": (["time", "lat", "lon"], feature_number),
+                "precipitation": (["time", "lat", "lon"], precipitation),
+                "base_time": ((), files_basetime[ifile]),
+                "latitude": (["lat", "lon"], lat2d),
+                "longitude": (["lat", "lon"], lon2d),
+            },
+            coords={"time": [files_basetime[ifile]], "lat": lat, "lon": lon},
+        )
+        ds.to_netcdf(f"{tracking_path}cloudid_{file_time.strftime('%Y%m%d_%H%M')}.nc")
+    return files_basetime
+
+
+def make_mcs_tbstats(stats_path, files_basetime):
+    """
+    Write dense MCS Tb track statistics, the last track is one time shorter than the others.
+    """
+    base_time = np.full((ntracks, ntimes), np.nan)
+    cloudnumber = np.full((ntracks, ntimes), fillval, dtype=int)
+    track_status = np.full((ntracks, ntimes), fillval, dtype=int)
+    for itrack in range(ntracks):
+        ntimes_track = ntimes - 1 if itrack == ntracks - 1 else ntimes
+        base_time[itrack, :ntimes_track] = files_basetime[:ntimes_track]
+        cloudnumber[itrack, :ntimes_track] = itrack + 1
+        track_status[itrack, :ntimes_track] = 0
+    merge_cloudnumber = np.full((ntracks, ntimes, nmaxlinks), fillval, dtype=int)
+    ds = xr.Dataset(
+        {
+            "base_time": (["tracks", "times"], base_time),
+            "cloudnumber": (["tracks", "times"], cloudnumber),
+            "track_status": (["tracks", "times"], track_status, {"comments": "0: track continues"}),
+            "merge_cloudnumber": (["tracks", "times", "mergers"], merge_cloudnumber),
+            "split_cloudnumber": (["tracks", "times", "mergers"], merge_cloudnumber.copy()),
+        },
+        coords={"tracks": np.arange(ntracks), "times": np.arange(ntimes), "mergers": np.arange(nmaxlinks)},
+    )
+    ds.to_netcdf(f"{stats_path}mcs_tracks_20200101.0000_20200101.0300.nc")
+
+
+def make_config(tmp_path, pfstats_sparse):
+    """
+    Make a config for matching PF and mapping features to pixel files.
+    """
+    tracking_path = f"{tmp_path}/tracking/"
+    stats_path = f"{tmp_path}/stats/"
+    pixel_path = f"{tmp_path}/pixel_sparse{pfstats_sparse}/"
+    return {
+        "stats_outpath": stats_path,
+        "tracking_outpath": tracking_path,
+        "pixeltracking_outpath": pixel_path,
+        "pixeltracking_filebase": "mcstrack_",
+        "cloudid_filebase": "cloudid_",
+        "mcstbstats_filebase": "mcs_tracks_",
+        "mcspfstats_filebase": f"mcs_tracks_pf_sparse{pfstats_sparse}_",
+        "startdate": "20200101.0000",
+        "enddate": "20200101.0300",
+        "start_basetime": calendar.timegm(datetime.datetime(2020, 1, 1, 0, 0).timetuple()),
+        "end_basetime": calendar.timegm(datetime.datetime(2020, 1, 1, 3, 0).timetuple()),
+        "tracks_dimname": "tracks",
+        "times_dimname": "times",
+        "pf_dimname": "nmaxpf",
+        "nmaxpf": 3,
+        "nmaxlinks": nmaxlinks,
+        "run_parallel": 0,
+        "fillval": fillval,
+        "match_pixel_dt_thresh": 60.0,
+        "pf_rr_thres": 2.0,
+        "pf_link_area_thresh": 1.0,
+        "heavy_rainrate_thresh": 10.0,
+        "pixel_radius": 1.0,
+        "pfdatasource": "test",
+        "landfrac_thresh": 0.9,
+        "feature_type": "tb_pf",
+        "pcp_thresh": 2.0,
+        "pfstats_sparse": pfstats_sparse,
+    }
+
+
+def test_mapfeature_pfstats_sparse(tmp_path):
+    """
+    Map features from a MCS PF statistics file with sparse PF variables and dense track variables.
+    The pixel files should be the same as those mapped from the dense PF statistics file.
+    """
+    config_sparse = make_config(tmp_path, 1)
+    config_dense = make_config(tmp_path, 0)
+    (tmp_path / "tracking").mkdir()
+    (tmp_path / "stats").mkdir()
+    files_basetime = make_cloudid_files(config_sparse["tracking_outpath"])
+    make_mcs_tbstats(config_sparse["stats_outpath"], files_basetime)
+
+    pixel_files = {}
+    for config in [config_dense, config_sparse]:
+        match_tbpf_tracks(config)
+        mapfeature_driver(config, trackstats_filebase=config["mcspfstats_filebase"])
+        pixel_files[config["pfstats_sparse"]] = sorted(
+            (tmp_path / f"pixel_sparse{config['pfstats_sparse']}").glob("mcstrack_*.nc")
+        )
+
+    # Check the PF variables are sparse and the track variables are dense
+    ds_pf = xr.open_dataset(
+        f"{config_sparse['stats_outpath']}{config_sparse['mcspfstats_filebase']}"
+        f"{config_sparse['startdate']}_{config_sparse['enddate']}.nc",
+        decode_times=False,
+    )
+    assert ds_pf["pf_npf"].dims == ("sparse_index",)
+    assert ds_pf["base_time"].dims == ("tracks", "times")
+    ds_pf.close()
+
+    assert len(pixel_files[1]) == nfiles
+    assert [f.name for f in pixel_files[1]] == [f.name for f in pixel_files[0]]
+    for ifile, (file_dense, file_sparse) in enumerate(zip(pixel_files[0], pixel_files[1])):
+        ds_dense = xr.open_dataset(file_dense, decode_times=False, mask_and_scale=False)
+        ds_sparse = xr.open_dataset(file_sparse, decode_times=False, mask_and_scale=False)
+        cloudtracknumber = ds_sparse["cloudtracknumber"].values
+        # Track numbers are mapped to each feature, the last track ends before the last file
+        feature_number = ds_sparse["feature_number"].values
+        expected = np.where(feature_number > 0, feature_number, 0)
+        if ifile == nfiles - 1:
+            expected[expected == ntracks] = 0
+        np.testing.assert_array_equal(cloudtracknumber, expected)
+        for key in ["cloudtracknumber", "track_status", "pcptracknumber"]:
+            np.testing.assert_array_equal(ds_sparse[key].values, ds_dense[key].values)
+        ds_dense.close()
+        ds_sparse.close()
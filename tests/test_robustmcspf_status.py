@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+from pyflextrkr import robustmcspf, robustmcspf_saag
+
+ntracks = 40
+ntimes = 24
+nmaxpf = 3
+fillval = -9999
+
+
+def random_field(rng, shape, low, high, nan_frac=0.1):
+    """
+    Random uniform values with a fraction of NaNs.
+    """
+    data = rng.uniform(low, high, shape)
+    data[rng.uniform(size=shape) < nan_frac] = np.nan
+    return data
+
+
+def random_tracks(rng):
+    """
+    Random track durations (most are shorter than ntimes) and PF major axis lengths.
+    """
+    ir_trackduration = rng.integers(1, ntimes + 1, ntracks)
+    # Long major axis with small gaps, so that there are periods of different lengths
+    pf_majoraxis = random_field(rng, (ntracks, ntimes, nmaxpf), 90, 290, nan_frac=0.05)
+    return ir_trackduration, pf_majoraxis
+
+
+def make_config(mcs_pf_gap):
+    """
+    Make a config with the PF criteria.
+    """
+    return {
+        "mcs_pf_majoraxis_thresh": 100,
+        "max_pf_majoraxis_thresh": 280,
+        "mcs_pf_durationthresh": 4,
+        "mcs_pf_gap": mcs_pf_gap,
+        "coefs_pf_area": [2000, 500],
+        "coefs_pf_rr": [2, 0.2],
+        "coefs_pf_skew": [0.5, 0.05],
+        "coefs_pf_heavyratio": [20, 1],
+        "heavy_rainrate_thresh": 10,
+        "mcs_min_rainvol_thresh": 50,
+        "mcs_volrain_durationthresh": 3,
+    }
+
+
+@pytest.mark.parametrize("mcs_pf_gap", [0, 1, 2, 5])
+@pytest.mark.parametrize("time_res", [1.0, 0.5])
+def test_get_pf_mcs_status(mcs_pf_gap, time_res):
+    """
+    Vectorized PF MCS status should be the same as the per-track loop.
+    """
+    config = make_config(mcs_pf_gap)
+    nmcs = 0
+    for seed in range(20):
+        rng = np.random.default_rng(seed)
+        ir_trackduration, pf_majoraxis = random_tracks(rng)
+        pf_area = random_field(rng, (ntracks, ntimes, nmaxpf), 0, 50000)
+        pf_rainrate = random_field(rng, (ntracks, ntimes, nmaxpf), 0, 30)
+        pf_skewness = random_field(rng, (ntracks, ntimes, nmaxpf), -1, 6)
+        pf_volrain_all = random_field(rng, (ntracks, ntimes), 0, 100)
+        pf_volrain_heavy = pf_volrain_all * rng.uniform(0, 1, (ntracks, ntimes))
+        # Tracks with all-NaN volumetric rain
+        pf_volrain_all[0:3, :] = np.nan
+        pf_volrain_heavy[0:3, :] = np.nan
+        args = (ir_trackduration, pf_majoraxis, pf_area, pf_rainrate, pf_skewness,
+                pf_volrain_all, pf_volrain_heavy, time_res, fillval, config)
+
+        pf_mcsstatus = robustmcspf.get_pf_mcs_status(*args)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pf_mcsstatus_loop = robustmcspf.get_pf_mcs_status_loop(*args)
+        np.testing.assert_array_equal(pf_mcsstatus, pf_mcsstatus_loop, err_msg=f"seed={seed}")
+        nmcs += np.count_nonzero(pf_mcsstatus == 1)
+    # The criteria should be met in some periods, mcs_pf_gap=0 splits every time into a separate period
+    assert (nmcs > 0) | (mcs_pf_gap == 0)
+
+
+@pytest.mark.parametrize("mcs_pf_gap", [0, 1, 2, 5])
+@pytest.mark.parametrize("time_res", [1.0, 0.5])
+def test_get_pf_mcs_status_saag(mcs_pf_gap, time_res):
+    """
+    Vectorized SAAG PF MCS status should be the same as the per-track loop.
+    """
+    config = make_config(mcs_pf_gap)
+    nmcs = 0
+    for seed in range(20):
+        rng = np.random.default_rng(seed)
+        ir_trackduration, pf_majoraxis = random_tracks(rng)
+        pf_maxrainrate = random_field(rng, (ntracks, ntimes), 0, 40)
+        pf_volrain_all = random_field(rng, (ntracks, ntimes), 0, 100)
+        # Tracks with all-NaN volumetric rain
+        pf_volrain_all[0:3, :] = np.nan
+        args = (ir_trackduration, pf_majoraxis, pf_maxrainrate, pf_volrain_all, time_res, fillval, config)
+
+        pf_mcsstatus = robustmcspf_saag.get_pf_mcs_status(*args)
+        pf_mcsstatus_loop = robustmcspf_saag.get_pf_mcs_status_loop(*args)
+        np.testing.assert_array_equal(pf_mcsstatus, pf_mcsstatus_loop, err_msg=f"seed={seed}")
+        nmcs += np.count_nonzero(pf_mcsstatus == 1)
+    assert (nmcs > 0) | (mcs_pf_gap == 0)
@@ -0,0 +1,33 @@
+import glob
+import numpy as np
+import xarray as xr
+from pyflextrkr.tracksingle_driver import tracksingle_driver
+from pyflextrkr.gettracks import gettracknumbers
+from test_gettracks_nblocks import make_cloudid_files, make_config
+
+
+def test_tracksingle_without_npix_feature(tmp_path):
+    """
+    Cloudid files without the feature size variable should give the same link index and track numbers,
+    with the number of pixels counted from the labels.
+    """
+    ds_link = {}
+    ds_tracknumbers = {}
+    for with_npix in [True, False]:
+        tracking_path = f"{tmp_path}/tracking_{with_npix}/"
+        stats_path = f"{tmp_path}/stats_{with_npix}/"
+        (tmp_path / f"tracking_{with_npix}").mkdir()
+        (tmp_path / f"stats_{with_npix}").mkdir()
+        make_cloudid_files(tracking_path)
+        if not with_npix:
+            for filename in glob.glob(f"{tracking_path}cloudid_*.nc"):
+                ds = xr.load_dataset(filename, decode_times=False).drop_vars("npix_feature")
+                ds.to_netcdf(filename)
+        config = make_config(tracking_path, stats_path)
+        tracksingle_driver(config)
+        ds_link[with_npix] = xr.load_dataset(glob.glob(f"{tracking_path}linkindex_*.nc")[0])
+        ds_tracknumbers[with_npix] = xr.load_dataset(gettracknumbers(config), decode_times=False)
+
+    np.testing.assert_array_equal(ds_link[False]["npix"].values, ds_link[True]["npix"].values)
+    for key in ds_tracknumbers[True].data_vars:
+        np.testing.assert_array_equal(ds_tracknumbers[False][key].values, ds_tracknumbers[True][key].values)